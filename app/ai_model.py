@@ -1,25 +1,199 @@
+import logging
+import time
 from abc import ABC, abstractmethod
 from app.prompt_generator import AbstractPromptGenerator
+from app.result_cache import ResultCache, result_cache
+from app.single_flight import single_flight
+from app.rate_limiter import get_limiter
+from app.latency_tracker import latency_tracker
+from app.metrics import record_tokens, track_upstream
+from app.usage_tracker import usage_tracker
+from app.logging_setup import get_logger, log_event, redact, text_fields
+from app.structured_output import CodingResult, code_schema
+
+logger = get_logger("model")
 
 class AIModel(ABC):
-    def __init__(self, prompter: AbstractPromptGenerator):
+    # Provider settings, overridden by each subclass. They also make up the result cache key.
+    provider = None
+    model_name = None
+    temperature = 0.5
+    max_tokens = 500
+
+    # Whether aget_structured is implemented; without it the coding personas answer in prose.
+    supports_structured = False
+    # Model used for structured (schema-constrained) answers; None uses model_name.
+    structured_model_name = None
+
+    # Completions are cached in the shared worker cache unless a caller opts out.
+    cache = result_cache
+    # Identical calls already in flight are shared instead of repeated.
+    in_flight = single_flight
+
+    def __init__(self, prompter: AbstractPromptGenerator, prompter_type: str = None):
         self.prompter = prompter
+        if getattr(prompter, "max_tokens", None):
+            self.max_tokens = prompter.max_tokens
+        # Name the usage is reported under; the registry passes the prompter_type.
+        self.prompter_type = prompter_type or (type(prompter).__name__ if prompter is not None else None)
+
+    def record_usage(self, input_tokens, output_tokens, cached_input_tokens=0):
+        usage_tracker.record(self.provider, self.prompter_type, input_tokens, output_tokens, cached_input_tokens)
+        record_tokens(self.prompter_type, self.provider, input_tokens, output_tokens, cached_input_tokens)
+
+    def log_prompts(self, system_prompt, user_prompt):
+        # Prompts carry the visit note: hashes and lengths only, bodies at DEBUG after redaction
+        log_event(logger, "prompt", provider=self.provider, prompter_type=self.prompter_type,
+                  **text_fields("system", system_prompt), **text_fields("user", user_prompt))
+        if logger.isEnabledFor(logging.DEBUG):
+            log_event(logger, "prompt_body", logging.DEBUG, provider=self.provider, prompter_type=self.prompter_type,
+                      system=redact(system_prompt), user=redact(user_prompt))
 
-    def call_model(self, text_to_run) -> str:
-        system_prompt, user_prompt = self.prompter.generate_prompt(text_to_run)
-        print (f"System Prompt :\n\n {system_prompt}, User Prompt:\n\n:{user_prompt}")
-        return self.get_summary(system_prompt, user_prompt)
+    def limiter(self, model_name: str = None):
+        """Rate limiter shared by every call to this provider model in the worker."""
+        return get_limiter(self.provider, model_name or self.model_name)
+
+    @staticmethod
+    def estimate_request_tokens(system_prompt, user_prompt, max_tokens) -> int:
+        # Rough count (4 characters per token) plus the completion budget, as providers count it against TPM
+        return (len(system_prompt) + len(user_prompt)) // 4 + max_tokens
+
+    def call_model(self, text_to_run, additional_data=None, use_cache=True) -> str:
+        system_prompt, user_prompt = self.prompter.generate_prompt(text_to_run, additional_data=additional_data)
+        self.log_prompts(system_prompt, user_prompt)
+        return self.get_cached_summary(system_prompt, user_prompt, use_cache)
     
-    def call_model_and_scrub(self, text_to_run, additional_data=None) -> str:
+    def call_model_and_scrub(self, text_to_run, additional_data=None, use_cache=True) -> str:
+        system_prompt, user_prompt = self.prompter.generate_prompt(text_to_run, additional_data=additional_data)
+        self.log_prompts(system_prompt, user_prompt)
+        return self.convert_to_ascii(self.get_cached_summary(system_prompt, user_prompt, use_cache))
+
+    # Awaitable counterparts used by the FastAPI routes so a provider call does not block the event loop.
+    async def acall_model(self, text_to_run, additional_data=None, use_cache=True) -> str:
         system_prompt, user_prompt = self.prompter.generate_prompt(text_to_run, additional_data=additional_data)
-        print (f"System Prompt :\n\n {system_prompt}, User Prompt:\n\n:{user_prompt}")
-        return self.convert_to_ascii(self.get_summary(system_prompt, user_prompt))
+        self.log_prompts(system_prompt, user_prompt)
+        return await self.aget_cached_summary(system_prompt, user_prompt, use_cache)
+
+    async def acall_model_and_scrub(self, text_to_run, additional_data=None, use_cache=True) -> str:
+        system_prompt, user_prompt = self.prompter.generate_prompt(text_to_run, additional_data=additional_data)
+        self.log_prompts(system_prompt, user_prompt)
+        return self.convert_to_ascii(await self.aget_cached_summary(system_prompt, user_prompt, use_cache))
+
+    async def acall_model_structured(self, text_to_run, additional_data=None, use_cache=True) -> CodingResult:
+        """The coding persona's answer parsed from JSON matching app.structured_output.code_schema.
+
+        ValueError when the model refuses or its answer does not match the schema; only answers
+        that parse are cached.
+        """
+        system_prompt, user_prompt = self.prompter.generate_structured_prompt(text_to_run, additional_data=additional_data)
+        self.log_prompts(system_prompt, user_prompt)
+        schema = code_schema(self.prompter.code_categories)
+        model_name = self.structured_model_name or self.model_name
+        key = ResultCache.make_key(self.provider, model_name, self.temperature, system_prompt, user_prompt)
+        categories = self.prompter.code_categories
+        if use_cache:
+            answer = await self.cache.aget(key)
+            if answer is not None:
+                return CodingResult.from_json(self.prompter_type, categories, answer)
+
+        async def generate():
+            started = time.perf_counter()
+            with track_upstream(self.prompter_type, self.provider):
+                answer = await self.aget_structured(system_prompt, user_prompt, schema)
+            latency_tracker.record(self.provider, self.prompter_type, time.perf_counter() - started)
+            coding = CodingResult.from_json(self.prompter_type, categories, answer)
+            await self.cache.aset(key, answer, self.cache_ttl())
+            return coding
+
+        return await self.in_flight.ado(key, generate, self.prompter_type)
+
+    async def astream_model_and_scrub(self, text_to_run, additional_data=None, use_cache=True):
+        """Yield the scrubbed completion chunk by chunk as the provider streams it."""
+        system_prompt, user_prompt = self.prompter.generate_prompt(text_to_run, additional_data=additional_data)
+        self.log_prompts(system_prompt, user_prompt)
+        key = self.cache_key(system_prompt, user_prompt)
+        if use_cache:
+            summary = await self.cache.aget(key)
+            if summary is not None:
+                yield self.convert_to_ascii(summary)
+                return
+
+        scrubber = StreamScrubber(self.convert_to_ascii)
+        chunks = []
+        with track_upstream(self.prompter_type, self.provider):
+            async for chunk in self.astream_summary(system_prompt, user_prompt):
+                chunks.append(chunk)
+                text = scrubber.feed(chunk)
+                if text:
+                    yield text
+        text = scrubber.flush()
+        if text:
+            yield text
+        await self.cache.aset(key, "".join(chunks), self.cache_ttl())
+
+    def cache_key(self, system_prompt, user_prompt) -> str:
+        return ResultCache.make_key(self.provider, self.model_name, self.temperature, system_prompt, user_prompt)
+
+    def cache_ttl(self):
+        return getattr(self.prompter, "cache_ttl", None)
+
+    def get_cached_summary(self, system_prompt, user_prompt, use_cache=True) -> str:
+        """get_summary behind the result cache. use_cache=False skips the lookup ("regenerate") but still refreshes the entry."""
+        key = self.cache_key(system_prompt, user_prompt)
+        if use_cache:
+            summary = self.cache.get(key)
+            if summary is not None:
+                return summary
+
+        def generate():
+            started = time.perf_counter()
+            with track_upstream(self.prompter_type, self.provider):
+                summary = self.get_summary(system_prompt, user_prompt)
+            latency_tracker.record(self.provider, self.prompter_type, time.perf_counter() - started)
+            self.cache.set(key, summary, self.cache_ttl())
+            return summary
+
+        return self.in_flight.do(key, generate, self.prompter_type)
+
+    async def aget_cached_summary(self, system_prompt, user_prompt, use_cache=True) -> str:
+        key = self.cache_key(system_prompt, user_prompt)
+        if use_cache:
+            summary = await self.cache.aget(key)
+            if summary is not None:
+                return summary
+
+        async def generate():
+            started = time.perf_counter()
+            with track_upstream(self.prompter_type, self.provider):
+                summary = await self.aget_summary(system_prompt, user_prompt)
+            latency_tracker.record(self.provider, self.prompter_type, time.perf_counter() - started)
+            await self.cache.aset(key, summary, self.cache_ttl())
+            return summary
+
+        return await self.in_flight.ado(key, generate, self.prompter_type)
 
     @abstractmethod
     def get_summary(self, system_prompt, user_prompt) -> str:
         """Abstract method to call the AI model with a specific prompt."""
         pass
 
+    @abstractmethod
+    async def aget_summary(self, system_prompt, user_prompt) -> str:
+        """Abstract method to call the AI model with a specific prompt without blocking the event loop."""
+        pass
+
+    @abstractmethod
+    async def astream_summary(self, system_prompt, user_prompt):
+        """Abstract async generator yielding the completion text as the provider streams it."""
+        yield ""
+
+    async def aget_structured(self, system_prompt, user_prompt, schema: dict) -> str:
+        """Call the AI model with the answer constrained to `schema`; returns the JSON text.
+
+        Only called for models that set supports_structured.
+        """
+        raise NotImplementedError(f"{self.provider} models do not support structured output.")
+
     # Function to convert to ASCII-friendly output (removes Markdown-like syntax)
     def convert_to_ascii(self, text):
         # Replace bold markdown (**text**) with dashes
@@ -32,4 +206,27 @@ class AIModel(ABC):
         #text = text.replace('- ', '-- ')
         
         # Return the converted text
-        return text
\ No newline at end of file
+        return text
+
+
+class StreamScrubber:
+    """Applies convert_to_ascii to a stream of chunks.
+
+    A run of '*' at the end of a chunk may continue in the next one, so it is held back
+    until the run is complete; scrubbing the pieces then gives the same text as scrubbing
+    the whole completion at once.
+    """
+
+    def __init__(self, convert):
+        self.convert = convert
+        self.pending = ""
+
+    def feed(self, chunk: str) -> str:
+        text = self.pending + chunk
+        ready = text.rstrip('*')
+        self.pending = text[len(ready):]
+        return self.convert(ready)
+
+    def flush(self) -> str:
+        text, self.pending = self.pending, ""
+        return self.convert(text)
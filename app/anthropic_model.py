@@ -1,21 +1,124 @@
+import json
 import os
-from anthropic import Anthropic
+import threading
+from anthropic import Anthropic, AsyncAnthropic
+from app import transport
 from app.ai_model import AIModel
+from app.logging_setup import get_logger, log_event
+from app.structured_output import SCHEMA_NAME
 
-# Initialize the Anthropic client
-client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+logger = get_logger(__name__)
+
+# Models that accept cache_control breakpoints, by name prefix. Others (e.g. claude-3-sonnet) answer
+# normally but cache nothing, so the breakpoints are left out for them.
+PROMPT_CACHING_MODELS = ("claude-3-5-sonnet", "claude-3-5-haiku", "claude-3-opus", "claude-3-haiku")
+
+# Initialize the Anthropic clients on first use so importing this module never needs keys or network access.
+# SDK retries are off; app.rate_limiter retries with backoff shared across the worker.
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+def get_client() -> Anthropic:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"), max_retries=0, http_client=transport.get_client())
+    return _client
+
+def get_async_client() -> AsyncAnthropic:
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                _async_client = AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"), max_retries=0,
+                                               http_client=transport.get_async_client())
+    return _async_client
 
 class AnthropicModel(AIModel):
-    def get_summary(self, system_prompt, user_prompt) -> str:
-        response = client.messages.create(
-            model="claude-3-sonnet-20240229",
-            max_tokens=500,
-            temperature=0.5,
-            system=system_prompt,
-            messages=[
-                {"role": "user", "content": user_prompt}
+    provider = "anthropic"
+    model_name = os.getenv("ANTHROPIC_MODEL") or "claude-3-sonnet-20240229"
+    prompt_caching = model_name.startswith(PROMPT_CACHING_MODELS)
+    supports_structured = True
+
+    def build_request(self, system_prompt, user_prompt) -> dict:
+        """Message arguments with the static prompt prefix marked for Anthropic prompt caching.
+
+        The cache breakpoint sits on the prompter's static user instructions, so the system
+        prompt and those instructions are cached together and only the note is new input.
+        Models without prompt caching (see PROMPT_CACHING_MODELS) get the plain messages.
+        """
+        static_prefix, note_text = ("", user_prompt)
+        if self.prompt_caching and self.prompter:
+            static_prefix, note_text = self.prompter.split_user_prompt(user_prompt)
+        if static_prefix:
+            content = [
+                {"type": "text", "text": static_prefix, "cache_control": {"type": "ephemeral"}},
+                {"type": "text", "text": note_text},
             ]
-        )
-        
+            system = [{"type": "text", "text": system_prompt}]
+        else:
+            content = [{"type": "text", "text": user_prompt}]
+            system = [{"type": "text", "text": system_prompt}]
+            if self.prompt_caching:
+                system[0]["cache_control"] = {"type": "ephemeral"}
+        return {
+            "model": self.model_name,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "system": system,
+            "messages": [
+                {"role": "user", "content": content}
+            ],
+        }
+
+    def record_response_usage(self, usage):
+        # input_tokens excludes the tokens written to or read from the prompt cache
+        cache_written = getattr(usage, "cache_creation_input_tokens", None) or 0
+        cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+        self.record_usage(usage.input_tokens + cache_written + cache_read, usage.output_tokens, cache_read)
+        if self.prompt_caching:
+            log_event(logger, "prompt_cache", model=self.model_name, prompter_type=self.prompter_type,
+                      cache_read_input_tokens=cache_read, cache_creation_input_tokens=cache_written, input_tokens=usage.input_tokens)
+
+    def get_summary(self, system_prompt, user_prompt) -> str:
+        request = self.build_request(system_prompt, user_prompt)
+        response = self.limiter().call(lambda: get_client().beta.prompt_caching.messages.create(**request),
+                                       self.estimate_request_tokens(system_prompt, user_prompt, self.max_tokens), self.prompter_type)
+        self.record_response_usage(response.usage)
+
+        summary = response.content[0].text
+        return summary
+
+    async def aget_summary(self, system_prompt, user_prompt) -> str:
+        request = self.build_request(system_prompt, user_prompt)
+        response = await self.limiter().acall(lambda: get_async_client().beta.prompt_caching.messages.create(**request),
+                                              self.estimate_request_tokens(system_prompt, user_prompt, self.max_tokens), self.prompter_type)
+        self.record_response_usage(response.usage)
+
         summary = response.content[0].text
-        return summary
\ No newline at end of file
+        return summary
+
+    async def aget_structured(self, system_prompt, user_prompt, schema: dict) -> str:
+        # The answer comes back as the input of a tool call the model is required to make
+        request = self.build_request(system_prompt, user_prompt)
+        request["tools"] = [{"name": SCHEMA_NAME, "description": "Record the codes supported by the visit note.", "input_schema": schema}]
+        request["tool_choice"] = {"type": "tool", "name": SCHEMA_NAME}
+        response = await self.limiter().acall(lambda: get_async_client().beta.prompt_caching.messages.create(**request),
+                                              self.estimate_request_tokens(system_prompt, user_prompt, self.max_tokens), self.prompter_type)
+        self.record_response_usage(response.usage)
+
+        tool_use = next((block for block in response.content if block.type == "tool_use"), None)
+        if tool_use is None:
+            raise ValueError("The model did not return the structured code list.")
+        return json.dumps(tool_use.input, ensure_ascii=False)
+
+    async def astream_summary(self, system_prompt, user_prompt):
+        # Streams hold a slot but are not retried, since part of the answer may already be relayed
+        async with self.limiter().aslot(self.estimate_request_tokens(system_prompt, user_prompt, self.max_tokens)):
+            async with get_async_client().beta.prompt_caching.messages.stream(**self.build_request(system_prompt, user_prompt)) as stream:
+                async for text in stream.text_stream:
+                    yield text
+                message = await stream.get_final_message()
+                self.record_response_usage(message.usage)
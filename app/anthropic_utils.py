@@ -1,8 +1,5 @@
-import os
-from anthropic import Anthropic
-
-# Initialize the Anthropic client
-client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+# Shared lazily created client, so importing this module makes no API calls
+from app.anthropic_model import get_client
 
 def create_prompt(patient_notes):
     system_prompt = (
@@ -25,7 +22,7 @@ def create_prompt(patient_notes):
 def summarize_patient_notes(patient_notes):
     system_prompt, user_prompt = create_prompt(patient_notes)
     
-    response = client.messages.create(
+    response = get_client().messages.create(
         model="claude-3-sonnet-20240229",
         max_tokens=500,
         temperature=0.5,
@@ -146,12 +143,13 @@ Plan:
     • Follow-up visit in 2 months for reevaluation.
 """
 
-# Call the summarization function
-summary = summarize_patient_notes(text)
-#print(summary)
+if __name__ == "__main__":
+    # Call the summarization function
+    summary = summarize_patient_notes(text)
+    #print(summary)
 
-# Convert the summary to ASCII-friendly format
-ascii_summary = convert_to_ascii(summary)
+    # Convert the summary to ASCII-friendly format
+    ascii_summary = convert_to_ascii(summary)
 
-# Output the ASCII-formatted summary
-print(ascii_summary)
\ No newline at end of file
+    # Output the ASCII-formatted summary
+    print(ascii_summary)
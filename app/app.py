@@ -3,27 +3,80 @@ from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.requests import Request
 from fastapi.staticfiles import StaticFiles
-from app.model_orchestrator import ModelOrchestrator
-from app.visit_summary import VisitSummary, visit_1, visit_3, visit_2, visit_4, sdoh_visit, diagnosis_visit_note, lab_result
-from flask import render_template
+from app.model_orchestrator import ModelOrchestrator, hedge_stats
+from app.latency_tracker import latency_tracker
+from app.model_registry import registry
+from app.result_cache import result_cache
+from app.single_flight import single_flight
+from app.rate_limiter import limiter_stats
+from app import transport
+from app.jobs import job_manager
+from app.code_extractor import extract_codes
+from app.interaction_index import interaction_index
+from app.followup_engine import aresolve_followups, followup_items
+from app.chart_state import chart_state
+from app.note_sections import section_stats
+from app.usage_tracker import usage_tracker
+from app.token_accounting import preload_encodings
+from app import metrics
+from app.logging_setup import configure_logging, get_logger, log_event, text_fields
+from app.visit_summary import VisitSummary
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from app.visit_summary import VisitSummary
-from typing import Optional
+from typing import Optional, List
+import time
+import asyncio
 from fastapi import FastAPI, Request, Form, HTTPException, Depends
 from fastapi.responses import HTMLResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 import os
+import json
+import logging
 from starlette.status import HTTP_401_UNAUTHORIZED
 import secrets
 from dotenv import load_dotenv
 from pathlib import Path
 from app.openai_model import OpenAIModel
+from app import anthropic_model, openai_model
 
 app = FastAPI()
 templates = Jinja2Templates(directory="app/templates")
 # Load environment variables from .env file
 load_dotenv()
+# JSON logs through a background writer (LOG_LEVEL, LOG_SAMPLE_RATES)
+configure_logging()
+logger = get_logger("app")
+
+# Build every prompter/model pair once per worker instead of on each request
+@app.on_event("startup")
+async def build_registry():
+    registry.load_plugins()
+    registry.build_all()
+    # tiktoken may download its encodings; load them off the event loop
+    preload_encodings(registry.model_names())
+
+# Open the provider connections before the first request (HTTP_WARMUP), and keep them open
+# through quiet spells (HTTP_KEEP_WARM_INTERVAL); neither delays startup
+@app.on_event("startup")
+async def warm_up_connections():
+    warm_up = os.getenv("HTTP_WARMUP", "0").lower() in ("1", "true", "yes")
+    interval = float(os.getenv("HTTP_KEEP_WARM_INTERVAL", "0"))
+    if not warm_up and interval <= 0:
+        return
+    base_urls = []
+    for get_client in (openai_model.get_async_client, anthropic_model.get_async_client):
+        try:
+            base_urls.append(get_client().base_url)
+        except Exception as e:
+            # e.g. no API key configured for that provider
+            log_event(logger, "warm_up_skipped", logging.WARNING, error=str(e))
+    # Keep references so the tasks are not garbage collected while running
+    app.state.transport_tasks = []
+    if warm_up:
+        app.state.transport_tasks.append(asyncio.create_task(transport.warm_up(base_urls)))
+    if interval > 0:
+        app.state.transport_tasks.append(asyncio.create_task(transport.keep_warm(base_urls, interval)))
 
 # Set up basic authentication
 security = HTTPBasic()
@@ -94,7 +147,7 @@ static_dir = Path(__file__).parent / "templates/static"
 # Define a new route to get the visit note based on the selected option
 @app.get("/get_visit_note")
 def get_visit_note(note_id: str):
-    print(f"Note ID selected..{note_id}")
+    log_event(logger, "visit_note_selected", note_id=note_id)
     visit_notes = {
         "visit_1": VisitSummary.get_visit_1(),
         "visit_2": VisitSummary.get_visit_2(),
@@ -144,16 +197,26 @@ async def get_clinical_decision_support(request: Request, credentials: HTTPBasic
 async def get_form(request: Request):
     return templates.TemplateResponse("form.html", {"request": request})
 
+# The fine-tuned follow-up model, for notes and items app.followup_engine cannot resolve
+async def ask_followup_model(prompt: str) -> str:
+    response = await OpenAIModel(None, 'followup_assistant').aget_followup(prompt)
+    return response.choices[0].message.content
+
 @app.post("/process_followup", response_class=HTMLResponse)
 async def process_followup(
     request: Request,
     visit_note: str = Form(...),
     model_type: str = Form(...)
 ):
-    print(f"Request received for note:\n\n{visit_note}")
-    openai_client = OpenAIModel(None)
-    response = openai_client.get_followup(visit_note)
-    result = response.choices[0].message.content
+    log_event(logger, "request_received", prompter_type='followup_assistant', model_type=model_type, **text_fields("note", visit_note))
+    with metrics.track_request('followup_assistant', OpenAIModel.provider):
+        if followup_items(visit_note):
+            # Due dates are computed locally; only items the engine cannot parse go to the model
+            followups = (await aresolve_followups([visit_note], ask_followup_model))[0]
+            result = json.dumps(followups, indent=2)
+        else:
+            # No Next steps / Plan section the engine recognises: the model reads the whole note
+            result = await ask_followup_model(visit_note)
     return templates.TemplateResponse("/post_visit_summary.html", {"request": request, "model_type": model_type, "visit_note": visit_note, "result": result})
 
 
@@ -163,48 +226,323 @@ async def process_clinical_decision_support(
     visit_note: str = Form(...),
     current_medications: str = Form(...),
     model_type: str = Form(...),
+    regenerate: bool = Form(False),
+    hedge: bool = Form(False),
     credentials: HTTPBasicCredentials = Depends(authenticate)
 ):
     # Initialize orchestrator for clinical decision support
-    orchestrator = ModelOrchestrator(model_type=model_type, prompter_type='clinical_decision_support')
-    print(f"Clinical decision support request received for note:\n\n{visit_note}")
-    print(f"Current medications:\n\n{current_medications}")
+    orchestrator = ModelOrchestrator.get(model_type=model_type, prompter_type='clinical_decision_support')
+    log_event(logger, "request_received", prompter_type='clinical_decision_support', model_type=model_type,
+              **text_fields("note", visit_note), **text_fields("medications", current_medications))
     
     visit_summary = VisitSummary([visit_note])
-    result = orchestrator.process_pretty_with_additional_data(visit_summary, current_medications)
-    
+    reject_oversized(orchestrator, visit_summary, current_medications)
+    context = await run_persona(orchestrator, visit_summary, current_medications, regenerate, hedge)
     return templates.TemplateResponse("clinical_decision_support.html", {
         "request": request, 
         "model_type": model_type, 
         "visit_note": visit_note, 
-        "current_medications": current_medications,
-        "result": result
+        **context
     })
 
+# Headings for the coding_bundle sections on the form
+CODING_SECTION_TITLES = {
+    'biller': "CPT Codes",
+    'diagnosis': "ICD-10 Diagnosis Codes",
+    'hcc_coder': "HCC ICD-10 Codes",
+    'sdoh_coder': "SDOH Z-Codes",
+}
+
+def reject_oversized(orchestrator: ModelOrchestrator, visit_summary: VisitSummary, additional_data=None):
+    """413 before any provider call when the prompt would not fit the model."""
+    estimate = orchestrator.estimate(visit_summary, additional_data)
+    if not estimate["fits"]:
+        raise HTTPException(status_code=413, detail=f"Input of about {estimate['input_tokens']} tokens exceeds the "
+                                                    f"{estimate['input_limit']} token limit of {estimate['model']}.")
+
+# Shared by /process, /clinical_decision_support and /jobs: runs the persona and returns the values the form renders
+async def run_persona(orchestrator: ModelOrchestrator, visit_summary: VisitSummary, additional_data=None,
+                      regenerate: bool = False, hedge: bool = False, patient_id: str = None, structured: bool = False) -> dict:
+    with metrics.track_request(orchestrator.prompter_type, orchestrator.model_type):
+        context = await orchestrator.aprocess_request(visit_summary, additional_data, use_cache=not regenerate,
+                                                      hedge=hedge, patient_id=patient_id, structured=structured)
+    if "sections" in context:
+        context["sections"] = [(CODING_SECTION_TITLES[section], text) for section, text in context["sections"].items()]
+    return context
+
 @app.post("/process", response_class=HTMLResponse)
 async def process_note(
     request: Request,
     visit_note: str = Form(...),
     prompter_type: str = Form(...),
     model_type: str = Form(...),
-    adherence_response: str = Form(None)
+    adherence_response: str = Form(None),
+    regenerate: bool = Form(False),
+    hedge: bool = Form(False),
+    patient_id: str = Form(None),
+    structured: bool = Form(False)
 ):
+    if patient_id:
+        # A stored chart summary is PHI: reading or updating one needs the Basic Auth credentials
+        authenticate(await security(request))
     # Initialize orchestrator and process based on prompter_type
-    orchestrator = ModelOrchestrator(model_type=model_type, prompter_type=prompter_type)
-    print(f"Request received for note:\n\n{visit_note}")
+    orchestrator = ModelOrchestrator.get(model_type=model_type, prompter_type=prompter_type)
+    log_event(logger, "request_received", prompter_type=prompter_type, model_type=model_type, **text_fields("note", visit_note))
     visit_summary = VisitSummary([visit_note])
-    
-    if prompter_type == 'lab_result_emailer':
-        result, email = orchestrator.process_summary_and_email(visit_summary)
-        return templates.TemplateResponse("form.html", {"request": request, "model_type": model_type, "visit_note": visit_note, "prompter_type": prompter_type, "result": result, "email": email})
-    elif prompter_type == 'medication_adherance':
-        result = orchestrator.process_pretty_with_additional_data(visit_summary, adherence_response)
-        return templates.TemplateResponse("form.html", {"request": request, "model_type": model_type, "visit_note": visit_note, "adherence_response": adherence_response, "prompter_type": prompter_type, "result": result})
-    else:
-        result = orchestrator.process_pretty(visit_summary)
-        return templates.TemplateResponse("form.html", {"request": request, "model_type": model_type, "visit_note": visit_note, "prompter_type": prompter_type, "result": result})
-
-
-@app.route('/')
-def index():
-    return render_template('form.html', visit_1=visit_1, visit_2=visit_2, visit_3=visit_3, visit_4=visit_4, sdoh_visit=sdoh_visit, diagnosis_visit_note=diagnosis_visit_note, lab_result=lab_result)
\ No newline at end of file
+    reject_oversized(orchestrator, visit_summary, adherence_response)
+    context = await run_persona(orchestrator, visit_summary, adherence_response, regenerate, hedge, patient_id, structured)
+    return templates.TemplateResponse("form.html", {"request": request, "model_type": model_type, "visit_note": visit_note, "prompter_type": prompter_type, "patient_id": patient_id, "structured": structured, **context})
+
+# ICD-10, CPT and RxNorm codes listed in the note, found locally without a provider call
+@app.post("/extract_codes")
+async def post_extract_codes(visit_note: str = Form(...)):
+    return JSONResponse(extract_codes(visit_note).to_dict())
+
+# Predicted input/output tokens and cost of a request, without calling the provider; 413 when it would not fit
+@app.post("/estimate")
+async def post_estimate(
+    visit_note: str = Form(...),
+    prompter_type: str = Form(...),
+    model_type: str = Form(...),
+    adherence_response: str = Form(None),
+    current_medications: str = Form(None),
+    components: bool = Form(True)
+):
+    try:
+        orchestrator = ModelOrchestrator.get(model_type=model_type, prompter_type=prompter_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    additional_data = current_medications if prompter_type == 'clinical_decision_support' else adherence_response
+    estimate = orchestrator.estimate(VisitSummary([visit_note]), additional_data, components=components)
+    return JSONResponse(estimate, status_code=200 if estimate["fits"] else 413)
+
+# Known interactions between the drugs in a medication list, from the local interaction index
+@app.post("/check_interactions")
+async def post_check_interactions(current_medications: str = Form(...)):
+    return JSONResponse({
+        "medications": interaction_index.normalize(current_medications),
+        "interactions": [interaction.to_dict() for interaction in interaction_index.check(current_medications)],
+    })
+
+@app.post("/visit_summary/languages")
+async def process_summary_languages(
+    visit_note: str = Form(...),
+    model_type: str = Form(...),
+    languages: List[str] = Form(...),
+    max_concurrency: int = Form(4),
+    timeout: float = Form(60.0),
+    regenerate: bool = Form(False)
+):
+    started = time.perf_counter()
+    try:
+        summaries = await ModelOrchestrator.aprocess_languages(
+            model_type, VisitSummary([visit_note]), languages,
+            max_concurrency=max_concurrency, timeout=timeout, use_cache=not regenerate
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse({
+        "model_type": model_type,
+        "summaries": summaries,
+        "elapsed": round(time.perf_counter() - started, 3),
+    })
+
+# Follow-ups with due dates for many notes at once, as JSON lists in the order of visit_notes
+@app.post("/process_followup/batch")
+async def process_followup_batch(visit_notes: List[str] = Form(...)):
+    with metrics.track_request('followup_assistant', OpenAIModel.provider):
+        followups = await aresolve_followups(visit_notes, ask_followup_model)
+    return JSONResponse({"followups": followups})
+
+# Background jobs: the same inputs as /process (plus current_medications for
+# clinical_decision_support), answered with a job id instead of holding the connection
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    request: Request,
+    visit_note: str = Form(...),
+    prompter_type: str = Form(...),
+    model_type: str = Form(...),
+    adherence_response: str = Form(None),
+    current_medications: str = Form(None),
+    regenerate: bool = Form(False),
+    hedge: bool = Form(False),
+    patient_id: str = Form(None),
+    structured: bool = Form(False)
+):
+    requires_auth = prompter_type == 'clinical_decision_support' or bool(patient_id)
+    if requires_auth:
+        # Same credentials as the /clinical_decision_support route; patient_id reads a stored chart summary
+        authenticate(await security(request))
+    try:
+        orchestrator = ModelOrchestrator.get(model_type=model_type, prompter_type=prompter_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    log_event(logger, "request_received", prompter_type=prompter_type, model_type=model_type, **text_fields("note", visit_note))
+    additional_data = current_medications if prompter_type == 'clinical_decision_support' else adherence_response
+    visit_summary = VisitSummary([visit_note])
+    reject_oversized(orchestrator, visit_summary, additional_data)
+    try:
+        job = await job_manager.submit(prompter_type, model_type,
+                                       lambda: run_persona(orchestrator, visit_summary, additional_data, regenerate, hedge, patient_id, structured),
+                                       requires_auth=requires_auth)
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Job queue is full, retry later.", headers={"Retry-After": "5"})
+    return JSONResponse({"id": job.id, "status": job.status, "url": f"/jobs/{job.id}", "events": f"/jobs/{job.id}/events"}, status_code=202)
+
+# The job, 404 when unknown; jobs that needed credentials to submit need them to be read back
+async def get_job_or_404(request: Request, job_id: str):
+    job = await job_manager.aget(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job.")
+    if job.requires_auth:
+        authenticate(await security(request))
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_job(request: Request, job_id: str):
+    return JSONResponse((await get_job_or_404(request, job_id)).to_dict())
+
+# Sends the job's status now and once more when it finishes (`done` or `error`), with
+# comment lines in between so proxies do not close the idle connection
+@app.get("/jobs/{job_id}/events")
+async def job_events(request: Request, job_id: str):
+    job = await get_job_or_404(request, job_id)
+
+    async def events():
+        current = job
+        yield sse_event("status", current.status)
+        while not current.finished:
+            current = await job_manager.wait(job_id, timeout=15)
+            if current is None:
+                yield sse_event("error", "Unknown or expired job.")
+                return
+            if not current.finished:
+                yield ": keep-alive\n\n"
+        yield sse_event("done" if current.status == "done" else "error", current.to_dict())
+
+    return sse_response(events())
+
+# Server-Sent Events helpers for the streaming routes
+def sse_event(event: str, data) -> str:
+    # JSON-encode the payload so newlines inside a chunk cannot end the event early
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_result_events(orchestrator: ModelOrchestrator, stream):
+    chunks = []
+    with metrics.track_request(orchestrator.prompter_type, orchestrator.model_type) as tracked:
+        try:
+            async for text in stream:
+                chunks.append(text)
+                yield sse_event("token", text)
+            if orchestrator.prompter_type == 'lab_result_emailer':
+                yield sse_event("email", orchestrator.generate_email("".join(chunks)))
+            yield sse_event("done", "")
+        except Exception as e:
+            log_event(logger, "stream_failed", logging.ERROR, prompter_type=orchestrator.prompter_type, model_type=orchestrator.model_type, error=str(e))
+            tracked.fail(e)
+            yield sse_event("error", str(e))
+
+# Checked before the response starts, so an unsupported persona or an oversized note is a 400/413, not an error event
+def open_stream(orchestrator: ModelOrchestrator, visit_summary: VisitSummary, additional_data, use_cache: bool, patient_id: str = None):
+    reject_oversized(orchestrator, visit_summary, additional_data)
+    try:
+        return orchestrator.astream_pretty(visit_summary, additional_data, use_cache=use_cache, patient_id=patient_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def sse_response(events) -> StreamingResponse:
+    # X-Accel-Buffering stops nginx from holding tokens back until the response completes
+    return StreamingResponse(events, media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/process/stream")
+async def stream_note(
+    request: Request,
+    visit_note: str = Form(...),
+    prompter_type: str = Form(...),
+    model_type: str = Form(...),
+    adherence_response: str = Form(None),
+    regenerate: bool = Form(False),
+    patient_id: str = Form(None)
+):
+    if patient_id:
+        # Same as /process: a stored chart summary needs the Basic Auth credentials
+        authenticate(await security(request))
+    try:
+        orchestrator = ModelOrchestrator.get(model_type=model_type, prompter_type=prompter_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    additional_data = adherence_response if prompter_type == 'medication_adherance' else None
+    chunks = open_stream(orchestrator, VisitSummary([visit_note]), additional_data, not regenerate, patient_id)
+    return sse_response(stream_result_events(orchestrator, chunks))
+
+@app.post("/clinical_decision_support/stream")
+async def stream_clinical_decision_support(
+    visit_note: str = Form(...),
+    current_medications: str = Form(...),
+    model_type: str = Form(...),
+    regenerate: bool = Form(False),
+    credentials: HTTPBasicCredentials = Depends(authenticate)
+):
+    orchestrator = ModelOrchestrator.get(model_type=model_type, prompter_type='clinical_decision_support')
+    chunks = open_stream(orchestrator, VisitSummary([visit_note]), current_medications, not regenerate)
+    interactions = [interaction.to_dict() for interaction in interaction_index.check(current_medications)]
+
+    async def events():
+        # Known interactions come from the local index, so they are sent before the first token
+        yield sse_event("interactions", interactions)
+        async for event in stream_result_events(orchestrator, chunks):
+            yield event
+
+    return sse_response(events())
+
+# Prometheus metrics aggregated across the gunicorn workers
+@app.get("/metrics")
+def get_metrics():
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
+
+# Connection reuse and handshake times per provider host for this worker
+@app.get("/transport_stats")
+def get_transport_stats():
+    return JSONResponse(transport.stats())
+
+# Job queue depth and job counts by status for this worker
+@app.get("/job_stats")
+def get_job_stats():
+    return JSONResponse(job_manager.stats())
+
+# Full, incremental and unchanged chart summaries, and the visits they did not resend
+@app.get("/chart_state_stats")
+def get_chart_state_stats():
+    return JSONResponse(chart_state.stats())
+
+# Estimated note tokens per persona before and after sending only the sections it reads
+@app.get("/section_stats")
+def get_section_stats():
+    return JSONResponse(section_stats.snapshot())
+
+# Hit/miss statistics for the completion cache of this worker
+@app.get("/cache_stats")
+def get_cache_stats():
+    return JSONResponse(result_cache.stats())
+
+# Identical provider calls shared while in flight, per persona
+@app.get("/coalescing_stats")
+def get_coalescing_stats():
+    return JSONResponse(single_flight.stats())
+
+# Adaptive concurrency, queueing and retries per provider model
+@app.get("/rate_limit_stats")
+def get_rate_limit_stats():
+    return JSONResponse(limiter_stats())
+
+# Hedge rate and hedge win rate per persona, with recent provider latencies
+@app.get("/hedge_stats")
+def get_hedge_stats():
+    return JSONResponse({"by_prompter": hedge_stats.snapshot(), "latency": latency_tracker.snapshot()})
+
+# Provider token usage per model/persona, including prompt-cache hits
+@app.get("/usage_stats")
+def get_usage_stats():
+    return JSONResponse({"totals": usage_tracker.totals(), "by_prompter": usage_tracker.snapshot()})
+
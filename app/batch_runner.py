@@ -0,0 +1,183 @@
+"""Bulk runner for notes x personas.
+
+Runs any set of prompter_types against one model_type for a JSONL file or a directory
+of notes, with a bounded number of provider calls in flight. Results are appended to a
+JSONL file as they finish; that file doubles as the checkpoint, so re-running the same
+command after a crash only processes the (note, persona) pairs that have not succeeded.
+
+Usage:
+    python -m app.batch_runner --input notes.jsonl --output results.jsonl \
+        --prompters biller,diagnosis,hcc_coder --model openai --concurrency 16
+
+Each (note, persona) pair goes through the same path as /process (ModelOrchestrator.aprocess_request),
+so rows carry the same result and extra fields (email, interactions, sections, codes) the API returns.
+With --structured the coding personas (biller, diagnosis, hcc_coder, sdoh_coder) also write
+their codes to each row as a "codes" list of {code, description, rationale, category}, so
+imports read the JSON instead of parsing the result text.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from app.logging_setup import configure_logging
+from app.model_orchestrator import ModelOrchestrator
+from app.usage_tracker import usage_tracker
+from app.visit_summary import VisitSummary
+
+
+def load_notes(path: str):
+    """Yield (note_id, note, additional_data, patient_id) from a JSONL file or a directory of text files.
+
+    JSONL lines need a "note" field and may carry "id", "additional_data" and "patient_id"
+    (incremental chart summaries); lines without an id are numbered by line. Directory entries
+    use the file name (without suffix) as id.
+    """
+    source = Path(path)
+    if source.is_dir():
+        for note_path in sorted(source.iterdir()):
+            if note_path.is_file() and not note_path.name.startswith('.'):
+                yield note_path.stem, note_path.read_text(encoding="utf-8"), None, None
+        return
+    with open(source, encoding="utf-8") as notes_file:
+        for line_number, line in enumerate(notes_file, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield str(record.get("id", line_number)), record["note"], record.get("additional_data"), record.get("patient_id")
+
+
+def load_completed(output_path: str) -> set:
+    """(note_id, prompter_type) pairs that already have a successful row in the output file."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding="utf-8") as output_file:
+        for line in output_file:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a partly written last line; that pair is simply redone.
+                continue
+            if row.get("status") == "ok":
+                completed.add((row["note_id"], row["prompter_type"]))
+    return completed
+
+
+class BatchRunner:
+    def __init__(self, model_type: str, prompter_types: list, concurrency: int = 8, use_cache: bool = True, structured: bool = False):
+        self.model_type = model_type
+        self.prompter_types = list(prompter_types)
+        self.concurrency = concurrency
+        self.use_cache = use_cache
+        self.structured = structured
+        # Fail fast on unknown personas/models before any note is read.
+        self.orchestrators = {prompter_type: ModelOrchestrator.get(model_type, prompter_type) for prompter_type in self.prompter_types}
+
+    async def arun(self, notes, output_path: str) -> dict:
+        """Process every (note, persona) pair not yet in `output_path` and return a throughput report."""
+        completed = load_completed(output_path)
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        stats = {"ok": 0, "error": 0, "skipped": 0, "input_tokens": 0, "output_tokens": 0}
+        notes_done = set()
+        started = time.perf_counter()
+
+        with open(output_path, "a", encoding="utf-8") as output_file:
+            def write_row(row):
+                output_file.write(json.dumps(row, ensure_ascii=False) + "\n")
+                output_file.flush()
+                os.fsync(output_file.fileno())
+
+            async def worker():
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        return
+                    note_id, note, additional_data, patient_id, prompter_type = item
+                    write_row(await self._process(note_id, note, additional_data, patient_id, prompter_type, stats))
+                    notes_done.add(note_id)
+
+            workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+            try:
+                for note_id, note, additional_data, patient_id in notes:
+                    for prompter_type in self.prompter_types:
+                        if (note_id, prompter_type) in completed:
+                            stats["skipped"] += 1
+                            continue
+                        await queue.put((note_id, note, additional_data, patient_id, prompter_type))
+                for _ in workers:
+                    await queue.put(None)
+                await asyncio.gather(*workers)
+            finally:
+                for task in workers:
+                    task.cancel()
+
+        elapsed = time.perf_counter() - started
+        minutes = elapsed / 60 if elapsed else 1
+        return {
+            "model_type": self.model_type,
+            "prompter_types": self.prompter_types,
+            "notes": len(notes_done),
+            "completed": stats["ok"],
+            "failed": stats["error"],
+            "skipped": stats["skipped"],
+            "elapsed_seconds": round(elapsed, 2),
+            "notes_per_minute": round(len(notes_done) / minutes, 2),
+            "input_tokens": stats["input_tokens"],
+            "output_tokens": stats["output_tokens"],
+            "tokens_per_minute": round((stats["input_tokens"] + stats["output_tokens"]) / minutes, 2),
+        }
+
+    async def _process(self, note_id, note, additional_data, patient_id, prompter_type, stats) -> dict:
+        orchestrator = self.orchestrators[prompter_type]
+        started = time.perf_counter()
+        row = {"note_id": note_id, "prompter_type": prompter_type, "model_type": self.model_type}
+        with usage_tracker.measure() as usage:
+            try:
+                context = await orchestrator.aprocess_request(VisitSummary([note]), additional_data, use_cache=self.use_cache,
+                                                              patient_id=patient_id, structured=self.structured)
+                # The inputs echoed back for the form are already in the input file
+                context.pop("adherence_response", None)
+                context.pop("current_medications", None)
+                row.update({"status": "ok", "result": context.pop("result", None), **context, "error": None})
+            except Exception as e:
+                row.update({"status": "error", "result": None, "error": str(e)})
+        stats[row["status"]] += 1
+        stats["input_tokens"] += usage["input_tokens"]
+        stats["output_tokens"] += usage["output_tokens"]
+        row.update({
+            "elapsed": round(time.perf_counter() - started, 3),
+            "input_tokens": usage["input_tokens"],
+            "output_tokens": usage["output_tokens"],
+        })
+        return row
+
+    def run(self, notes, output_path: str) -> dict:
+        return asyncio.run(self.arun(notes, output_path))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run prompters over a batch of visit notes.")
+    parser.add_argument("--input", required=True, help="JSONL file of notes or a directory of note files")
+    parser.add_argument("--output", required=True, help="JSONL file results are appended to (also the resume checkpoint)")
+    parser.add_argument("--prompters", required=True, help="Comma separated prompter_types, e.g. biller,diagnosis")
+    parser.add_argument("--model", default="openai", help="model_type: openai or anthropic")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum provider calls in flight")
+    parser.add_argument("--no-cache", action="store_true", help="Skip the completion cache")
+    parser.add_argument("--structured", action="store_true", help="Coding personas also write their codes as a JSON list")
+    args = parser.parse_args(argv)
+    # Logs go to stderr so stdout only carries the report
+    configure_logging(stream=sys.stderr)
+
+    prompter_types = [name.strip() for name in args.prompters.split(",") if name.strip()]
+    runner = BatchRunner(args.model, prompter_types, concurrency=args.concurrency, use_cache=not args.no_cache,
+                         structured=args.structured)
+    report = runner.run(load_notes(args.input), args.output)
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Per-patient rolling summaries for the chart summary personas.
+
+For each (patient, persona, model) the store keeps the latest summary and the fingerprints of the
+visit snippets it covers. When the chart comes back with new visits, only the previous
+summary and the new snippets are sent (see ModelOrchestrator.aprocess_incremental), so the
+cost of an update follows the new content instead of the length of the chart.
+
+State lives in a bounded in-memory LRU (CHART_STATE_SIZE entries) and, only when
+CHART_STATE_PATH is set, in a SQLite file readable by the service user only, shared by the
+gunicorn workers and kept across restarts.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# A chart pasted as one text is split into visits at lines such as "Visit 2: September 1, 2024",
+# "Visit Date: ..." or "Date of Visit: ...", so visits seen before keep their fingerprint
+_VISIT_START = re.compile(r"^[ \t]*(?:Visit[ \t]+\d+|Visit Date|Date of Visit)[ \t]*:", re.IGNORECASE | re.MULTILINE)
+
+
+def split_visits(text: str) -> list:
+    starts = [match.start() for match in _VISIT_START.finditer(text)]
+    if not starts:
+        return [text]
+    if text[:starts[0]].strip():
+        starts.insert(0, 0)
+    return [text[start:end] for start, end in zip(starts, starts[1:] + [len(text)])]
+
+
+def fingerprint(snippet: str) -> str:
+    # Whitespace differences from copy and paste do not make a visit new
+    return hashlib.sha256(" ".join(snippet.split()).encode("utf-8")).hexdigest()[:32]
+
+
+class ChartState:
+    __slots__ = ("summary", "fingerprints", "updated_at")
+
+    def __init__(self, summary: str, fingerprints: list, updated_at: float = None):
+        self.summary = summary
+        self.fingerprints = fingerprints
+        self.updated_at = updated_at or time.time()
+
+
+class ChartStateStore:
+    def __init__(self, path: str = None, max_entries: int = 1024):
+        self.path = path
+        self.max_entries = max_entries
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"full": 0, "incremental": 0, "unchanged": 0, "snippets_sent": 0, "snippets_skipped": 0}
+        self._db = None
+        if path:
+            # Summaries are PHI: create the file owner-only (SQLite gives its WAL files the same mode)
+            os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+            os.chmod(path, 0o600)
+            self._db = sqlite3.connect(path, timeout=5, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            # Summaries are kept per model, so one model never extends another's summary. The
+            # chart_state table held them per persona only; they are rebuilt on the next request.
+            self._db.execute("DROP TABLE IF EXISTS chart_state")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS chart_summaries (patient_id TEXT, prompter_type TEXT, model_type TEXT, "
+                "summary TEXT NOT NULL, fingerprints TEXT NOT NULL, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (patient_id, prompter_type, model_type))"
+            )
+            self._db.commit()
+
+    @classmethod
+    def from_env(cls) -> "ChartStateStore":
+        return cls(os.getenv("CHART_STATE_PATH") or None, int(os.getenv("CHART_STATE_SIZE", "1024")))
+
+    def get(self, patient_id: str, prompter_type: str, model_type: str) -> ChartState:
+        key = (patient_id, prompter_type, model_type)
+        with self._lock:
+            if self._db is not None:
+                # Another worker may have updated the chart since this one last saw it
+                row = self._db.execute(
+                    "SELECT summary, fingerprints, updated_at FROM chart_summaries "
+                    "WHERE patient_id = ? AND prompter_type = ? AND model_type = ?", key
+                ).fetchone()
+                if row is not None:
+                    self._store(key, ChartState(row[0], json.loads(row[1]), row[2]))
+            state = self._states.get(key)
+            if state is not None:
+                self._states.move_to_end(key)
+            return state
+
+    def save(self, patient_id: str, prompter_type: str, model_type: str, state: ChartState):
+        with self._lock:
+            self._store((patient_id, prompter_type, model_type), state)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO chart_summaries (patient_id, prompter_type, model_type, summary, fingerprints, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (patient_id, prompter_type, model_type, state.summary, json.dumps(state.fingerprints), state.updated_at),
+                )
+                self._db.commit()
+
+    # The SQLite reads and writes block, so the event loop goes through these
+    async def aget(self, patient_id: str, prompter_type: str, model_type: str) -> ChartState:
+        if self._db is None:
+            return self.get(patient_id, prompter_type, model_type)
+        return await asyncio.to_thread(self.get, patient_id, prompter_type, model_type)
+
+    async def asave(self, patient_id: str, prompter_type: str, model_type: str, state: ChartState):
+        if self._db is None:
+            return self.save(patient_id, prompter_type, model_type, state)
+        return await asyncio.to_thread(self.save, patient_id, prompter_type, model_type, state)
+
+    def _store(self, key, state: ChartState):
+        self._states[key] = state
+        self._states.move_to_end(key)
+        while len(self._states) > self.max_entries:
+            self._states.popitem(last=False)
+
+    def delete(self, patient_id: str):
+        with self._lock:
+            for key in [key for key in self._states if key[0] == patient_id]:
+                del self._states[key]
+            if self._db is not None:
+                self._db.execute("DELETE FROM chart_summaries WHERE patient_id = ?", (patient_id,))
+                self._db.commit()
+
+    def record(self, kind: str, sent: int, skipped: int):
+        with self._lock:
+            self._stats[kind] += 1
+            self._stats["snippets_sent"] += sent
+            self._stats["snippets_skipped"] += skipped
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        total = stats["snippets_sent"] + stats["snippets_skipped"]
+        stats["skipped_ratio"] = round(stats["snippets_skipped"] / total, 4) if total else 0.0
+        stats["entries"] = len(self._states)
+        stats["max_entries"] = self.max_entries
+        stats["path"] = self.path
+        return stats
+
+
+# Shared store for the worker, configured from CHART_STATE_PATH / CHART_STATE_SIZE.
+chart_state = ChartStateStore.from_env()
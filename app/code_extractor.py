@@ -0,0 +1,112 @@
+"""Local extraction of the ICD-10, CPT and RxNorm codes a note already documents.
+
+Many notes list their codes explicitly ("ICD-10 Codes:" / "CPT Codes:" sections, "RxNorm: 5640"
+after a medication, "(ICD-10: I10)" inline). One compiled pattern finds all of them in a single
+pass over the note, without a provider call. The coding personas use the result either as the
+answer (when the note has a code section for their code system and CODE_FAST_PATH is on) or as
+hints in the prompt.
+"""
+import os
+import re
+
+ICD10, CPT, RXNORM = "ICD-10", "CPT", "RxNorm"
+
+_ICD10_CODE = r"[A-TV-Z][0-9][0-9A-Z](?:\.[0-9A-Z]{1,4})?"
+# Category I codes are five digits; Category II and III end in F and T
+_CPT_CODE = r"[0-9]{4}[0-9FT]"
+
+# Only the line-anchored branches start with ^; RxNorm and inline ICD-10 codes are found by their
+# literal prefix and take their description from the text in front of them. Lazy scans for a
+# suffix (e.g. "[^\n]*?RxNorm") would retry at every character and are an order of magnitude slower.
+_PATTERN = re.compile(
+    r"""
+    ^[ \t]*(?:[•*-][ \t]*)?(?:
+        (?P<header>ICD-10|CPT)[ \t]+Codes?[ \t]*:[ \t]*$
+      | (?P<code>""" + _ICD10_CODE + "|" + _CPT_CODE + r""")[ \t]*:(?P<description>[^\n]*)
+    )
+    | RxNorm:[ \t]*(?P<rxnorm>[0-9]+)
+    | \(ICD-10:[ \t]*(?P<inline>""" + _ICD10_CODE + r""")\)
+    """,
+    re.MULTILINE | re.VERBOSE,
+)
+_ICD10_PATTERN = re.compile(_ICD10_CODE + r"\Z")
+
+
+def fast_path_enabled() -> bool:
+    return os.getenv("CODE_FAST_PATH", "0").lower() in ("1", "true", "yes")
+
+
+class Code:
+    __slots__ = ("system", "code", "description")
+
+    def __init__(self, system: str, code: str, description: str):
+        self.system = system
+        self.code = code
+        self.description = description
+
+    def to_dict(self) -> dict:
+        return {"system": self.system, "code": self.code, "description": self.description}
+
+
+class ExtractedCodes:
+    """Codes found in one note, in note order and without duplicates."""
+
+    def __init__(self, codes: list, documented: set):
+        self.codes = codes
+        # Code systems with their own "... Codes:" section in the note
+        self.documented = documented
+
+    def by_system(self, system: str) -> list:
+        return [code for code in self.codes if code.system == system]
+
+    def is_documented(self, system: str) -> bool:
+        return system in self.documented and any(code.system == system for code in self.codes)
+
+    def render(self, system: str) -> str:
+        """The documented codes in the bullet form the coding personas answer in."""
+        lines = [f"{system} codes documented in the visit note:"]
+        lines.extend(f"- {code.code}: {code.description}" for code in self.by_system(system))
+        return "\n".join(lines)
+
+    def hints(self, system: str) -> str:
+        codes = self.by_system(system)
+        if not codes:
+            return None
+        listed = "; ".join(f"{code.code} ({code.description})" if code.description else code.code for code in codes)
+        return f"{system} codes already documented in the note (verify them against the note before recommending): {listed}"
+
+    def to_dict(self) -> dict:
+        return {
+            "icd10": [code.to_dict() for code in self.by_system(ICD10)],
+            "cpt": [code.to_dict() for code in self.by_system(CPT)],
+            "rxnorm": [code.to_dict() for code in self.by_system(RXNORM)],
+            "documented": sorted(self.documented),
+        }
+
+
+def extract_codes(note: str) -> ExtractedCodes:
+    codes, seen, documented = [], set(), set()
+    section = None
+
+    def add(system, code, description):
+        if (system, code) not in seen:
+            seen.add((system, code))
+            codes.append(Code(system, code, description.strip(" \t•*-.(")))
+
+    def text_before(match):
+        return note[note.rfind("\n", 0, match.start()) + 1:match.start()]
+
+    for match in _PATTERN.finditer(note):
+        if match.group("header"):
+            section = ICD10 if match.group("header") == "ICD-10" else CPT
+        elif match.group("code"):
+            code = match.group("code")
+            system = ICD10 if _ICD10_PATTERN.match(code) else CPT
+            add(system, code, match.group("description"))
+            if system == section:
+                documented.add(system)
+        elif match.group("inline"):
+            add(ICD10, match.group("inline"), text_before(match))
+        else:
+            add(RXNORM, match.group("rxnorm"), text_before(match))
+    return ExtractedCodes(codes, documented)
@@ -0,0 +1,242 @@
+"""Local follow-up extraction and due-date resolution.
+
+Finds the visit date and the items of the "Next steps" (or Plan / Follow-up) section of a note
+and turns relative time frames ("in 1 year and 3 months", "in 90 days", "in a quarter",
+"annually") into mm/dd/yyyy due dates. A time frame counts only when it follows "in", "within",
+"after" or a follow-up word, so advice such as "take a day off work" gets no due date. The result has the shape /process_followup returns:
+[{"followup_details": ..., "due_date": ...}], with "n/a" for items without a time frame.
+
+Items whose time frame cannot be parsed (ranges, month names, "end of", no visit date) are
+marked unresolved; aresolve_followups() sends only those items to the model.
+"""
+import asyncio
+import calendar
+import json
+import logging
+import re
+from datetime import date, timedelta
+from app.logging_setup import get_logger, log_event
+
+logger = get_logger("followup")
+
+NO_DUE_DATE = "n/a"
+
+_MONTHS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+_MONTHS.update({name.lower(): number for number, name in enumerate(calendar.month_abbr) if name})
+_MONTHS["sept"] = 9
+_MONTH_NAMES = "|".join(sorted(_MONTHS, key=len, reverse=True))
+
+_DATE = (
+    r"(?:(?P<us_month>\d{1,2})/(?P<us_day>\d{1,2})/(?P<us_year>\d{4})"
+    r"|(?P<iso_year>\d{4})-(?P<iso_month>\d{2})-(?P<iso_day>\d{2})"
+    r"|(?P<month_name>" + _MONTH_NAMES + r")\.?[ \t]+(?P<day>\d{1,2})(?:st|nd|rd|th)?,?[ \t]+(?P<year>\d{4}))"
+)
+# Notes are scanned line by line once; these are matched at the start of a stripped line.
+# "Visit Date: October 15, 2024", "Date of Visit: 01/01/2024", "Visit 2: September 1, 2024"
+_VISIT_DATE = re.compile(r"(?:Date of Visit|Visit Date|Visit[ \t]+\d+|Date)[ \t]*:[ \t]*" + _DATE, re.IGNORECASE)
+_SECTION = re.compile(r"(?:[•*-][ \t]*)?(?P<name>Next[ \t]+steps|Plan|Follow[- ]?ups?(?:[ \t]+plan)?)[ \t]*:?\Z", re.IGNORECASE)
+_ITEM = re.compile(r"(?:[•*-]|\d+[.)])[ \t]*(?P<text>\S.*)")
+
+_NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+    "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "eighteen": 18, "twenty-four": 24, "couple of": 2,
+}
+# Unit -> (months, days)
+_UNITS = {"day": (0, 1), "week": (0, 7), "fortnight": (0, 14), "month": (1, 0), "quarter": (3, 0), "year": (12, 0)}
+_NUMBER = r"\d+|" + "|".join(sorted(map(re.escape, _NUMBER_WORDS), key=len, reverse=True))
+_INTERVAL = re.compile(r"\b(?P<number>" + _NUMBER + r")[ \t-]*(?P<unit>day|week|fortnight|month|quarter|year)s?\b", re.IGNORECASE)
+# A time frame only counts when it follows "in"/"within"/"after" ("return in 2 weeks", "labs within 90 days")
+# or a follow-up word ("follow-up 3 months", "RTC: 6 weeks"); "take a day off work" is not a follow-up
+_ATTACHED = re.compile(
+    r"(?:\b(?:in|within|after)|\b(?:follow[- ]?up|f/u|return|recheck|rtc|revisit|appointment))"
+    r"[ \t:,-]*(?:(?:about|approximately|the next)[ \t]+)?\Z",
+    re.IGNORECASE,
+)
+_FREQUENCIES = [
+    (re.compile(r"\b(?:semi-?annual(?:ly)?|bi-?annual(?:ly)?|twice a year)\b", re.IGNORECASE), (6, 0)),
+    (re.compile(r"\b(?:annual(?:ly)?|yearly|every year|next year)\b", re.IGNORECASE), (12, 0)),
+    (re.compile(r"\b(?:quarterly|every quarter|next quarter)\b", re.IGNORECASE), (3, 0)),
+    (re.compile(r"\b(?:monthly|every month|next month)\b", re.IGNORECASE), (1, 0)),
+    (re.compile(r"\b(?:weekly|every week|next week)\b", re.IGNORECASE), (0, 7)),
+    (re.compile(r"\btomorrow\b", re.IGNORECASE), (0, 1)),
+]
+_RANGE = re.compile(r"\b(?:" + _NUMBER + r")[ \t]*(?:-|to|or)[ \t]*(?:" + _NUMBER + r")[ \t-]*(?:day|week|month|year)", re.IGNORECASE)
+# A time frame the parser does not handle; the item goes to the model instead of getting "n/a"
+_UNPARSED_TIME = re.compile(r"\b(?:" + _MONTH_NAMES + r"|monday|tuesday|wednesday|thursday|friday|saturday|sunday|end of|hours?|minutes?)\b|\d{1,2}/\d{1,2}", re.IGNORECASE)
+# In Plan sections only these items are follow-ups; medications and advice are left out
+_FOLLOWUP_WORDS = re.compile(r"\b(?:follow[- ]?up|return (?:for|visit|to (?:the )?(?:clinic|office))|recheck|re-?evaluat|reassess|schedule|repeat|screen|test|check|referr|appointment|visit|scan|imaging|mammogram|colonoscopy|lab|panel|vaccin)", re.IGNORECASE)
+
+
+class FollowUp:
+    __slots__ = ("details", "due_date", "resolved")
+
+    def __init__(self, details: str, due_date: str, resolved: bool = True):
+        self.details = details
+        self.due_date = due_date
+        self.resolved = resolved
+
+    def to_dict(self) -> dict:
+        return {"followup_details": self.details, "due_date": self.due_date}
+
+
+def parse_date(match) -> date:
+    groups = match.groupdict()
+    if groups["us_year"]:
+        return date(int(groups["us_year"]), int(groups["us_month"]), int(groups["us_day"]))
+    if groups["iso_year"]:
+        return date(int(groups["iso_year"]), int(groups["iso_month"]), int(groups["iso_day"]))
+    return date(int(groups["year"]), _MONTHS[groups["month_name"].lower()], int(groups["day"]))
+
+
+def add_interval(start: date, months: int, days: int) -> date:
+    # Month arithmetic clamps to the end of shorter months (Jan 31 + 1 month = Feb 28/29)
+    month_index = start.month - 1 + months
+    year, month = start.year + month_index // 12, month_index % 12 + 1
+    day = min(start.day, calendar.monthrange(year, month)[1])
+    return date(year, month, day) + timedelta(days=days)
+
+
+def parse_interval(text: str):
+    """(months, days) of the time frame in a follow-up item, "none" without one, or None if it cannot be parsed."""
+    if _RANGE.search(text):
+        return None
+    matches = []
+    for match in _INTERVAL.finditer(text):
+        # "1 year and 3 months" adds up; two separate time frames in one item are left to the model
+        if matches and text[matches[-1].end():match.start()].strip(" ,").lower() in ("", "and"):
+            matches.append(match)
+        elif _ATTACHED.search(text, 0, match.start()):
+            if matches:
+                return None
+            matches = [match]
+    if matches:
+        months = days = 0
+        for match in matches:
+            number = match.group("number").lower()
+            count = int(number) if number.isdigit() else _NUMBER_WORDS[number]
+            unit_months, unit_days = _UNITS[match.group("unit").lower()]
+            months, days = months + count * unit_months, days + count * unit_days
+        return months, days
+    for pattern, interval in _FREQUENCIES:
+        if pattern.search(text):
+            return interval
+    return None if _UNPARSED_TIME.search(text) else "none"
+
+
+def followup_items(note: str) -> list:
+    """(visit date, item text) for the items of the note's Next steps / Plan / Follow-up sections.
+
+    Each item belongs to the last visit date above it, so a chart of several visits resolves
+    every item against its own visit; the date is None before the first one.
+    """
+    items, visit_date, section = [], None, None
+    for line in note.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if ":" in line:
+            match = _VISIT_DATE.match(line)
+            if match:
+                visit_date, section = parse_date(match), None
+                continue
+        header = _SECTION.match(line)
+        if header:
+            section = header.group("name").lower()
+            continue
+        if section is None:
+            continue
+        item = _ITEM.match(line)
+        if item is None:
+            section = None
+            continue
+        text = item.group("text").rstrip(" .")
+        # Sub-headings such as "• Medications:" are not items themselves
+        if text.endswith(":"):
+            continue
+        # In Plan sections only follow-up items count, not medications or advice
+        if section != "plan" or _FOLLOWUP_WORDS.search(text):
+            items.append((visit_date, text))
+    return items
+
+
+def extract_followups(note: str) -> list:
+    """Follow-ups of every visit in the note, each resolved against its own visit date."""
+    followups = []
+    for visit_date, item in followup_items(note):
+        interval = parse_interval(item)
+        if interval == "none":
+            followups.append(FollowUp(item, NO_DUE_DATE))
+        elif interval is None or visit_date is None:
+            followups.append(FollowUp(item, NO_DUE_DATE, resolved=False))
+        else:
+            followups.append(FollowUp(item, add_interval(visit_date, *interval).strftime("%m/%d/%Y")))
+    return followups
+
+
+def followup_hints(note: str) -> str:
+    """Resolved due dates for the personas that otherwise work them out themselves; None if there are none."""
+    resolved = [followup for followup in extract_followups(note) if followup.resolved and followup.due_date != NO_DUE_DATE]
+    if not resolved:
+        return None
+    lines = ["Follow-up due dates already calculated from the visit date (use these dates):"]
+    lines.extend(f"- {followup.details}: due {date_words(followup.due_date)}" for followup in resolved)
+    return "\n".join(lines)
+
+
+def date_words(due_date: str) -> str:
+    # Spelled out, so neither mm/dd nor dd/mm readers can misread it
+    month, day, year = due_date.split("/")
+    return f"{calendar.month_name[int(month)]} {int(day)}, {year}"
+
+
+def extract_followups_batch(notes: list) -> list:
+    """extract_followups for each note, in the order of `notes`."""
+    return [extract_followups(note) for note in notes]
+
+
+def fallback_prompt(note: str, followups: list) -> str:
+    """Only the unresolved items under their visit dates, in the format the follow-up model was trained on."""
+    # `followups` is extract_followups(note), one per item and in the same order; identical items
+    # under different visits keep their own dates
+    lines, current = [], ()
+    for (visit_date, _), followup in zip(followup_items(note), followups):
+        if followup.resolved:
+            continue
+        if visit_date != current:
+            lines += [f"Date of Visit: {visit_date.strftime('%m/%d/%Y') if visit_date else 'unknown'}", "Next steps:"]
+            current = visit_date
+        lines.append(f"- {followup.details}.")
+    return "\n".join(lines)
+
+
+def parse_model_followups(content: str) -> list:
+    # The model may wrap the array in a ```json fence
+    content = content.strip()
+    if content.startswith("```"):
+        content = content.strip("`").removeprefix("json").strip()
+    return json.loads(content)
+
+
+async def aresolve_followups(notes: list, fallback, max_concurrency: int = 4) -> list:
+    """Follow-ups for a batch of notes, as lists of {"followup_details", "due_date"}.
+
+    `fallback` is a coroutine function that takes a prompt and returns the model's JSON text.
+    It is only called for notes with unresolved items, and only with those items; their due
+    dates are taken from its answer in order. If the model call fails they stay "n/a".
+    """
+    batch = extract_followups_batch(notes)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def resolve(note, followups):
+        unresolved = [followup for followup in followups if not followup.resolved]
+        if unresolved:
+            async with semaphore:
+                try:
+                    answers = parse_model_followups(await fallback(fallback_prompt(note, followups)))
+                    for followup, answer in zip(unresolved, answers):
+                        followup.due_date, followup.resolved = answer.get("due_date", NO_DUE_DATE), True
+                except Exception as e:
+                    log_event(logger, "followup_fallback_failed", logging.WARNING, items=len(unresolved), error=str(e))
+        return [followup.to_dict() for followup in followups]
+
+    return list(await asyncio.gather(*(resolve(note, followups) for note, followups in zip(notes, batch))))
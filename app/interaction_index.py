@@ -0,0 +1,127 @@
+"""Local drug-drug interaction lookup for clinical decision support.
+
+The dataset is a CSV (drug_a, drug_b, severity, effect, management) or a JSON file
+({"interactions": [...], "aliases": {...}}) named by DRUG_INTERACTIONS_PATH; brand names
+and other aliases come from DRUG_ALIASES_PATH (CSV with alias, drug). Both default to the
+seed files in app/data. Medication lists are free text: every line or comma-separated entry is
+matched against the known drug names, so "2. Coumadin 5mg daily (INR monitoring)" becomes
+warfarin.
+"""
+import csv
+import json
+import os
+import re
+from pathlib import Path
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+
+SEVERITY_ORDER = {"critical": 0, "high": 1, "medium": 2, "low": 3}
+
+_ENTRY_SEPARATOR = re.compile(r"[\n,;]+")
+_WORD = re.compile(r"[a-z][a-z-]*")
+
+
+class Interaction:
+    __slots__ = ("drug_a", "drug_b", "severity", "effect", "management")
+
+    def __init__(self, drug_a: str, drug_b: str, severity: str, effect: str, management: str):
+        self.drug_a = drug_a
+        self.drug_b = drug_b
+        self.severity = severity
+        self.effect = effect
+        self.management = management
+
+    def to_dict(self) -> dict:
+        return {"drugs": [self.drug_a, self.drug_b], "severity": self.severity, "effect": self.effect, "management": self.management}
+
+    def describe(self) -> str:
+        return f"{self.drug_a.title()} + {self.drug_b.title()} ({self.severity}): {self.effect}. {self.management}."
+
+
+class InteractionIndex:
+    """Pairs of drugs indexed by each drug, so a list of n medications is checked in O(n * partners)."""
+
+    def __init__(self, interactions: list, aliases: dict = None):
+        self._partners = {}
+        for interaction in interactions:
+            self._partners.setdefault(interaction.drug_a, {})[interaction.drug_b] = interaction
+            self._partners.setdefault(interaction.drug_b, {})[interaction.drug_a] = interaction
+        # Every name a drug can be written as -> its canonical name
+        self._names = {drug: drug for drug in self._partners}
+        self._names.update({alias.lower(): drug.lower() for alias, drug in (aliases or {}).items()})
+        self._longest_name = max((len(name.split()) for name in self._names), default=1)
+
+    @classmethod
+    def load(cls, path: str, aliases_path: str = None) -> "InteractionIndex":
+        path = Path(path)
+        aliases = {}
+        if path.suffix.lower() == ".json":
+            data = json.loads(path.read_text())
+            rows, aliases = data["interactions"], data.get("aliases", {})
+        else:
+            with path.open(newline="") as f:
+                rows = list(csv.DictReader(f))
+        if aliases_path:
+            with Path(aliases_path).open(newline="") as f:
+                aliases.update({row["alias"]: row["drug"] for row in csv.DictReader(f)})
+        interactions = [
+            Interaction(row["drug_a"].strip().lower(), row["drug_b"].strip().lower(), row["severity"].strip().lower(),
+                        row["effect"].strip(), row["management"].strip())
+            for row in rows
+        ]
+        return cls(interactions, aliases)
+
+    @classmethod
+    def from_env(cls) -> "InteractionIndex":
+        return cls.load(
+            os.getenv("DRUG_INTERACTIONS_PATH") or DATA_DIR / "drug_interactions.csv",
+            os.getenv("DRUG_ALIASES_PATH") or DATA_DIR / "drug_aliases.csv",
+        )
+
+    def normalize(self, medications: str) -> list:
+        """Canonical names of the known drugs in a free-text medication list, in list order."""
+        drugs = []
+        for entry in _ENTRY_SEPARATOR.split((medications or "").lower()):
+            words = _WORD.findall(entry)
+            drug = self._find_name(words)
+            if drug is not None and drug not in drugs:
+                drugs.append(drug)
+        return drugs
+
+    def _find_name(self, words: list):
+        # Longest names first, so "potassium chloride" wins over a shorter match inside it
+        for length in range(min(self._longest_name, len(words)), 0, -1):
+            for start in range(len(words) - length + 1):
+                drug = self._names.get(" ".join(words[start:start + length]))
+                if drug is not None:
+                    return drug
+        return None
+
+    def check(self, medications: str) -> list:
+        """Known interactions between the drugs in a medication list, most severe first."""
+        drugs = self.normalize(medications)
+        found = []
+        # Each pair is looked at once, from the drug listed first
+        for index, drug in enumerate(drugs):
+            partners = self._partners.get(drug)
+            if partners:
+                found.extend(partners[other] for other in drugs[index + 1:] if other in partners)
+        return sorted(found, key=lambda interaction: SEVERITY_ORDER.get(interaction.severity, len(SEVERITY_ORDER)))
+
+
+def format_findings(interactions: list) -> str:
+    """The matched interactions as the block ClinicalDecisionSupportPrompter puts in the prompt; "" when none matched.
+
+    The seed database covers few pairs, so no match is not evidence of no interaction and is
+    not mentioned to the model.
+    """
+    if not interactions:
+        return ""
+    lines = ["Interaction database check (verified; report each of these under DRUG INTERACTIONS). The database "
+             "covers a limited set of drug pairs, so evaluate the other medications for interactions yourself:"]
+    lines.extend(f"- {interaction.describe()}" for interaction in interactions)
+    return "\n".join(lines)
+
+
+# Shared index for the worker, loaded from DRUG_INTERACTIONS_PATH / DRUG_ALIASES_PATH.
+interaction_index = InteractionIndex.from_env()
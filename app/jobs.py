@@ -0,0 +1,225 @@
+"""Background jobs for long-running personas.
+
+POST /jobs queues the work and answers with a job id at once; the generation runs on a
+bounded pool of asyncio workers in the same process, and clients poll GET /jobs/{id} or
+subscribe to GET /jobs/{id}/events instead of holding a connection open for the whole call.
+
+Job state lives in memory and, when `store_path` is set, in a SQLite file shared by the
+gunicorn workers, so a job can be looked up through whichever worker answers the poll.
+SQLite calls run on a single store thread, off the event loop and in the order they were made.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from app.logging_setup import get_logger, log_event
+from app.metrics import JOB_QUEUE_DEPTH, JOB_QUEUE_WAIT, JOBS
+
+logger = get_logger("jobs")
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class Job:
+    def __init__(self, prompter_type: str, model_type: str, job_id: str = None, requires_auth: bool = False):
+        self.id = job_id or uuid.uuid4().hex
+        self.prompter_type = prompter_type
+        self.model_type = model_type
+        # Reading the job back needs the same credentials as submitting it
+        self.requires_auth = requires_auth
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "prompter_type": self.prompter_type,
+            "model_type": self.model_type,
+            "requires_auth": self.requires_auth,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Job":
+        # Rows stored before requires_auth existed are treated as protected
+        job = cls(data["prompter_type"], data["model_type"], data["id"], data.get("requires_auth", True))
+        for field in ("status", "result", "error", "created_at", "started_at", "finished_at"):
+            setattr(job, field, data[field])
+        return job
+
+
+class JobManager:
+    """Bounded queue of jobs worked off by `workers` asyncio tasks.
+
+    A full queue raises asyncio.QueueFull from submit(), so callers can push back instead of
+    piling up work. Finished jobs are kept for `ttl` seconds.
+    """
+
+    def __init__(self, workers: int = 4, max_queue: int = 100, ttl: float = 3600, store_path: str = None):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.ttl = ttl
+        self.store_path = store_path
+        self._jobs = {}
+        self._finished = {}
+        self._queue = None
+        self._loop = None
+        self._tasks = []
+        self._lock = threading.Lock()
+        self._db = None
+        self._store_thread = None
+        if store_path:
+            # One thread, so the status updates of a job are written in order
+            self._store_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-store")
+            self._db = sqlite3.connect(store_path, timeout=5, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    @classmethod
+    def from_env(cls) -> "JobManager":
+        return cls(
+            workers=int(os.getenv("JOB_WORKERS", "4")),
+            max_queue=int(os.getenv("JOB_QUEUE_SIZE", "100")),
+            ttl=float(os.getenv("JOB_TTL", "3600")),
+            store_path=os.getenv("JOB_STORE_PATH") or None,
+        )
+
+    def _start(self):
+        # Workers belong to the running event loop; a new loop (e.g. in tests) gets new ones
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._tasks = [loop.create_task(self._work()) for _ in range(self.workers)]
+
+    async def submit(self, prompter_type: str, model_type: str, run, requires_auth: bool = False) -> Job:
+        """Queue `run`, a no-argument coroutine function whose JSON-serializable return value is the result."""
+        self._start()
+        await self._in_store(self.purge_expired)
+        job = Job(prompter_type, model_type, requires_auth=requires_auth)
+        self._queue.put_nowait((job, run))
+        with self._lock:
+            self._jobs[job.id] = job
+            self._finished[job.id] = asyncio.Event()
+        await self._asave(job)
+        JOB_QUEUE_DEPTH.inc()
+        log_event(logger, "job_queued", job_id=job.id, prompter_type=prompter_type, model_type=model_type, queue_depth=self._queue.qsize())
+        return job
+
+    async def _work(self):
+        while True:
+            job, run = await self._queue.get()
+            JOB_QUEUE_DEPTH.dec()
+            job.status, job.started_at = RUNNING, time.time()
+            JOB_QUEUE_WAIT.labels(job.prompter_type).observe(job.started_at - job.created_at)
+            await self._asave(job)
+            try:
+                job.result = await run()
+                job.status = DONE
+            except Exception as e:
+                job.status, job.error = FAILED, str(e)
+                log_event(logger, "job_failed", logging.ERROR, job_id=job.id, prompter_type=job.prompter_type, error=str(e))
+            finally:
+                job.finished_at = time.time()
+                JOBS.labels(job.prompter_type, job.status).inc()
+                try:
+                    await self._asave(job)
+                finally:
+                    self._finished[job.id].set()
+                    self._queue.task_done()
+
+    async def _in_store(self, fn, *args):
+        """fn(*args) on the store thread when there is a store, else inline."""
+        if self._store_thread is None:
+            return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(self._store_thread, fn, *args)
+
+    async def _asave(self, job: Job):
+        if self._db is not None:
+            # Serialized now, so the row holds the job as it is at this point
+            await self._in_store(self._write, job.id, json.dumps(job.to_dict()), time.time() + self.ttl)
+
+    def _write(self, job_id: str, value: str, expires_at: float):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO jobs (id, value, expires_at) VALUES (?, ?, ?)", (job_id, value, expires_at))
+            self._db.commit()
+
+    def get(self, job_id: str) -> Job:
+        """The job, from this worker or from the shared store; None when unknown or expired."""
+        job = self._jobs.get(job_id)
+        if job is not None or self._db is None:
+            return job
+        with self._lock:
+            row = self._db.execute("SELECT value FROM jobs WHERE id = ? AND expires_at > ?", (job_id, time.time())).fetchone()
+        return Job.from_dict(json.loads(row[0])) if row else None
+
+    async def aget(self, job_id: str) -> Job:
+        job = self._jobs.get(job_id)
+        if job is not None or self._db is None:
+            return job
+        return await self._in_store(self.get, job_id)
+
+    async def wait(self, job_id: str, timeout: float, poll_interval: float = 0.5) -> Job:
+        """The job once finished, or as it is after `timeout` seconds."""
+        finished = self._finished.get(job_id)
+        if finished is not None:
+            try:
+                await asyncio.wait_for(finished.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            return self.get(job_id)
+        # Running in another worker: follow it through the shared store
+        deadline = time.monotonic() + timeout
+        job = await self._in_store(self.get, job_id)
+        while job is not None and not job.finished and time.monotonic() < deadline:
+            await asyncio.sleep(poll_interval)
+            job = await self._in_store(self.get, job_id)
+        return job
+
+    def purge_expired(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            for job_id in [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at <= cutoff]:
+                del self._jobs[job_id]
+                del self._finished[job_id]
+            if self._db is not None:
+                self._db.execute("DELETE FROM jobs WHERE expires_at <= ?", (time.time(),))
+                self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            by_status = {}
+            for job in self._jobs.values():
+                by_status[job.status] = by_status.get(job.status, 0) + 1
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "workers": self.workers,
+            "jobs": by_status,
+            "store_path": self.store_path,
+        }
+
+
+# Shared job manager for the worker, configured from JOB_WORKERS / JOB_QUEUE_SIZE / JOB_TTL / JOB_STORE_PATH.
+job_manager = JobManager.from_env()
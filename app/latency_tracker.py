@@ -0,0 +1,47 @@
+import threading
+from collections import deque
+
+
+class LatencyTracker:
+    """Recent provider call latencies per (provider, prompter_type) for this worker.
+
+    Only calls that reached the provider are recorded, so result cache hits do not pull the
+    percentiles down.
+    """
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def record(self, provider: str, prompter_type: str, seconds: float):
+        with self._lock:
+            samples = self._samples.get((provider, prompter_type))
+            if samples is None:
+                samples = self._samples[(provider, prompter_type)] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def percentile(self, provider: str, prompter_type: str, q: float, min_samples: int = 1):
+        """The q-th (0-1) latency percentile in seconds, or None with fewer than min_samples calls."""
+        with self._lock:
+            samples = sorted(self._samples.get((provider, prompter_type), ()))
+        if len(samples) < max(min_samples, 1):
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            keys = list(self._samples)
+        return {
+            f"{provider}/{prompter_type}": {
+                "samples": len(self._samples[(provider, prompter_type)]),
+                "p50": round(self.percentile(provider, prompter_type, 0.5), 3),
+                "p90": round(self.percentile(provider, prompter_type, 0.9), 3),
+                "p99": round(self.percentile(provider, prompter_type, 0.99), 3),
+            }
+            for provider, prompter_type in keys
+        }
+
+
+# Shared by every model instance in this worker
+latency_tracker = LatencyTracker()
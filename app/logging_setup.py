@@ -0,0 +1,177 @@
+"""Structured, non-blocking logging for the app.
+
+Records are put on a bounded in-memory queue and written as JSON lines by a background
+QueueListener, so a request never waits on stdout. When the queue is full records are
+dropped (and counted) instead of blocking. Each event can be sampled (LOG_SAMPLE_RATES,
+e.g. "prompt=0.1,request_received=1"); warnings and errors are always kept.
+
+Visit notes and prompts are PHI. At INFO they are only logged as a hash and a length;
+the bodies are logged at DEBUG, after redact().
+"""
+import atexit
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+
+LOGGER_NAME = "clinical_insights"
+
+# Share of each event that is logged unless LOG_SAMPLE_RATES overrides it; other events are always logged
+DEFAULT_SAMPLE_RATES = {"prompt": 0.1}
+
+_setup_lock = threading.Lock()
+_listener = None
+_queue_handler = None
+_sampler = None
+
+
+def get_logger(name: str = None) -> logging.Logger:
+    return logging.getLogger(f"{LOGGER_NAME}.{name}" if name else LOGGER_NAME)
+
+
+def log_event(logger: logging.Logger, event: str, level: int = logging.INFO, **fields):
+    """Log `event` with structured `fields`; nothing is built if the level is disabled or the event is sampled out."""
+    if not logger.isEnabledFor(level):
+        return
+    if _sampler is not None and not _sampler.keep(event, level):
+        return
+    # makeRecord directly skips Logger.findCaller's stack walk, the largest cost of logger.log()
+    record = logger.makeRecord(logger.name, level, "", 0, event, None, None,
+                               extra={"event": event, "fields": fields, "sampled": True})
+    logger.handle(record)
+
+
+def text_fields(prefix: str, text: str) -> dict:
+    """Hash and length of a PHI-bearing text, safe to log at INFO."""
+    text = text or ""
+    return {
+        f"{prefix}_sha256": hashlib.sha256(text.encode("utf-8")).hexdigest()[:16],
+        f"{prefix}_chars": len(text),
+    }
+
+
+# Identifiers that are redacted from bodies logged at DEBUG
+_REDACTIONS = (
+    (re.compile(r"\b[\w.+-]+@[\w-]+\.[\w.-]+\b"), "[EMAIL]"),
+    (re.compile(r"\b\d{3}-\d{2}-\d{4}\b"), "[SSN]"),
+    (re.compile(r"(?:\+?1[\s.-]?)?\(?\b\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}\b"), "[PHONE]"),
+    (re.compile(r"\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b"), "[DATE]"),
+    (re.compile(r"(?i)\b(name|patient|dob|date of birth|mrn|address)(\s*[:#]\s*)[^\n,;]+"), r"\1\2[REDACTED]"),
+    (re.compile(r"\b\d{7,}\b"), "[ID]"),
+)
+
+
+def redact(text: str) -> str:
+    for pattern, replacement in _REDACTIONS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, event and the event's fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "event": getattr(record, "event", None) or record.getMessage(),
+            "pid": record.process,
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+
+    def keep(self, event: str, level: int) -> bool:
+        if level >= logging.WARNING:
+            return True
+        rate = self.rates.get(event, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # log_event() has already sampled its records
+        return getattr(record, "sampled", False) or self.keep(getattr(record, "event", None), record.levelno)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of blocking the caller."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The listener formats the record; only resolve the message and exception text here
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_sample_rates(value: str) -> dict:
+    rates = dict(DEFAULT_SAMPLE_RATES)
+    for item in (value or "").split(","):
+        if "=" in item:
+            event, rate = item.split("=", 1)
+            rates[event.strip()] = float(rate)
+    return rates
+
+
+def configure_logging(level: str = None, stream=None, sample_rates: dict = None, queue_size: int = None) -> logging.Logger:
+    """Route the app's loggers through the queue; safe to call more than once (first call wins)."""
+    global _listener, _queue_handler, _sampler
+    logger = get_logger()
+    with _setup_lock:
+        if _listener is not None:
+            return logger
+        log_queue = queue.Queue(maxsize=queue_size or int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JsonFormatter())
+        _queue_handler = DroppingQueueHandler(log_queue)
+        _sampler = SamplingFilter(sample_rates if sample_rates is not None else parse_sample_rates(os.getenv("LOG_SAMPLE_RATES")))
+        _queue_handler.addFilter(_sampler)
+        logger.handlers[:] = [_queue_handler]
+        logger.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+        logger.propagate = False
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+    return logger
+
+
+def dropped_records() -> int:
+    """Records dropped because the queue was full."""
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+def shutdown_logging():
+    """Flush the queue and stop the background writer."""
+    global _listener
+    with _setup_lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
@@ -0,0 +1,152 @@
+"""Prometheus metrics for the app, exposed at /metrics.
+
+Under gunicorn every worker is its own process, so the metrics are written to files in
+PROMETHEUS_MULTIPROC_DIR and aggregated when scraped (gunicorn.conf.py sets the directory
+up and removes the files of dead workers). Without that variable, e.g. under plain uvicorn,
+the metrics of the single process are served directly.
+"""
+import os
+import time
+from contextlib import contextmanager
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+# Provider calls take seconds, so the default buckets (which top out at 10s) are too narrow
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 45, 60, 90, 120)
+
+REQUESTS = Counter(
+    "clinical_insights_requests_total", "Requests handled, by outcome.",
+    ["prompter_type", "model_type", "status"],
+)
+REQUEST_LATENCY = Histogram(
+    "clinical_insights_request_duration_seconds", "End-to-end request latency.",
+    ["prompter_type", "model_type"], buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "clinical_insights_requests_in_flight", "Requests being handled.",
+    ["prompter_type", "model_type"], multiprocess_mode="livesum",
+)
+UPSTREAM_CALLS = Counter(
+    "clinical_insights_upstream_calls_total", "Provider calls, by outcome.",
+    ["prompter_type", "model_type", "status"],
+)
+UPSTREAM_LATENCY = Histogram(
+    "clinical_insights_upstream_duration_seconds", "Provider call latency, including rate limiter queueing and retries.",
+    ["prompter_type", "model_type"], buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    "clinical_insights_upstream_in_flight", "Provider calls in progress.",
+    ["prompter_type", "model_type"], multiprocess_mode="livesum",
+)
+TOKENS = Counter(
+    "clinical_insights_tokens_total", "Tokens reported by the providers; cached_input is part of input.",
+    ["prompter_type", "model_type", "kind"],
+)
+ERRORS = Counter(
+    "clinical_insights_errors_total", "Failed requests and provider calls, by exception type.",
+    ["prompter_type", "model_type", "stage", "error"],
+)
+RETRIES = Counter(
+    "clinical_insights_upstream_retries_total", "Provider calls retried by the rate limiter, by reason.",
+    ["prompter_type", "model_type", "reason"],
+)
+CODE_FAST_PATH = Counter(
+    "clinical_insights_code_extraction_total", "Coding requests by what the codes listed in the note were used for.",
+    ["prompter_type", "outcome"],
+)
+NOTE_TOKENS = Counter(
+    "clinical_insights_note_tokens_total", "Estimated note tokens per persona, for the whole note and for the sections sent.",
+    ["prompter_type", "stage"],
+)
+JOBS = Counter(
+    "clinical_insights_jobs_total", "Background jobs finished, by outcome.",
+    ["prompter_type", "status"],
+)
+JOB_QUEUE_DEPTH = Gauge(
+    "clinical_insights_job_queue_depth", "Background jobs waiting for a job worker.",
+    multiprocess_mode="livesum",
+)
+JOB_QUEUE_WAIT = Histogram(
+    "clinical_insights_job_queue_wait_seconds", "Time background jobs waited before a job worker started them.",
+    ["prompter_type"], buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_CONNECTIONS = Counter(
+    "clinical_insights_upstream_http_requests_total", "HTTP requests to the providers, by whether a new connection was opened.",
+    ["host", "connection"],
+)
+HANDSHAKE_LATENCY = Histogram(
+    "clinical_insights_upstream_handshake_seconds", "DNS, TCP and TLS time of new provider connections.",
+    ["host"], buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+
+class _Tracked:
+    __slots__ = ("error",)
+
+    def __init__(self):
+        self.error = None
+
+    def fail(self, error):
+        """Count the block as failed for an error that was handled inside it."""
+        self.error = error
+
+
+@contextmanager
+def _track(calls, latency, in_flight, stage, prompter_type, model_type):
+    labels = (prompter_type or "none", model_type or "none")
+    tracked = _Tracked()
+    in_flight.labels(*labels).inc()
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield tracked
+    except Exception as e:
+        tracked.fail(e)
+        raise
+    except BaseException:
+        # Cancelled (e.g. a lost hedge or a closed stream) rather than failed
+        status = "cancelled"
+        raise
+    finally:
+        if tracked.error is not None:
+            status = "error"
+            ERRORS.labels(*labels, stage, type(tracked.error).__name__).inc()
+        calls.labels(*labels, status).inc()
+        latency.labels(*labels).observe(time.perf_counter() - started)
+        in_flight.labels(*labels).dec()
+
+
+def track_request(prompter_type: str, model_type: str):
+    """Count, time and gauge one request. Only pass labels that have been validated."""
+    return _track(REQUESTS, REQUEST_LATENCY, REQUESTS_IN_FLIGHT, "request", prompter_type, model_type)
+
+
+def track_upstream(prompter_type: str, model_type: str):
+    """Count, time and gauge one provider call."""
+    return _track(UPSTREAM_CALLS, UPSTREAM_LATENCY, UPSTREAM_IN_FLIGHT, "upstream", prompter_type, model_type)
+
+
+def record_tokens(prompter_type: str, model_type: str, input_tokens: int, output_tokens: int, cached_input_tokens: int = 0):
+    labels = (prompter_type or "none", model_type or "none")
+    TOKENS.labels(*labels, "input").inc(input_tokens or 0)
+    TOKENS.labels(*labels, "output").inc(output_tokens or 0)
+    TOKENS.labels(*labels, "cached_input").inc(cached_input_tokens or 0)
+
+
+def record_retry(prompter_type: str, model_type: str, reason: str):
+    RETRIES.labels(prompter_type or "none", model_type or "none", reason).inc()
+
+
+def record_connection(host: str, new_connection: bool, handshake_seconds: float):
+    UPSTREAM_CONNECTIONS.labels(host, "new" if new_connection else "reused").inc()
+    if new_connection:
+        HANDSHAKE_LATENCY.labels(host).observe(handshake_seconds)
+
+
+def render() -> tuple:
+    """(body, content type) for the /metrics endpoint."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,85 +1,525 @@
-from app.openai_model import OpenAIModel
-from app.anthropic_model import AnthropicModel
+import asyncio
+import logging
+import os
+import threading
+import time
 from app.visit_summary import VisitSummary
-from app.prompt_generator import CPTCodePrompter, SummarizeChartPrompter, DiagnosisCodePrompter, LabResultEmailer, MedicationAdherencePrompter, FollowUpPrompter, HCCPrompter, SDOHPrompter, PreVisitPlanningPrompter, VisitSummaryPrompterSpanish, VisitSummaryPrompterMandarin, VisitSummaryPrompterEnglish, VisitSummaryPrompterKorean, VisitSummaryPrompterArabic, VisitSummaryPrompterBengali, PreVisitPlanningPrompter_Alternate, ClinicalDecisionSupportPrompter
+from app.prompt_generator import LabResultEmailer, CodingBundlePrompter
+from app.model_registry import registry
+from app.latency_tracker import latency_tracker
+from app.metrics import CODE_FAST_PATH, NOTE_TOKENS, track_request
+from app.code_extractor import CPT, extract_codes, fast_path_enabled
+from app.followup_engine import followup_hints
+from app.chart_state import ChartState, chart_state, fingerprint, split_visits
+from app.note_sections import parse_note, section_stats, slicing_enabled
+from app.token_accounting import estimate_prompt
+from app.structured_output import CodeResult, CodingResult, structured_enabled
+from app.interaction_index import interaction_index
+from app.logging_setup import get_logger, log_event
+
+logger = get_logger("orchestrator")
+
+# Patient summary language -> prompter_type of its VisitSummaryPrompter
+SUMMARY_LANGUAGES = {
+    'english': 'english_summary',
+    'spanish': 'spanish_summary',
+    'mandarin': 'mandarin_summary',
+    'korean': 'korean_summary',
+    'arabic': 'arabic_summary',
+    'bengali': 'bengali_summary',
+}
+
+# Largest estimated input (in tokens) sent in one call before long charts are summarized hierarchically
+HIERARCHICAL_TOKEN_BUDGET = int(os.getenv("HIERARCHICAL_TOKEN_BUDGET", "6000"))
+
+# Put in front of the partial summaries in the combining (reduce) calls
+PARTIAL_SUMMARIES_PREAMBLE = (
+    "The following are summaries of consecutive groups of visit notes from the same patient chart, "
+    "in chronological order. Treat them together as the complete chart.\n\n"
+)
+
+# Put in front of the stored summary when a patient's summary is updated with new visits only
+PRIOR_SUMMARY_PREAMBLE = (
+    "The following is the existing summary of this patient's chart, followed by visit notes added since it "
+    "was written. Update it into one summary of the complete chart, keeping every finding from the existing "
+    "summary that the new visits do not change.\n\nExisting summary:\n"
+)
+
+# Hedged requests: the other provider is asked once the primary has taken longer than the
+# HEDGE_PERCENTILE latency of recent calls for the persona (HEDGE_DELAY seconds until
+# HEDGE_MIN_SAMPLES calls have been seen).
+HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", "8"))
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.9"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+
+class HedgeStats:
+    """How often hedged requests needed the second provider, and how often it won, per prompter."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, prompter_type: str, hedged: bool, hedge_won: bool):
+        with self._lock:
+            stats = self._stats.setdefault(prompter_type, {"requests": 0, "hedged": 0, "hedge_wins": 0})
+            stats["requests"] += 1
+            stats["hedged"] += hedged
+            stats["hedge_wins"] += hedge_won
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            snapshot = {prompter_type: dict(stats) for prompter_type, stats in self._stats.items()}
+        for stats in snapshot.values():
+            stats["hedge_rate"] = round(stats["hedged"] / stats["requests"], 4)
+            stats["win_rate"] = round(stats["hedge_wins"] / stats["hedged"], 4) if stats["hedged"] else 0.0
+        return snapshot
+
+hedge_stats = HedgeStats()
+
 class ModelOrchestrator:
+    _shared = {}
+    _shared_lock = threading.Lock()
+
     def __init__(self, model_type: str, prompter_type: str):
-        print(f"************* Summarization for {model_type} for the persona {prompter_type}")
-        if prompter_type == 'biller':
-            self.prompter = CPTCodePrompter()
-        elif prompter_type == 'summarizer':
-            self.prompter = SummarizeChartPrompter()
-        elif prompter_type == 'diagnosis':
-            self.prompter = DiagnosisCodePrompter()
-        elif prompter_type == 'lab_result_emailer':
-            self.prompter = LabResultEmailer()
-        elif prompter_type == 'medication_adherance':
-            self.prompter = MedicationAdherencePrompter()
-        elif prompter_type == 'follow_up':
-            self.prompter = FollowUpPrompter()
-        elif prompter_type == 'hcc_coder':
-            self.prompter = HCCPrompter()
-        elif prompter_type == 'sdoh_coder':
-            self.prompter = SDOHPrompter()
-        elif prompter_type == 'previsit_planner':
-            self.prompter = PreVisitPlanningPrompter()
-        elif prompter_type == 'previsit_planner_2':
-            self.prompter = PreVisitPlanningPrompter_Alternate()
-        elif prompter_type == 'spanish_summary':
-            self.prompter = VisitSummaryPrompterSpanish()
-        elif prompter_type == 'mandarin_summary':
-            self.prompter = VisitSummaryPrompterMandarin()
-        elif prompter_type == 'english_summary':
-            self.prompter = VisitSummaryPrompterEnglish()
-        elif prompter_type == 'korean_summary':
-            self.prompter = VisitSummaryPrompterKorean()
-        elif prompter_type == 'arabic_summary':
-            self.prompter = VisitSummaryPrompterArabic()
-        elif prompter_type == 'bengali_summary':
-            self.prompter = VisitSummaryPrompterBengali()
-        elif prompter_type == 'clinical_decision_support':
-            self.prompter = ClinicalDecisionSupportPrompter()
-        else:
-            raise ValueError(f"{prompter_type} - Invalid prompter type provided.")
+        self.model_type = model_type
+        self.prompter_type = prompter_type
+        # Prompter and model instances are built once and reused from the registry.
+        self.prompter = registry.get_prompter(prompter_type)
+        self.model = registry.get_model(model_type, prompter_type)
 
-        if model_type == 'openai':
-            self.model = OpenAIModel(self.prompter)
-        elif model_type == 'anthropic':
-            self.model = AnthropicModel(self.prompter)
-        else:
-            raise ValueError("Invalid model type provided. Choose 'openai' or 'anthropic'.")
+    @classmethod
+    def get(cls, model_type: str, prompter_type: str) -> "ModelOrchestrator":
+        """Return the orchestrator shared by every request for this model/persona pair."""
+        key = (model_type, prompter_type)
+        orchestrator = cls._shared.get(key)
+        if orchestrator is not None:
+            return orchestrator
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(model_type, prompter_type)
+                log_event(logger, "orchestrator_created", model_type=model_type, prompter_type=prompter_type)
+            return cls._shared[key]
 
     def generate_email(self, result: str) -> str:
         if isinstance(self.prompter, LabResultEmailer):
             return self.prompter.generate_email(result)
         else:
-            raise AttributeError(f"{self.model_type} prompter cannot generate an email.")
+            raise AttributeError(f"{self.prompter_type} prompter cannot generate an email.")
         
-    def process(self, visit_summary: VisitSummary, ) -> str:
+    def local_answer(self, text: str) -> tuple:
+        """(answer, hints) worked out locally before any provider call.
+
+        Coding personas (code_system): with CODE_FAST_PATH on and a code section for the
+        persona's code system in the note, the listed codes are the answer and no provider call
+        is needed; otherwise any codes found are passed to the prompt as hints. Personas that
+        resolve_followup_dates get the due dates app.followup_engine could compute as hints.
+        Both are None for other personas.
+        """
+        if self.prompter.resolves_followup_dates:
+            return None, followup_hints(text)
+        if self.prompter.code_system is None:
+            return None, None
+        documented, hints = self._code_fast_path(text)
+        return (documented.render(self.prompter.code_system) if documented is not None else None), hints
+
+    def _code_fast_path(self, text: str) -> tuple:
+        """(ExtractedCodes, None) when the note's documented codes are the answer, else (None, hints)."""
+        system = self.prompter.code_system
+        codes = extract_codes(text)
+        if fast_path_enabled() and codes.is_documented(system):
+            CODE_FAST_PATH.labels(self.prompter_type, "answered").inc()
+            return codes, None
+        hints = codes.hints(system)
+        CODE_FAST_PATH.labels(self.prompter_type, "hinted" if hints else "no_codes").inc()
+        return None, hints
+
+    def sliced(self, visit_summary: VisitSummary, record=True) -> VisitSummary:
+        """The visit summary with only the note sections the prompter reads (see app.note_sections).
+
+        Each snippet is sliced on its own; snippets without any of those sections are kept whole.
+        Estimated note tokens before and after are recorded per persona unless `record` is False.
+        """
+        sections = self.prompter.sections
+        if sections is None or not slicing_enabled():
+            return visit_summary
+        snippets = [parse_note(snippet).select(sections) or snippet for snippet in visit_summary.text_snippets]
+        if not record:
+            return VisitSummary(snippets)
+        tokens_before = VisitSummary.estimate_tokens(visit_summary.get_text())
+        tokens_after = VisitSummary.estimate_tokens(" ".join(snippets))
+        section_stats.record(self.prompter_type, tokens_before, tokens_after)
+        NOTE_TOKENS.labels(self.prompter_type, "full").inc(tokens_before)
+        NOTE_TOKENS.labels(self.prompter_type, "sent").inc(tokens_after)
+        return VisitSummary(snippets)
+
+    def estimate(self, visit_summary: VisitSummary, additiona_data=None, components=False) -> dict:
+        """Predicted tokens and cost of one call for this note (see app.token_accounting); no provider call is made.
+
+        The estimate is for a single call. Long charts of personas that support_hierarchical are
+        summarized in several calls instead of being rejected, so they always fit.
+        """
+        estimate = estimate_prompt(self.prompter, self.model, self.sliced(visit_summary, record=False).get_text(),
+                                   additiona_data, components=components)
+        estimate["hierarchical"] = self.prompter.supports_hierarchical and VisitSummary.estimate_tokens(visit_summary.get_text()) > HIERARCHICAL_TOKEN_BUDGET
+        estimate["fits"] = estimate["fits"] or self.prompter.supports_hierarchical
+        return estimate
+
+    def process(self, visit_summary: VisitSummary, use_cache=True) -> str:
         # Call the model with the generated prompt
-        print(f"Visit Summary: \n\n {visit_summary.get_text()}")
-        result = self.model.call_model(visit_summary.get_text())
+        result = self.model.call_model(visit_summary.get_text(), use_cache=use_cache)
         return result
     
     # removes the markdown characters returned.
-    def process_pretty(self, visit_summary: VisitSummary, ) -> str:
+    def process_pretty(self, visit_summary: VisitSummary, use_cache=True) -> str:
+        answer, hints = self.local_answer(visit_summary.get_text())
+        if answer is not None:
+            return answer
         # Call the model with the generated prompt
-        result = self.model.call_model_and_scrub(visit_summary.get_text(), None)
+        result = self.model.call_model_and_scrub(self.sliced(visit_summary).get_text(), hints, use_cache=use_cache)
         return result
     
-    def process_pretty_with_additional_data(self, visit_summary: VisitSummary, additiona_data) -> str:
+    def process_pretty_with_additional_data(self, visit_summary: VisitSummary, additiona_data, use_cache=True) -> str:
         # Call the model with the generated prompt
-        result = self.model.call_model_and_scrub(visit_summary.get_text(), additiona_data)
+        result = self.model.call_model_and_scrub(self.sliced(visit_summary).get_text(), additiona_data, use_cache=use_cache)
         return result
     
     
-    def process_summary_and_email(self, visit_summary: VisitSummary, ) -> tuple:
+    def process_summary_and_email(self, visit_summary: VisitSummary, use_cache=True) -> tuple:
         # Call the model with the generated prompt
-        print(f"Visit Summary: \n\n {visit_summary.get_text()}")
-        summary =self.process_pretty(visit_summary)
+        summary =self.process_pretty(visit_summary, use_cache=use_cache)
+        email = self.generate_email(summary)
+        return summary, email
+
+    # Awaitable variants used by the FastAPI routes.
+    async def aprocess(self, visit_summary: VisitSummary, use_cache=True) -> str:
+        result = await self.model.acall_model(visit_summary.get_text(), use_cache=use_cache)
+        return result
+
+    async def aprocess_pretty(self, visit_summary: VisitSummary, use_cache=True) -> str:
+        answer, hints = self.local_answer(visit_summary.get_text())
+        if answer is not None:
+            return answer
+        sliced = self.sliced(visit_summary)
+        if self._needs_hierarchical(sliced):
+            return await self.aprocess_hierarchical(sliced, use_cache=use_cache, additiona_data=hints)
+        result = await self.model.acall_model_and_scrub(sliced.get_text(), hints, use_cache=use_cache)
+        return result
+
+    def _needs_hierarchical(self, visit_summary: VisitSummary) -> bool:
+        return self.prompter.supports_hierarchical and VisitSummary.estimate_tokens(visit_summary.get_text()) > HIERARCHICAL_TOKEN_BUDGET
+
+    async def aprocess_hierarchical(self, visit_summary: VisitSummary, token_budget: int = HIERARCHICAL_TOKEN_BUDGET, max_concurrency: int = 8, use_cache=True, additiona_data=None) -> str:
+        """Map-reduce summarization for charts too long for one call.
+
+        Groups of snippets that fit `token_budget`, less the tokens of the prompt around them,
+        are summarized in parallel, and the partial summaries are combined by another call. The
+        combine step repeats while the partials still exceed the budget, so latency grows with
+        the depth of the tree rather than with the number of visits. Each combine pass at least
+        halves the number of groups, even when the partials come back longer than the estimate
+        allows for. `additiona_data` (e.g. the follow-up hints of local_answer) goes with every call.
+        """
+        note_budget = token_budget - self._prompt_overhead(additiona_data)
+        if note_budget <= 2 * self.model.max_tokens:
+            raise ValueError(f"token_budget must leave more than twice the model's max_tokens ({self.model.max_tokens}) "
+                             f"for the notes after the {token_budget - note_budget} tokens of the prompt itself.")
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def summarize_group(group, partial_summaries):
+            async with semaphore:
+                return await self.model.acall_model(self._group_text(group, partial_summaries), additiona_data, use_cache=use_cache)
+
+        snippets, level = list(visit_summary.text_snippets), 0
+        groups = VisitSummary(snippets).group_snippets(note_budget)
+        while len(groups) > 1:
+            partials = await asyncio.gather(*(summarize_group(group, level > 0) for group in groups))
+            snippets = [f"Summary {number} of {len(partials)}:\n{partial}" for number, partial in enumerate(partials, start=1)]
+            regrouped = VisitSummary(snippets).group_snippets(note_budget)
+            # Partials that do not pack any tighter are merged pairwise so every pass makes progress
+            groups = regrouped if len(regrouped) < len(groups) else [snippets[i:i + 2] for i in range(0, len(snippets), 2)]
+            level += 1
+        return await self.model.acall_model_and_scrub(self._group_text(groups[0], level > 0), additiona_data, use_cache=use_cache)
+
+    def _prompt_overhead(self, additiona_data=None) -> int:
+        # Estimated tokens of everything but the notes in a group call, combine preamble included
+        system_prompt, user_prompt = self.prompter.generate_prompt("", additional_data=additiona_data)
+        return VisitSummary.estimate_tokens(system_prompt + user_prompt + PARTIAL_SUMMARIES_PREAMBLE)
+
+    async def aprocess_incremental(self, patient_id: str, visit_summary: VisitSummary, use_cache=True) -> str:
+        """aprocess_pretty that reuses the patient's previous summary from this model (app.chart_state).
+
+        The chart is split into visits and each one is fingerprinted. Visits covered by the stored
+        summary are not sent again: the model gets the previous summary and the new visits only,
+        and a chart without new visits returns the stored summary. Visits missing from the chart
+        (e.g. an export of the last few visits) stay in the summary. The first chart of a patient
+        is summarized in full, as is every chart when regenerating (use_cache=False).
+        """
+        if not self.prompter.supports_incremental:
+            raise AttributeError(f"{self.prompter_type} prompter cannot update a summary incrementally.")
+        snippets = [snippet for part in visit_summary.text_snippets for snippet in split_visits(part) if snippet.strip()]
+        fingerprints = [fingerprint(snippet) for snippet in snippets]
+        state = await chart_state.aget(patient_id, self.prompter_type, self.model_type)
+        if state is None or not use_cache:
+            summary = await self.aprocess_pretty(VisitSummary(snippets), use_cache=use_cache)
+            chart_state.record("full", len(snippets), 0)
+            log_event(logger, "chart_summary_full", prompter_type=self.prompter_type, snippets=len(snippets),
+                      reason="no_state" if state is None else "regenerate")
+        else:
+            covered = set(state.fingerprints)
+            new = [snippet for snippet, key in zip(snippets, fingerprints) if key not in covered]
+            if not new:
+                chart_state.record("unchanged", 0, len(snippets))
+                return state.summary
+            text = PRIOR_SUMMARY_PREAMBLE + state.summary + "\n\nNew visit notes:\n" + VisitSummary(new).get_text()
+            summary = await self.model.acall_model_and_scrub(text, None, use_cache=use_cache)
+            chart_state.record("incremental", len(new), len(snippets) - len(new))
+            log_event(logger, "chart_summary_incremental", prompter_type=self.prompter_type, new_snippets=len(new),
+                      total_snippets=len(snippets),
+                      tokens_saved=VisitSummary.estimate_tokens(visit_summary.get_text()) - VisitSummary.estimate_tokens(text))
+            fingerprints = state.fingerprints + [key for key in fingerprints if key not in covered]
+        await chart_state.asave(patient_id, self.prompter_type, self.model_type, ChartState(summary, fingerprints))
+        return summary
+
+    @staticmethod
+    def _group_text(group: list, partial_summaries: bool) -> str:
+        text = VisitSummary(group).get_text()
+        return PARTIAL_SUMMARIES_PREAMBLE + text if partial_summaries else text
+
+    async def aprocess_pretty_with_additional_data(self, visit_summary: VisitSummary, additiona_data, use_cache=True) -> str:
+        result = await self.model.acall_model_and_scrub(self.sliced(visit_summary).get_text(), additiona_data, use_cache=use_cache)
+        return result
+
+    async def aprocess_summary_and_email(self, visit_summary: VisitSummary, use_cache=True) -> tuple:
+        summary = await self.aprocess_pretty(visit_summary, use_cache=use_cache)
         email = self.generate_email(summary)
         return summary, email
 
+    def hedge_delay(self) -> float:
+        delay = latency_tracker.percentile(self.model.provider, self.prompter_type, HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES)
+        return HEDGE_DELAY if delay is None else delay
+
+    async def aprocess_hedged(self, visit_summary: VisitSummary, additiona_data=None, use_cache=True) -> str:
+        """aprocess_pretty_with_additional_data that also asks the other provider if this one is slow.
+
+        After hedge_delay() seconds without an answer the same prompt goes to the other registered
+        model type; whichever answers first is returned and the other call is cancelled. A primary
+        call that fails is hedged immediately, and the request only fails if both calls fail.
+        """
+        hedge_types = [model_type for model_type in registry.model_types() if model_type != self.model_type]
+        if additiona_data is None and self.prompter.supports_hierarchical and VisitSummary.estimate_tokens(visit_summary.get_text()) > HIERARCHICAL_TOKEN_BUDGET:
+            # Long charts take several calls; hedging applies to single calls only
+            return await self.aprocess_pretty(visit_summary, use_cache=use_cache)
+        if not hedge_types:
+            return await self.aprocess_pretty_with_additional_data(visit_summary, additiona_data, use_cache=use_cache)
+        if additiona_data is None:
+            answer, additiona_data = self.local_answer(visit_summary.get_text())
+            if answer is not None:
+                return answer
+        text = self.sliced(visit_summary).get_text()
+        primary = asyncio.create_task(self.model.acall_model_and_scrub(text, additiona_data, use_cache=use_cache))
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay())
+            if done and not primary.exception():
+                hedge_stats.record(self.prompter_type, hedged=False, hedge_won=False)
+                return primary.result()
+
+            # Too slow, or already failed: ask the other provider as well
+            hedge_model = ModelOrchestrator.get(hedge_types[0], self.prompter_type).model
+            hedge = asyncio.create_task(hedge_model.acall_model_and_scrub(text, additiona_data, use_cache=use_cache))
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Prefer a successful answer; only give up when both calls failed
+                winner = next((task for task in done if not task.exception()), None)
+                if winner is not None:
+                    hedge_stats.record(self.prompter_type, hedged=True, hedge_won=winner is hedge)
+                    return winner.result()
+            hedge_stats.record(self.prompter_type, hedged=True, hedge_won=False)
+            return primary.result()
+        finally:
+            # Cancel the loser (no-op for finished tasks)
+            for task in (primary, hedge):
+                if task is not None:
+                    task.cancel()
+
+    async def aprocess_coding_bundle(self, visit_summary: VisitSummary, use_cache=True) -> dict:
+        """CPT, ICD-10, HCC and SDOH codes from one coding_bundle call.
+
+        The bundle response is split into its sections and each one is validated. Only the
+        sections that are missing or unusable are re-run with their individual prompter,
+        concurrently. Returns {"sections": {prompter_type: text}, "fallbacks": [prompter_type, ...]}
+        with sections in CodingBundlePrompter.SECTIONS order.
+        """
+        if not isinstance(self.prompter, CodingBundlePrompter):
+            raise AttributeError(f"{self.prompter_type} prompter cannot produce a coding bundle.")
+        try:
+            response = await self.model.acall_model_and_scrub(visit_summary.get_text(), None, use_cache=use_cache)
+            sections = self.prompter.split_sections(response)
+        except Exception as e:
+            log_event(logger, "coding_bundle_failed", logging.WARNING, model_type=self.model_type, error=str(e))
+            sections = {}
+        failed = [prompter_type for prompter_type in self.prompter.SECTIONS
+                  if not self.prompter.validate_section(prompter_type, sections.get(prompter_type))]
+        if failed:
+            log_event(logger, "coding_bundle_fallback", logging.WARNING, model_type=self.model_type, sections=failed)
+            results = await asyncio.gather(*(
+                ModelOrchestrator.get(self.model_type, prompter_type).aprocess_pretty(visit_summary, use_cache=use_cache)
+                for prompter_type in failed
+            ))
+            sections.update(zip(failed, results))
+        return {
+            "sections": {prompter_type: sections[prompter_type] for prompter_type in self.prompter.SECTIONS},
+            "fallbacks": failed,
+        }
+
+    async def aprocess_structured(self, visit_summary: VisitSummary, use_cache=True) -> CodingResult:
+        """The coding persona's codes as a CodingResult (see app.structured_output).
+
+        Codes the note documents are answered locally as in local_answer; otherwise the model
+        answers through its schema-constrained output. ValueError when the model refuses, its
+        answer does not match the schema, or the model does not support structured output.
+        """
+        categories = self.prompter.code_categories
+        if categories is None:
+            raise AttributeError(f"{self.prompter_type} prompter does not produce structured codes.")
+        hints = None
+        if self.prompter.code_system is not None:
+            documented, hints = self._code_fast_path(visit_summary.get_text())
+            if documented is not None:
+                system = self.prompter.code_system
+                return CodingResult(self.prompter_type, categories, [
+                    CodeResult(code.code, code.description, f"Listed in the note's {system} codes section.",
+                               self._documented_category(system, code.code))
+                    for code in documented.by_system(system)
+                ])
+        if not self.model.supports_structured:
+            raise ValueError(f"{self.model.provider} models do not support structured output.")
+        return await self.model.acall_model_structured(self.sliced(visit_summary).get_text(), hints, use_cache=use_cache)
+
+    @staticmethod
+    def _documented_category(system: str, code: str) -> str:
+        if system != CPT:
+            return "Diagnosis"
+        if code.endswith("F"):
+            return "CPT II"
+        return "E&M" if code.startswith("992") else "Procedure"
+
+    async def aprocess_request(self, visit_summary: VisitSummary, additional_data=None, use_cache=True,
+                               hedge=False, patient_id=None, structured=False) -> dict:
+        """The persona's answer as /process, /jobs and the batch runner return it.
+
+        Picks the persona's path (lab email, adherence response, interactions, coding bundle,
+        structured codes, incremental chart summary, hedged or plain call) and returns
+        {"result": ...} with the persona's extra fields (email, interactions, sections, codes, ...).
+        A structured answer that is refused, does not match the schema or is not supported by the
+        model falls back to prose.
+        """
+        prompter_type = self.prompter_type
+        if prompter_type == 'lab_result_emailer':
+            result, email = await self.aprocess_summary_and_email(visit_summary, use_cache=use_cache)
+            return {"result": result, "email": email}
+        elif prompter_type == 'medication_adherance':
+            result = await self.aprocess_pretty_with_additional_data(visit_summary, additional_data, use_cache=use_cache)
+            return {"result": result, "adherence_response": additional_data}
+        elif prompter_type == 'clinical_decision_support':
+            if hedge:
+                result = await self.aprocess_hedged(visit_summary, additional_data, use_cache=use_cache)
+            else:
+                result = await self.aprocess_pretty_with_additional_data(visit_summary, additional_data, use_cache=use_cache)
+            interactions = [interaction.to_dict() for interaction in interaction_index.check(additional_data)]
+            return {"result": result, "current_medications": additional_data, "interactions": interactions}
+        elif isinstance(self.prompter, CodingBundlePrompter):
+            return await self.aprocess_coding_bundle(visit_summary, use_cache=use_cache)
+        elif (structured or structured_enabled()) and self.prompter.code_categories:
+            try:
+                coding = await self.aprocess_structured(visit_summary, use_cache=use_cache)
+                return {"result": coding.render(), "codes": [code.to_dict() for code in coding.codes]}
+            except ValueError as e:
+                # Refused or malformed structured answer: the persona answers in prose instead
+                log_event(logger, "structured_fallback", logging.WARNING, prompter_type=prompter_type, error=str(e))
+                return {"result": await self.aprocess_pretty(visit_summary, use_cache=use_cache), "codes": None}
+        elif patient_id and self.prompter.supports_incremental:
+            # Only the visits added since the patient's last summary are sent
+            return {"result": await self.aprocess_incremental(patient_id, visit_summary, use_cache=use_cache)}
+        elif hedge:
+            return {"result": await self.aprocess_hedged(visit_summary, use_cache=use_cache)}
+        else:
+            return {"result": await self.aprocess_pretty(visit_summary, use_cache=use_cache)}
+
+    @classmethod
+    async def aprocess_languages(cls, model_type: str, visit_summary: VisitSummary, languages: list, max_concurrency: int = 4, timeout: float = 60.0, use_cache=True) -> dict:
+        """Generate the patient summary in several languages concurrently.
+
+        At most `max_concurrency` provider calls run at once and each language gets its own
+        `timeout`, counted from the request including any wait for a free slot, so one slow
+        language comes back as a timeout instead of holding up the rest. Returns {language: {"status", "result", "error", "elapsed"}} in the requested order.
+        """
+        unknown = [language for language in languages if language not in SUMMARY_LANGUAGES]
+        if unknown:
+            raise ValueError(f"{', '.join(unknown)} - Invalid summary language. Choose from {', '.join(SUMMARY_LANGUAGES)}.")
+        if model_type not in registry.model_types():
+            raise ValueError("Invalid model type provided. Choose 'openai' or 'anthropic'.")
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1.")
+        if not timeout > 0:
+            raise ValueError("timeout must be a positive number of seconds.")
+        semaphore = asyncio.Semaphore(min(max_concurrency, len(languages)))
+
+        async def run(orchestrator):
+            async with semaphore:
+                return await orchestrator.aprocess_pretty(visit_summary, use_cache=use_cache)
+
+        async def summarize(language):
+            orchestrator = cls.get(model_type, SUMMARY_LANGUAGES[language])
+            started = time.perf_counter()
+            with track_request(orchestrator.prompter_type, model_type) as tracked:
+                try:
+                    result = await asyncio.wait_for(run(orchestrator), timeout)
+                    outcome = {"status": "ok", "result": result, "error": None}
+                except asyncio.TimeoutError as e:
+                    tracked.fail(e)
+                    outcome = {"status": "timeout", "result": None, "error": f"No response within {timeout} seconds."}
+                except Exception as e:
+                    tracked.fail(e)
+                    outcome = {"status": "error", "result": None, "error": str(e)}
+            outcome["elapsed"] = round(time.perf_counter() - started, 3)
+            return language, outcome
+
+        # dict.fromkeys drops duplicate languages but keeps the requested order
+        results = await asyncio.gather(*(summarize(language) for language in dict.fromkeys(languages)))
+        return dict(results)
+
+    # Streams the scrubbed result chunk by chunk (used by the SSE routes).
+    def astream_pretty(self, visit_summary: VisitSummary, additiona_data=None, use_cache=True, patient_id=None):
+        """The persona's answer as an async iterator of text chunks.
+
+        Follows aprocess_request: an incremental chart summary (patient_id) or a chart long
+        enough for aprocess_hierarchical takes several calls, so it comes as one chunk when
+        ready. ValueError for the coding bundle, whose answer is split into sections.
+        """
+        if isinstance(self.prompter, CodingBundlePrompter):
+            raise ValueError(f"{self.prompter_type} answers in sections and cannot be streamed; use /process.")
+        if patient_id and self.prompter.supports_incremental:
+            return self._awaited_chunk(self.aprocess_incremental, patient_id, visit_summary, use_cache=use_cache)
+        if additiona_data is None:
+            answer, additiona_data = self.local_answer(visit_summary.get_text())
+            if answer is not None:
+                return self._single_chunk(answer)
+            sliced = self.sliced(visit_summary)
+            if self._needs_hierarchical(sliced):
+                return self._awaited_chunk(self.aprocess_hierarchical, sliced, use_cache=use_cache, additiona_data=additiona_data)
+            return self.model.astream_model_and_scrub(sliced.get_text(), additiona_data, use_cache=use_cache)
+        return self.model.astream_model_and_scrub(self.sliced(visit_summary).get_text(), additiona_data, use_cache=use_cache)
+
+    @staticmethod
+    async def _single_chunk(text: str):
+        yield text
+
+    @staticmethod
+    async def _awaited_chunk(process, *args, **kwargs):
+        # The call only starts once the stream is read
+        yield await process(*args, **kwargs)
+
 if __name__ == "__main__":
     # Example usage
     visit_summary = VisitSummary(VisitSummary.get_sample_visits())
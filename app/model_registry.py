@@ -0,0 +1,132 @@
+import importlib
+import os
+import threading
+from app.openai_model import OpenAIModel
+from app.anthropic_model import AnthropicModel
+from app.ai_model import AIModel
+from app.prompt_generator import AbstractPromptGenerator, CPTCodePrompter, SummarizeChartPrompter, DiagnosisCodePrompter, LabResultEmailer, MedicationAdherencePrompter, FollowUpPrompter, HCCPrompter, SDOHPrompter, PreVisitPlanningPrompter, VisitSummaryPrompterSpanish, VisitSummaryPrompterMandarin, VisitSummaryPrompterEnglish, VisitSummaryPrompterKorean, VisitSummaryPrompterArabic, VisitSummaryPrompterBengali, PreVisitPlanningPrompter_Alternate, ClinicalDecisionSupportPrompter, CodingBundlePrompter
+
+# prompter_type (as posted by the forms) -> prompter class
+PROMPTER_CLASSES = {
+    'biller': CPTCodePrompter,
+    'summarizer': SummarizeChartPrompter,
+    'diagnosis': DiagnosisCodePrompter,
+    'lab_result_emailer': LabResultEmailer,
+    'medication_adherance': MedicationAdherencePrompter,
+    'follow_up': FollowUpPrompter,
+    'hcc_coder': HCCPrompter,
+    'sdoh_coder': SDOHPrompter,
+    'previsit_planner': PreVisitPlanningPrompter,
+    'previsit_planner_2': PreVisitPlanningPrompter_Alternate,
+    'spanish_summary': VisitSummaryPrompterSpanish,
+    'mandarin_summary': VisitSummaryPrompterMandarin,
+    'english_summary': VisitSummaryPrompterEnglish,
+    'korean_summary': VisitSummaryPrompterKorean,
+    'arabic_summary': VisitSummaryPrompterArabic,
+    'bengali_summary': VisitSummaryPrompterBengali,
+    'clinical_decision_support': ClinicalDecisionSupportPrompter,
+    'coding_bundle': CodingBundlePrompter,
+}
+
+# model_type -> AIModel subclass
+MODEL_CLASSES = {
+    'openai': OpenAIModel,
+    'anthropic': AnthropicModel,
+}
+
+
+class ModelRegistry:
+    """Maps prompter_type/model_type names to long-lived prompter and model instances.
+
+    Prompters and models hold no per-request state, so a single instance of each is
+    built once and shared by every request (and every thread) in the worker.
+    """
+
+    def __init__(self, prompter_classes: dict = None, model_classes: dict = None):
+        self._lock = threading.Lock()
+        self._prompter_classes = dict(PROMPTER_CLASSES if prompter_classes is None else prompter_classes)
+        self._model_classes = dict(MODEL_CLASSES if model_classes is None else model_classes)
+        self._prompters = {}
+        self._models = {}
+
+    def register_prompter(self, prompter_type: str, prompter_class, replace: bool = False):
+        """Register an extra persona, e.g. from a plugin module."""
+        if not issubclass(prompter_class, AbstractPromptGenerator):
+            raise TypeError(f"{prompter_class!r} must subclass AbstractPromptGenerator.")
+        with self._lock:
+            if prompter_type in self._prompter_classes and not replace:
+                raise ValueError(f"{prompter_type} - Prompter type is already registered.")
+            self._prompter_classes[prompter_type] = prompter_class
+            # Drop any instances built from a previous registration.
+            self._prompters.pop(prompter_type, None)
+            for key in [key for key in self._models if key[1] == prompter_type]:
+                del self._models[key]
+
+    def register_model(self, model_type: str, model_class, replace: bool = False):
+        if not issubclass(model_class, AIModel):
+            raise TypeError(f"{model_class!r} must subclass AIModel.")
+        with self._lock:
+            if model_type in self._model_classes and not replace:
+                raise ValueError(f"{model_type} - Model type is already registered.")
+            self._model_classes[model_type] = model_class
+            for key in [key for key in self._models if key[0] == model_type]:
+                del self._models[key]
+
+    def prompter_types(self) -> list:
+        return list(self._prompter_classes)
+
+    def model_types(self) -> list:
+        return list(self._model_classes)
+
+    def model_names(self) -> set:
+        """The provider model names of the registered models, including structured-output ones."""
+        names = set()
+        for model_class in self._model_classes.values():
+            names.update(name for name in (model_class.model_name, model_class.structured_model_name) if name)
+        return names
+
+    def get_prompter(self, prompter_type: str) -> AbstractPromptGenerator:
+        prompter = self._prompters.get(prompter_type)
+        if prompter is not None:
+            return prompter
+        with self._lock:
+            if prompter_type not in self._prompters:
+                prompter_class = self._prompter_classes.get(prompter_type)
+                if prompter_class is None:
+                    raise ValueError(f"{prompter_type} - Invalid prompter type provided.")
+                self._prompters[prompter_type] = prompter_class()
+            return self._prompters[prompter_type]
+
+    def get_model(self, model_type: str, prompter_type: str) -> AIModel:
+        key = (model_type, prompter_type)
+        model = self._models.get(key)
+        if model is not None:
+            return model
+        prompter = self.get_prompter(prompter_type)
+        model_class = self._model_classes.get(model_type)
+        if model_class is None:
+            raise ValueError("Invalid model type provided. Choose 'openai' or 'anthropic'.")
+        with self._lock:
+            if key not in self._models:
+                self._models[key] = model_class(prompter, prompter_type)
+            return self._models[key]
+
+    def build_all(self):
+        """Instantiate every registered prompter/model pair up front (called at worker startup)."""
+        for prompter_type in self.prompter_types():
+            for model_type in self.model_types():
+                self.get_model(model_type, prompter_type)
+
+    def load_plugins(self, module_names=None):
+        """Import plugin modules, which register extra prompters against `registry` on import.
+
+        Defaults to the comma separated module list in CLINICAL_INSIGHTS_PLUGINS.
+        """
+        if module_names is None:
+            module_names = [name.strip() for name in os.getenv("CLINICAL_INSIGHTS_PLUGINS", "").split(",") if name.strip()]
+        for module_name in module_names:
+            importlib.import_module(module_name)
+
+
+# Shared registry used by the orchestrator and the web app.
+registry = ModelRegistry()
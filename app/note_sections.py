@@ -0,0 +1,208 @@
+"""SOAP section parser used to send each persona only the parts of a note it reads.
+
+parse_note() splits a note into blocks in one pass over its lines: the header (patient and
+visit lines before the first section, and every "Visit 2: ..." / "Visit Date: ..." line) and
+the Subjective, Objective, Assessment, Plan, Medications and Labs sections under their usual
+headings ("Chief Complaint", "Physical Exam", "Assessment and Plan", "Next steps", ...).
+Medication and lab items are also collected from sub-headings such as "• Medications:" inside
+a section. Parsed notes are cached by the hash of their text.
+
+Prompters list the sections they read in `sections`; ParsedNote.select() keeps the header
+blocks and those sections. A note without any of them is sent whole, and headings this
+parser does not know stay part of the section above them, so slicing only ever leaves out
+sections that were recognized.
+"""
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+SUBJECTIVE, OBJECTIVE, ASSESSMENT, PLAN = "subjective", "objective", "assessment", "plan"
+MEDICATIONS, LABS = "medications", "labs"
+HEADER, HISTORY = "header", "history"
+# "Assessment and Plan" sections are selected for either
+ASSESSMENT_PLAN = "assessment_plan"
+
+_KINDS = {}
+for _kind, _titles in {
+    SUBJECTIVE: ("subjective", "chief complaint", "cc", "history of present illness", "hpi", "reason for visit",
+                 "interval history", "symptoms", "review of systems", "ros"),
+    OBJECTIVE: ("objective", "physical exam", "physical examination", "exam", "examination", "vitals", "vital signs"),
+    ASSESSMENT: ("assessment", "impression", "diagnosis", "diagnoses", "problem list", "active problems"),
+    PLAN: ("plan", "next steps", "follow-up", "follow up", "followup", "follow-ups", "follow-up plan", "recommendations",
+           "treatment plan", "care plan"),
+    ASSESSMENT_PLAN: ("assessment and plan", "assessment & plan", "assessment/plan", "a/p", "impression and plan"),
+    MEDICATIONS: ("medications", "current medications", "medication list", "meds", "active medications"),
+    LABS: ("labs", "lab results", "lab results for", "laboratory", "laboratory results", "lab work", "recent labs"),
+    HISTORY: ("past medical history", "pmh", "past surgical history", "surgical history", "family history",
+              "social history", "allergies", "immunizations"),
+    HEADER: ("visit date", "date of visit", "patient name"),
+}.items():
+    _KINDS.update(dict.fromkeys(_titles, _kind))
+
+# Only lines with a colon are looked at: "Plan:", "• Medications:", "## Assessment:", "**Plan:**", "Visit 2: ..."
+_HEADING = re.compile(
+    r"(?P<indent>[ \t]*)(?:(?P<markdown>#{1,6}[ \t]*|\*\*)|(?P<bullet>(?:[•*-]|\d+[.)])[ \t]*))?"
+    r"(?P<title>[A-Za-z][A-Za-z0-9 /&'-]*?)[ \t]*\**[ \t]*:\**[ \t]*(?P<rest>.*)"
+)
+_VISIT = re.compile(r"visit[ \t]+\d+\Z")
+_BULLET = re.compile(r"(?:[•*-]|\d+[.)])[ \t]*")
+
+
+def slicing_enabled() -> bool:
+    return os.getenv("NOTE_SECTIONS", "1").lower() in ("1", "true", "yes")
+
+
+class Section:
+    __slots__ = ("kind", "title", "lines")
+
+    def __init__(self, kind: str, title: str, lines: list):
+        self.kind = kind
+        self.title = title
+        self.lines = lines
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.lines).strip("\n")
+
+
+class ParsedNote:
+    __slots__ = ("blocks", "medications", "labs")
+
+    def __init__(self, blocks: list, medications: list, labs: list):
+        self.blocks = blocks
+        # Items of Medications / Labs sections and sub-headings, without their bullets
+        self.medications = medications
+        self.labs = labs
+
+    def _text(self, *kinds) -> str:
+        return "\n\n".join(block.text for block in self.blocks if block.kind in kinds)
+
+    @property
+    def subjective(self) -> str:
+        return self._text(SUBJECTIVE)
+
+    @property
+    def objective(self) -> str:
+        return self._text(OBJECTIVE)
+
+    @property
+    def assessment(self) -> str:
+        return self._text(ASSESSMENT, ASSESSMENT_PLAN)
+
+    @property
+    def plan(self) -> str:
+        return self._text(PLAN, ASSESSMENT_PLAN)
+
+    def select(self, kinds) -> str:
+        """The header blocks and the sections of `kinds`, in note order; None if the note has none of those sections."""
+        kinds = set(kinds)
+        if ASSESSMENT in kinds or PLAN in kinds:
+            kinds.add(ASSESSMENT_PLAN)
+        if not any(block.kind in kinds for block in self.blocks):
+            return None
+        return "\n\n".join(block.text for block in self.blocks if block.kind == HEADER or block.kind in kinds)
+
+
+def _item(line: str) -> str:
+    item = line.strip()
+    bullet = _BULLET.match(item)
+    return item[bullet.end():] if bullet else item
+
+
+def _parse(note: str) -> ParsedNote:
+    header = Section(HEADER, None, [])
+    blocks, lists = [header], {MEDICATIONS: [], LABS: []}
+    current, sub_list = header, None
+    for line in note.splitlines():
+        match = _HEADING.match(line) if ":" in line else None
+        if match is not None:
+            title = match.group("title").lower()
+            kind = _KINDS.get(title) or (HEADER if _VISIT.match(title) else None)
+            rest = match.group("rest").strip(" *")
+            if kind is not None and not match.group("indent") and not match.group("bullet"):
+                current = Section(kind, match.group("title"), [line])
+                blocks.append(current)
+                sub_list = lists.get(kind)
+                if sub_list is not None and rest:
+                    sub_list.append(rest)
+                continue
+            if not rest or kind in lists:
+                # A sub-heading inside the section ("• Medications:", "Complete Blood Count (CBC):")
+                current.lines.append(line)
+                sub_list = lists.get(kind, lists.get(current.kind))
+                if kind in lists and rest:
+                    sub_list.append(rest)
+                continue
+        current.lines.append(line)
+        if not line.strip():
+            # Medication and lab sub-lists inside another section end at a blank line
+            sub_list = lists.get(current.kind)
+        elif sub_list is not None:
+            sub_list.append(_item(line))
+    return ParsedNote([block for block in blocks if block.text], lists[MEDICATIONS], lists[LABS])
+
+
+class _NoteCache:
+    """Parsed notes by the SHA-256 of their text; a note is parsed once for every persona that reads it."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, note: str) -> ParsedNote:
+        key = hashlib.sha256(note.encode("utf-8")).digest()
+        with self._lock:
+            parsed = self._entries.get(key)
+            if parsed is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return parsed
+            self._misses += 1
+        parsed = _parse(note)
+        with self._lock:
+            self._entries[key] = parsed
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return parsed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "hits": self._hits, "misses": self._misses}
+
+
+_cache = _NoteCache(int(os.getenv("NOTE_CACHE_SIZE", "256")))
+
+
+def parse_note(note: str) -> ParsedNote:
+    return _cache.get(note)
+
+
+class SectionStats:
+    """Estimated note tokens per persona with the whole note and with only its sections."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, prompter_type: str, tokens_before: int, tokens_after: int):
+        with self._lock:
+            stats = self._stats.setdefault(prompter_type, {"requests": 0, "sliced": 0, "tokens_before": 0, "tokens_after": 0})
+            stats["requests"] += 1
+            stats["sliced"] += tokens_after < tokens_before
+            stats["tokens_before"] += tokens_before
+            stats["tokens_after"] += tokens_after
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            snapshot = {prompter_type: dict(stats) for prompter_type, stats in self._stats.items()}
+        for stats in snapshot.values():
+            stats["reduction"] = round(1 - stats["tokens_after"] / stats["tokens_before"], 4) if stats["tokens_before"] else 0.0
+        return {"personas": snapshot, "cache": _cache.stats()}
+
+
+section_stats = SectionStats()
@@ -1,58 +1,187 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import os
+import threading
+from app import transport
 from app.ai_model import AIModel
+from app.metrics import track_upstream
+from app.structured_output import SCHEMA_NAME
 
 
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-client.organization = os.getenv('OPENAI_ORG_ID')
+# Clients are created on first use so importing this module never needs keys or network access.
+# SDK retries are off; app.rate_limiter retries with backoff shared across the worker.
+# Both SDKs share the pooled keep-alive connections of app.transport.
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+def get_client() -> OpenAI:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'), organization=os.getenv('OPENAI_ORG_ID'), max_retries=0,
+                                 http_client=transport.get_client())
+    return _client
+
+def get_async_client() -> AsyncOpenAI:
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                _async_client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'), organization=os.getenv('OPENAI_ORG_ID'), max_retries=0,
+                                            http_client=transport.get_async_client())
+    return _async_client
+
+# Fine tuned followup-assistant-5a model and the system prompt it was trained with
+FOLLOWUP_MODEL = "ft:gpt-4o-mini-2024-07-18:mdland-international:followup-assitance-5a:APTjpmCz"
+FOLLOWUP_SYSTEM_PROMPT = "Provide a JSON array where each object includes 'followup_details' and 'due_date' for each item in the patient's 'Next Steps' section. For each item, if a due date is specified, calculate it based on the visit date and include it in 'due_date' in mm/dd/yyyy format. If no specific time frame is given, set 'due_date' to 'n/a'."
 
 class OpenAIModel(AIModel):
+    provider = "openai"
+    model_name = "gpt-4-turbo" #"gpt-4o-mini"
+    supports_structured = True
+    # json_schema response formats need gpt-4o-2024-08-06 or later
+    structured_model_name = os.getenv("OPENAI_STRUCTURED_MODEL", "gpt-4o-2024-08-06")
+
+    @staticmethod
+    def build_messages(system_prompt, user_prompt) -> list:
+        # OpenAI caches prompt prefixes automatically. The system prompt and the prompter's
+        # static instructions come first and the note comes last, so that prefix is the same
+        # on every call for a persona.
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    def record_response_usage(self, usage):
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = (details.cached_tokens or 0) if details else 0
+        self.record_usage(usage.prompt_tokens, usage.completion_tokens, cached_tokens)
+
     def get_summary(self, system_prompt, user_prompt) -> str:
         # The logic that was originally in openai_utils.py for calling OpenAI
         # Example of calling OpenAI API
         # Format the messages for the ChatCompletion API
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
+        messages = self.build_messages(system_prompt, user_prompt)
 
         # Use the gpt-3.5-turbo model for chat-based completion
-        response = client.chat.completions.create(
-            model= "gpt-4-turbo", #"gpt-4o-mini" ,
+        response = self.limiter().call(lambda: get_client().chat.completions.create(
+            model=self.model_name,
             messages=messages,
-            temperature=0.5,
-            max_tokens=500,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
             n=1
-        )
+        ), self.estimate_request_tokens(system_prompt, user_prompt, self.max_tokens), self.prompter_type)
+
+        self.record_response_usage(response.usage)
 
         # Extract the response text
         summary = response.choices[0].message.content.strip()
         return summary
+
+    async def aget_summary(self, system_prompt, user_prompt) -> str:
+        messages = self.build_messages(system_prompt, user_prompt)
+
+        response = await self.limiter().acall(lambda: get_async_client().chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            n=1
+        ), self.estimate_request_tokens(system_prompt, user_prompt, self.max_tokens), self.prompter_type)
+
+        self.record_response_usage(response.usage)
+
+        summary = response.choices[0].message.content.strip()
+        return summary
+
+    async def aget_structured(self, system_prompt, user_prompt, schema: dict) -> str:
+        messages = self.build_messages(system_prompt, user_prompt)
+
+        response = await self.limiter(self.structured_model_name).acall(lambda: get_async_client().chat.completions.create(
+            model=self.structured_model_name,
+            messages=messages,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            n=1,
+            response_format={"type": "json_schema", "json_schema": {"name": SCHEMA_NAME, "strict": True, "schema": schema}}
+        ), self.estimate_request_tokens(system_prompt, user_prompt, self.max_tokens), self.prompter_type)
+
+        self.record_response_usage(response.usage)
+
+        message = response.choices[0].message
+        if getattr(message, "refusal", None):
+            raise ValueError(f"The model refused to answer: {message.refusal}")
+        return message.content
+
+    async def astream_summary(self, system_prompt, user_prompt):
+        messages = self.build_messages(system_prompt, user_prompt)
+
+        # Streams hold a slot but are not retried, since part of the answer may already be relayed
+        async with self.limiter().aslot(self.estimate_request_tokens(system_prompt, user_prompt, self.max_tokens)):
+            stream = await get_async_client().chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens,
+                n=1,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            async for chunk in stream:
+                # The final chunk carries the usage and no choices
+                if chunk.usage:
+                    self.record_response_usage(chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
     
     def get_followup(self, user_prompt) -> str:
         
         # Example of calling OpenAI API
         # Format the messages for the ChatCompletion API
         messages = [
-            {"role": "system", "content": "Provide a JSON array where each object includes 'followup_details' and 'due_date' for each item in the patient's 'Next Steps' section. For each item, if a due date is specified, calculate it based on the visit date and include it in 'due_date' in mm/dd/yyyy format. If no specific time frame is given, set 'due_date' to 'n/a'."},
+            {"role": "system", "content": FOLLOWUP_SYSTEM_PROMPT},
             {"role": "user", "content": user_prompt}
         ]
 
         # Use the fine tuned followup-assistant-5a model for chat-based completion
-        response = client.chat.completions.create(
-            model="ft:gpt-4o-mini-2024-07-18:mdland-international:followup-assitance-5a:APTjpmCz",
-            messages=messages,
-            temperature=0.5,
-            n=1,
-            #temperature=1,
-            max_tokens=2048,
-            top_p=1,
-            frequency_penalty=0,
-            presence_penalty=0
-        )
+        with track_upstream(self.prompter_type, self.provider):
+            response = self.limiter(FOLLOWUP_MODEL).call(lambda: get_client().chat.completions.create(
+                model=FOLLOWUP_MODEL,
+                messages=messages,
+                temperature=0.5,
+                n=1,
+                #temperature=1,
+                max_tokens=2048,
+                top_p=1,
+                frequency_penalty=0,
+                presence_penalty=0
+            ), self.estimate_request_tokens(FOLLOWUP_SYSTEM_PROMPT, user_prompt, 2048), self.prompter_type)
+        self.record_response_usage(response.usage)
         return response
-    
-follow_up_note = """
+
+    async def aget_followup(self, user_prompt):
+        messages = [
+            {"role": "system", "content": FOLLOWUP_SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ]
+
+        with track_upstream(self.prompter_type, self.provider):
+            response = await self.limiter(FOLLOWUP_MODEL).acall(lambda: get_async_client().chat.completions.create(
+                model=FOLLOWUP_MODEL,
+                messages=messages,
+                temperature=0.5,
+                n=1,
+                max_tokens=2048,
+                top_p=1,
+                frequency_penalty=0,
+                presence_penalty=0
+            ), self.estimate_request_tokens(FOLLOWUP_SYSTEM_PROMPT, user_prompt, 2048), self.prompter_type)
+        self.record_response_usage(response.usage)
+        return response
+
+if __name__ == "__main__":
+    follow_up_note = """
 Date of Visit: 01/01/2024
 Next steps:
 - Return for annual wellness check in 1 year and  3 months.
@@ -60,6 +189,6 @@ Next steps:
 - Return for blood pressure check in a quarter
 - Maintain a healthy weight.
 """
-openai_client = OpenAIModel(None)
-response = openai_client.get_followup(follow_up_note)
-print(response.choices[0].message.content)
\ No newline at end of file
+    openai_client = OpenAIModel(None)
+    response = openai_client.get_followup(follow_up_note)
+    print(response.choices[0].message.content)
@@ -1,8 +1,5 @@
-from openai import OpenAI
-import os
-
-
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+# Shared lazily created client, so importing this module makes no API calls
+from app.openai_model import get_client
 
 
 # Function to create the prompt for summarization
@@ -76,7 +73,7 @@ def summarize_patient_notes(system_prompt, user_prompt):
     ]
 
     # Use the gpt-3.5-turbo model for chat-based completion
-    response = client.chat.completions.create(
+    response = get_client().chat.completions.create(
         model= "gpt-4-turbo", #"gpt-4o-mini" ,
         messages=messages,
         temperature=0.5,
@@ -327,22 +324,23 @@ Plan:
 """
 
 
-# Call the summarization function
-# summary = generate_summary_notes(text)
-# #print(summary)
+if __name__ == "__main__":
+    # Call the summarization function
+    # summary = generate_summary_notes(text)
+    # #print(summary)
 
-# # Convert the summary to ASCII-friendly format
-# ascii_summary = convert_to_ascii(summary)
+    # # Convert the summary to ASCII-friendly format
+    # ascii_summary = convert_to_ascii(summary)
 
-# # Output the ASCII-formatted summary
-# print(ascii_summary)
+    # # Output the ASCII-formatted summary
+    # print(ascii_summary)
 
-# Call the CPT II Code Generation Function
-response = generate_CPT_Codes(visit_1)
-print(convert_to_ascii(response))
+    # Call the CPT II Code Generation Function
+    response = generate_CPT_Codes(visit_1)
+    print(convert_to_ascii(response))
 
-# response = generate_CPT_Codes(visit_2)
-# print(convert_to_ascii(response))
+    # response = generate_CPT_Codes(visit_2)
+    # print(convert_to_ascii(response))
 
-# response = generate_CPT_Codes(visit_3)
-# print(convert_to_ascii(response))
\ No newline at end of file
+    # response = generate_CPT_Codes(visit_3)
+    # print(convert_to_ascii(response))
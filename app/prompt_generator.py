@@ -1,14 +1,85 @@
-from abc import ABC, abstractmethod
+import re
+from abc import ABC
+from app.interaction_index import format_findings, interaction_index
+from app.structured_output import STRUCTURED_INSTRUCTION
 
 class AbstractPromptGenerator(ABC):
-    @abstractmethod
+    # Seconds a cached completion for this persona stays valid; None uses the cache default.
+    cache_ttl = None
+
+    # Output token limit for this persona; None uses the model default.
+    max_tokens = None
+
+    # Whether long charts may be summarized in groups and then combined (see ModelOrchestrator.aprocess_hierarchical).
+    supports_hierarchical = False
+
+    # Code system (app.code_extractor) whose codes listed in the note can answer this persona or serve as hints.
+    code_system = None
+
+    # Whether follow-up due dates resolved by app.followup_engine are passed in as additional_data.
+    resolves_followup_dates = False
+
+    # Whether a patient's summary can be updated from the previous one and only the new visits (see app.chart_state).
+    supports_incremental = False
+
+    # Note sections (app.note_sections) this persona reads; None sends the whole note.
+    sections = None
+
+    # Categories of a coding persona's structured answer (app.structured_output); None if it has no structured mode.
+    code_categories = None
+
+    # Stand-in note used to find where the patient data starts in the user prompt.
+    _NOTE_PROBE = "\x00NOTE\x00"
+
+    def prompt_parts(self, note: str, additional_data: str = None) -> tuple:
+        """(system parts, user parts): the named pieces of the two prompts, as (name, text) in prompt order.
+
+        Token accounting (app.token_accounting) reports tokens per part. A prompter that only
+        overrides generate_prompt is reported as one part per prompt.
+        """
+        if type(self).generate_prompt is AbstractPromptGenerator.generate_prompt:
+            raise NotImplementedError(f"{type(self).__name__} must implement prompt_parts or generate_prompt.")
+        system_prompt, user_prompt = self.generate_prompt(note, additional_data)
+        return [("system_prompt", system_prompt)], [("user_prompt", user_prompt)]
+
     def generate_prompt(self, note: str, additional_data: str = None) -> tuple:
-        """Abstract method to generate the system prompt and user prompt pair for the model."""
-        pass
+        """The system prompt and user prompt pair for the model, joined from prompt_parts."""
+        system_parts, user_parts = self.prompt_parts(note, additional_data)
+        return "".join(text for _, text in system_parts), "".join(text for _, text in user_parts)
+
+    def generate_structured_prompt(self, note: str, additional_data: str = None) -> tuple:
+        """generate_prompt for structured mode: the system prompt asks for the code list instead of prose."""
+        system_prompt, user_prompt = self.generate_prompt(note, additional_data)
+        return system_prompt + STRUCTURED_INSTRUCTION.format(categories=", ".join(self.code_categories)), user_prompt
+
+    def static_user_prefix(self) -> str:
+        """The part of the user prompt in front of the note; it is identical on every call.
+
+        Together with the system prompt this is the prefix providers can cache.
+        """
+        prefix = getattr(self, "_static_user_prefix", None)
+        if prefix is None:
+            _, user_prompt = self.generate_prompt(self._NOTE_PROBE)
+            index = user_prompt.find(self._NOTE_PROBE)
+            prefix = user_prompt[:index] if index > 0 else ""
+            self._static_user_prefix = prefix
+        return prefix
+
+    def split_user_prompt(self, user_prompt: str) -> tuple:
+        """Split a generated user prompt into its (static prefix, per-note remainder)."""
+        prefix = self.static_user_prefix()
+        if prefix and user_prompt.startswith(prefix):
+            return prefix, user_prompt[len(prefix):]
+        return "", user_prompt
     
 
 class CPTCodePrompter(AbstractPromptGenerator):
-    def generate_prompt(self, note: str, additional_data: str = None) -> tuple:
+    # Code recommendations only depend on the note, so they can be reused for a day.
+    cache_ttl = 24 * 60 * 60
+    code_system = "CPT"
+    code_categories = ("E&M", "Procedure", "Referral", "CPT II")
+
+    def prompt_parts(self, note: str, additional_data: str = None) -> tuple:
         # System prompt components (for model behavior and boundaries)
         persona = (
             "You are an expert in Ambulatory Patient Care Billing and Coding, specializing in identifying appropriate "
@@ -46,15 +117,21 @@ class CPTCodePrompter(AbstractPromptGenerator):
         )
         tone = "The tone should be professional, clear, and concise.\n"
         data = f"Text to generate CPT Codes from: {note}"
+        # Codes the note already lists (see ModelOrchestrator.local_answer)
+        if additional_data:
+            data += f"\n\n{additional_data}"
 
-        # Combine prompts
-        user_prompt = data_format + follow_up + audience + tone + data
-        system_prompt = persona + instruction + context
+        system_parts = [("persona", persona), ("instruction", instruction), ("context", context)]
+        user_parts = [("data_format", data_format), ("follow_up", follow_up), ("audience", audience), ("tone", tone), ("data", data)]
 
-        return system_prompt, user_prompt
+        return system_parts, user_parts
     
 class DiagnosisCodePrompter(AbstractPromptGenerator):
-    def generate_prompt(self, note, additional_data: str = None) -> tuple:
+    cache_ttl = 24 * 60 * 60
+    code_system = "ICD-10"
+    code_categories = ("Diagnosis", "HCC", "SDOH")
+
+    def prompt_parts(self, note, additional_data: str = None) -> tuple:
         # System prompt components (for model behavior and boundaries)
         persona = (
             "You are an expert in Ambulatory Patient Care Billing and Coding, specializing in breaking down patient visit notes "
@@ -88,16 +165,20 @@ class DiagnosisCodePrompter(AbstractPromptGenerator):
         )
         tone = "The tone should be professional, concise, and clear.\n"
         data = f"Text to recommend ICD-10 From: {note}"
+        if additional_data:
+            data += f"\n\n{additional_data}"
 
-        # Combine prompts
-        user_prompt = data_format + follow_up + audience + tone + data
-        system_prompt = persona + instruction + context
+        system_parts = [("persona", persona), ("instruction", instruction), ("context", context)]
+        user_parts = [("data_format", data_format), ("follow_up", follow_up), ("audience", audience), ("tone", tone), ("data", data)]
 
-        return system_prompt, user_prompt
+        return system_parts, user_parts
     
 
 class SummarizeChartPrompter(AbstractPromptGenerator):
-    def generate_prompt(self, note, additional_data: str = None) -> tuple:
+    supports_hierarchical = True
+    supports_incremental = True
+
+    def prompt_parts(self, note, additional_data: str = None) -> tuple:
         # System prompt (for model behavior and boundaries)
         persona = (
             "You are an expert in Large Language Models and clinical data analysis, specializing in summarizing "
@@ -130,14 +211,15 @@ class SummarizeChartPrompter(AbstractPromptGenerator):
         tone = "The tone should be professional, clear, and concise.\n"
         data = f"Patient Visit Note to summarize: {note}"
 
-        # Combine prompts
-        user_prompt = data_format + follow_up + audience + tone + data
-        system_prompt = persona + instruction + context
+        system_parts = [("persona", persona), ("instruction", instruction), ("context", context)]
+        user_parts = [("data_format", data_format), ("follow_up", follow_up), ("audience", audience), ("tone", tone), ("data", data)]
 
-        return system_prompt, user_prompt
+        return system_parts, user_parts
     
 class LabResultEmailer(AbstractPromptGenerator):
-    def generate_prompt(self, lab_results, additional_data: str = None) -> tuple:
+    sections = ("labs", "objective")
+
+    def prompt_parts(self, lab_results, additional_data: str = None) -> tuple:
         # System prompt components
         persona = (
             "You are an expert in clinical data analysis, specializing in summarizing lab results in a concise, high-level "
@@ -159,11 +241,10 @@ class LabResultEmailer(AbstractPromptGenerator):
         )
         data = f"Lab Results to summarize: {lab_results}"
 
-        # Combine system and user prompts
-        system_prompt = persona + instruction + context
-        user_prompt = data_format + data
+        system_parts = [("persona", persona), ("instruction", instruction), ("context", context)]
+        user_parts = [("data_format", data_format), ("data", data)]
 
-        return system_prompt, user_prompt
+        return system_parts, user_parts
 
     def generate_email(self, summary: str) -> str:
         """Generates a brief email summarizing lab results trends."""
@@ -179,7 +260,9 @@ class LabResultEmailer(AbstractPromptGenerator):
         return email_body
     
 class MedicationAdherencePrompter(AbstractPromptGenerator):
-    def generate_prompt(self, note: str, additional_data: str = None) -> tuple:
+    sections = ("medications", "assessment", "plan")
+
+    def prompt_parts(self, note: str, additional_data: str = None) -> tuple:
          # Use additional_data (medication adherence responses) if available
         medication_question = additional_data if additional_data else "No additional medication data provided."
 
@@ -211,15 +294,18 @@ class MedicationAdherencePrompter(AbstractPromptGenerator):
         tone = "The tone should be supportive, simple, and clear at a 6th-grade reading level.\n"
         data = f"Patient Visit Note: {note}\nRecent Medication Question Response: {medication_question}"
 
-        # Combine prompts
-        user_prompt = data_format + follow_up + tone + data
-        system_prompt = persona + instruction + context
+        system_parts = [("persona", persona), ("instruction", instruction), ("context", context)]
+        user_parts = [("data_format", data_format), ("follow_up", follow_up), ("tone", tone), ("data", data)]
 
-        return system_prompt, user_prompt
+        return system_parts, user_parts
     
 
 class FollowUpPrompter(AbstractPromptGenerator):
-    def generate_prompt(self, notes, additional_data: str = None) -> tuple:
+    supports_hierarchical = True
+    resolves_followup_dates = True
+    sections = ("plan",)
+
+    def prompt_parts(self, notes, additional_data: str = None) -> tuple:
         # System prompt components (for model behavior and boundaries)
         persona = (
             "You are an expert medical assistant specializing in identifying patient follow-up needs from multiple visit notes. "
@@ -258,15 +344,20 @@ class FollowUpPrompter(AbstractPromptGenerator):
         
         # Formatting the provided notes for the prompt
         data = f"Visit Notes to process: {notes}"
+        # Due dates worked out locally (see ModelOrchestrator.local_answer)
+        if additional_data:
+            data += f"\n\n{additional_data}"
 
-        # Combine prompts
-        user_prompt = data_format + follow_up + audience + tone + data
-        system_prompt = persona + instruction + context
+        system_parts = [("persona", persona), ("instruction", instruction), ("context", context)]
+        user_parts = [("data_format", data_format), ("follow_up", follow_up), ("audience", audience), ("tone", tone), ("data", data)]
 
-        return system_prompt, user_prompt
+        return system_parts, user_parts
     
 class HCCPrompter(AbstractPromptGenerator):
-    def generate_prompt(self, note, additional_data: str = None) -> tuple:
+    cache_ttl = 24 * 60 * 60
+    code_categories = ("HCC",)
+
+    def prompt_parts(self, note, additional_data: str = None) -> tuple:
         # System prompt components (for model behavior and boundaries)
         persona = (
             "You are an expert in Hierarchical Condition Category (HCC) coding and ICD-10 coding for Ambulatory Patient Care. "
@@ -300,14 +391,16 @@ class HCCPrompter(AbstractPromptGenerator):
         tone = "The tone should be professional, concise, and clear.\n"
         data = f"Text to analyze: {note}"
 
-        # Combine prompts
-        user_prompt = data_format + follow_up + audience + tone + data
-        system_prompt = persona + instruction + context
+        system_parts = [("persona", persona), ("instruction", instruction), ("context", context)]
+        user_parts = [("data_format", data_format), ("follow_up", follow_up), ("audience", audience), ("tone", tone), ("data", data)]
 
-        return system_prompt, user_prompt
+        return system_parts, user_parts
     
 class SDOHPrompter(AbstractPromptGenerator):
-    def generate_prompt(self, note, additional_data: str = None) -> tuple:
+    cache_ttl = 24 * 60 * 60
+    code_categories = ("Housing", "Food", "Economic", "Employment", "Education", "Access to care", "Social support", "Other")
+
+    def prompt_parts(self, note, additional_data: str = None) -> tuple:
         # System prompt components (for model behavior and boundaries)
         persona = (
             "You are an expert in Social Determinants of Health (SDOH) and ICD-10 coding for Ambulatory Patient Care. "
@@ -344,15 +437,17 @@ class SDOHPrompter(AbstractPromptGenerator):
         # Formatting the provided notes for the prompt
         data = f"Visit Notes to process: {note}"
 
-        # Combine prompts
-        user_prompt = data_format + follow_up + audience + tone + data
-        system_prompt = persona + instruction + context
+        system_parts = [("persona", persona), ("instruction", instruction), ("context", context)]
+        user_parts = [("data_format", data_format), ("follow_up", follow_up), ("audience", audience), ("tone", tone), ("data", data)]
 
-        return system_prompt, user_prompt
+        return system_parts, user_parts
     
 
 class PreVisitPlanningPrompter(AbstractPromptGenerator):
-    def generate_prompt(self, note: str, additional_data: str = None) -> tuple:
+    supports_hierarchical = True
+    supports_incremental = True
+
+    def prompt_parts(self, note: str, additional_data: str = None) -> tuple:
         # System prompt components (for model behavior and boundaries)
         persona = (
             "You are an expert medical assistant specializing in pre-visit planning. Your role is to analyze a patient's "
@@ -397,15 +492,16 @@ class PreVisitPlanningPrompter(AbstractPromptGenerator):
         tone = "The tone should be professional, concise, and action-oriented.\n"
         data = f"Patient EHR Data to process: {note}"
 
-        # Combine prompts
-        user_prompt = data_format + follow_up + audience + tone + data
-        system_prompt = persona + instruction + context
+        system_parts = [("persona", persona), ("instruction", instruction), ("context", context)]
+        user_parts = [("data_format", data_format), ("follow_up", follow_up), ("audience", audience), ("tone", tone), ("data", data)]
 
-        return system_prompt, user_prompt
+        return system_parts, user_parts
     
 
 class VisitSummaryPrompterEnglish(AbstractPromptGenerator):
-    def generate_prompt(self, note: str, additional_data: str = None) -> tuple:
+    resolves_followup_dates = True
+
+    def prompt_parts(self, note: str, additional_data: str = None) -> tuple:
         # System prompt components (for model behavior and boundaries)
         persona = (
             "You are an expert medical assistant specializing in generating patient visit summaries in English, tailored for patients. "
@@ -453,16 +549,19 @@ class VisitSummaryPrompterEnglish(AbstractPromptGenerator):
         
         tone = "The tone should be friendly, clear, and supportive.\n"
         data = f"Patient visit notes to summarize: {note}"
-    
-        # Combine prompts
-        user_prompt = data_format + follow_up + audience + tone + data
-        system_prompt = persona + instruction + context
-    
-        return system_prompt, user_prompt
+        if additional_data:
+            data += f"\n\n{additional_data}"
+
+        system_parts = [("persona", persona), ("instruction", instruction), ("context", context)]
+        user_parts = [("data_format", data_format), ("follow_up", follow_up), ("audience", audience), ("tone", tone), ("data", data)]
+
+        return system_parts, user_parts
     
 
 class VisitSummaryPrompterSpanish(AbstractPromptGenerator):
-    def generate_prompt(self, note: str, additional_data: str = None) -> tuple:
+    resolves_followup_dates = True
+
+    def prompt_parts(self, note: str, additional_data: str = None) -> tuple:
         # System prompt components (for model behavior and boundaries)
         persona = (
             "Eres un asistente médico experto especializado en generar resúmenes de visitas médicas en español, adaptados para los pacientes. "
@@ -499,16 +598,19 @@ class VisitSummaryPrompterSpanish(AbstractPromptGenerator):
         
         tone = "El tono debe ser amigable, claro y de apoyo.\n"
         data = f"Notas de la visita del paciente a resumir: {note}"
+        if additional_data:
+            data += f"\n\n{additional_data}"
 
-        # Combine prompts
-        user_prompt = data_format + follow_up + audience + tone + data
-        system_prompt = persona + instruction + context
+        system_parts = [("persona", persona), ("instruction", instruction), ("context", context)]
+        user_parts = [("data_format", data_format), ("follow_up", follow_up), ("audience", audience), ("tone", tone), ("data", data)]
 
-        return system_prompt, user_prompt
+        return system_parts, user_parts
     
 
 class VisitSummaryPrompterMandarin(AbstractPromptGenerator):
-    def generate_prompt(self, note: str, additional_data: str = None) -> tuple:
+    resolves_followup_dates = True
+
+    def prompt_parts(self, note: str, additional_data: str = None) -> tuple:
         # System prompt components (for model behavior and boundaries)
         persona = (
             "您是一位专注于为患者生成中文就诊摘要的专业医疗助理。"
@@ -545,15 +647,18 @@ class VisitSummaryPrompterMandarin(AbstractPromptGenerator):
         
         tone = "语气应友好、清晰、支持性强。\n"
         data = f"需要总结的患者就诊记录：{note}"
+        if additional_data:
+            data += f"\n\n{additional_data}"
 
-        # Combine prompts
-        user_prompt = data_format + follow_up + audience + tone + data
-        system_prompt = persona + instruction + context
+        system_parts = [("persona", persona), ("instruction", instruction), ("context", context)]
+        user_parts = [("data_format", data_format), ("follow_up", follow_up), ("audience", audience), ("tone", tone), ("data", data)]
 
-        return system_prompt, user_prompt
+        return system_parts, user_parts
     
 class VisitSummaryPrompterKorean(AbstractPromptGenerator):
-    def generate_prompt(self, note: str, additional_data: str = None) -> tuple:
+    resolves_followup_dates = True
+
+    def prompt_parts(self, note: str, additional_data: str = None) -> tuple:
         # System prompt components (for model behavior and boundaries)
         persona = (
             "You are an expert medical assistant specializing in generating patient visit summaries in Korean, tailored for patients. "
@@ -591,16 +696,19 @@ class VisitSummaryPrompterKorean(AbstractPromptGenerator):
         
         tone = "The tone should be friendly, clear, and supportive.\n"
         data = f"Patient visit notes to summarize: {note}"
+        if additional_data:
+            data += f"\n\n{additional_data}"
 
-        # Combine prompts
-        user_prompt = data_format + follow_up + audience + tone + data
-        system_prompt = persona + instruction + context
+        system_parts = [("persona", persona), ("instruction", instruction), ("context", context)]
+        user_parts = [("data_format", data_format), ("follow_up", follow_up), ("audience", audience), ("tone", tone), ("data", data)]
 
-        return system_prompt, user_prompt
+        return system_parts, user_parts
     
 
 class VisitSummaryPrompterArabic(AbstractPromptGenerator):
-    def generate_prompt(self, note: str, additional_data: str = None) -> tuple:
+    resolves_followup_dates = True
+
+    def prompt_parts(self, note: str, additional_data: str = None) -> tuple:
         # System prompt components (for model behavior and boundaries)
         persona = (
             "You are an expert medical assistant specializing in generating patient visit summaries in Arabic, tailored for patients. "
@@ -638,15 +746,18 @@ class VisitSummaryPrompterArabic(AbstractPromptGenerator):
         
         tone = "The tone should be friendly, clear, and supportive.\n"
         data = f"Patient visit notes to summarize: {note}"
+        if additional_data:
+            data += f"\n\n{additional_data}"
 
-        # Combine prompts
-        user_prompt = data_format + follow_up + audience + tone + data
-        system_prompt = persona + instruction + context
+        system_parts = [("persona", persona), ("instruction", instruction), ("context", context)]
+        user_parts = [("data_format", data_format), ("follow_up", follow_up), ("audience", audience), ("tone", tone), ("data", data)]
 
-        return system_prompt, user_prompt
+        return system_parts, user_parts
     
 class VisitSummaryPrompterBengali(AbstractPromptGenerator):
-    def generate_prompt(self, note: str, additional_data: str = None) -> tuple:
+    resolves_followup_dates = True
+
+    def prompt_parts(self, note: str, additional_data: str = None) -> tuple:
         # System prompt components (for model behavior and boundaries)
         persona = (
             "You are an expert medical assistant specializing in generating patient visit summaries in Bengali, tailored for patients. "
@@ -684,16 +795,17 @@ class VisitSummaryPrompterBengali(AbstractPromptGenerator):
         
         tone = "The tone should be friendly, clear, and supportive.\n"
         data = f"Patient visit notes to summarize: {note}"
+        if additional_data:
+            data += f"\n\n{additional_data}"
 
-        # Combine prompts
-        user_prompt = data_format + follow_up + audience + tone + data
-        system_prompt = persona + instruction + context
+        system_parts = [("persona", persona), ("instruction", instruction), ("context", context)]
+        user_parts = [("data_format", data_format), ("follow_up", follow_up), ("audience", audience), ("tone", tone), ("data", data)]
 
-        return system_prompt, user_prompt
+        return system_parts, user_parts
     
 
 class PreVisitPlanningPrompter_Alternate(AbstractPromptGenerator):
-    def generate_prompt(self, note: str, additional_data: str = None) -> tuple:
+    def prompt_parts(self, note: str, additional_data: str = None) -> tuple:
         # System prompt components (for model behavior and boundaries)
         persona = (
             "You are an expert medical assistant specializing in pre-visit planning for patient appointments. "
@@ -740,15 +852,14 @@ class PreVisitPlanningPrompter_Alternate(AbstractPromptGenerator):
         tone = "The tone should be professional, concise, and actionable.\n"
         data = f"Patient Chart Data: {note}"
 
-        # Combine prompts
-        user_prompt = data_format + follow_up + audience + tone + data
-        system_prompt = persona + instruction + context
+        system_parts = [("persona", persona), ("instruction", instruction), ("context", context)]
+        user_parts = [("data_format", data_format), ("follow_up", follow_up), ("audience", audience), ("tone", tone), ("data", data)]
 
-        return system_prompt, user_prompt
+        return system_parts, user_parts
 
 
 class ClinicalDecisionSupportPrompter(AbstractPromptGenerator):
-    def generate_prompt(self, note: str, additional_data: str = None) -> tuple:
+    def prompt_parts(self, note: str, additional_data: str = None) -> tuple:
         # System prompt components (for model behavior and boundaries)
         persona = (
             "You are an expert clinical decision support specialist with deep knowledge of pharmacology, clinical guidelines, "
@@ -807,9 +918,113 @@ class ClinicalDecisionSupportPrompter(AbstractPromptGenerator):
         # Format the clinical data
         medications_data = additional_data if additional_data else "No current medications provided."
         data = f"Patient Visit Notes: {note}\n\nCurrent Medications: {medications_data}"
+        # Interactions known to the local database are handed over rather than re-derived
+        findings = format_findings(interaction_index.check(additional_data)) if additional_data else ""
+        if findings:
+            data += "\n\n" + findings
+
+        system_parts = [("persona", persona), ("instruction", instruction), ("context", context)]
+        user_parts = [("data_format", data_format), ("follow_up", follow_up), ("audience", audience), ("tone", tone), ("data", data)]
+
+        return system_parts, user_parts
+
+class CodingBundlePrompter(AbstractPromptGenerator):
+    """CPT, ICD-10, HCC and SDOH coding for a note in a single call.
+
+    The model answers with one delimited section per coding persona so the response can be
+    split back into the same views the individual prompters produce.
+    """
+    # prompter_type of the individual persona -> section marker in the response
+    SECTIONS = {
+        'biller': "CPT CODES",
+        'diagnosis': "ICD-10 CODES",
+        'hcc_coder': "HCC CODES",
+        'sdoh_coder': "SDOH CODES",
+    }
+    # Statement data_format asks for in each section when no code applies
+    NO_CODE_PHRASES = {
+        'biller': "no applicable code",
+        'diagnosis': "no icd-10 code applies",
+        'hcc_coder': "no hcc icd-10 was found",
+        'sdoh_coder': "no sdoh icd-10 was found",
+    }
+    # Marker lines, tolerating the markdown the model sometimes wraps them in
+    _SECTION_PATTERN = re.compile(r"^[\s#*]*=+\s*(" + "|".join(re.escape(marker) for marker in SECTIONS.values()) + r")\s*=+[\s*]*$", re.MULTILINE | re.IGNORECASE)
+    # ICD-10-CM: letter, digit, digit (or A/B as in C7A, M1A), then up to four characters after the dot
+    _ICD10_CODE = r"[A-TV-Z]\d[0-9AB](?:\.[0-9A-Z]{1,4})?"
+    _SECTION_CODES = {
+        # CPT Category I, II (F) and III (T), and HCPCS Level II (G0438, J1100)
+        'biller': r"\d{5}|\d{4}[FT]|[A-V]\d{4}",
+        'diagnosis': _ICD10_CODE,
+        'hcc_coder': _ICD10_CODE,
+        # SDOH Z codes are Z55-Z65
+        'sdoh_coder': r"Z(?:5[5-9]|6[0-5])(?:\.[0-9A-Z]{1,4})?",
+    }
+    # A code counts on a list line ("- 99214: ...", "1. **E11.9** ...") or at the start of a line
+    _CODE_PATTERNS = {
+        prompter_type: re.compile(r"^[ \t]*(?:(?:[-*•]|\d+[.)])[^\n]*?)?(?<![\w.])(?:" + code + r")(?!\w|\.\w)", re.MULTILINE)
+        for prompter_type, code in _SECTION_CODES.items()
+    }
+    cache_ttl = 24 * 60 * 60
+    # Four sections need more room than a single persona's answer
+    max_tokens = 1500
+
+    def prompt_parts(self, note: str, additional_data: str = None) -> tuple:
+        # System prompt components (for model behavior and boundaries)
+        persona = (
+            "You are an expert in Ambulatory Patient Care Billing and Coding. You specialize in CPT and CPT II codes, ICD-10 diagnosis codes, "
+            "Hierarchical Condition Category (HCC) coding and Social Determinants of Health (SDOH) Z codes.\n"
+        )
+        instruction = (
+            "Analyze the patient visit note once and produce all four coding recommendations: CPT codes, ICD-10 diagnosis codes, "
+            "HCC ICD-10 codes and SDOH ICD-10 Z codes. Each recommendation must be based strictly on the text provided in the visit note; "
+            "avoid any assumptions or inferences not directly supported by the note.\n"
+        )
+        context = (
+            "Your goal is to help Revenue Cycle Management and Billing teams create accurate claims for the visit, including risk-adjusted "
+            "HCC conditions and social determinants that affect the patient's care.\n"
+        )
 
-        # Combine prompts
-        user_prompt = data_format + follow_up + audience + tone + data
-        system_prompt = persona + instruction + context
-
-        return system_prompt, user_prompt
\ No newline at end of file
+        # User prompt components (for generating the actual recommendation)
+        data_format = (
+            "Answer with exactly these four sections, in this order, each starting with its marker line on its own:\n"
+            "=== CPT CODES ===\n"
+            "A bullet-point list of CPT and CPT II codes (E&M, procedures, referrals, quality measures) with the code, its description and a brief "
+            "explanation citing the note. If none apply, state: 'No applicable code for this category based on the visit note.'\n"
+            "=== ICD-10 CODES ===\n"
+            "A bullet-point list of ICD-10 diagnosis codes with a brief explanation for each. If none apply, state: 'No ICD-10 code applies based on the visit note.'\n"
+            "=== HCC CODES ===\n"
+            "A bullet-point list of HCC ICD-10 codes with the description and the part of the note that justifies it. If none apply, state: "
+            "'No HCC ICD-10 was found in the given visit note input'.\n"
+            "=== SDOH CODES ===\n"
+            "A bullet-point list of SDOH ICD-10 Z codes with the description and the part of the note that justifies it. If none apply, state: "
+            "'No SDOH ICD-10 was found in the given visit note input'.\n"
+        )
+        follow_up = (
+            "Do not infer or add any information beyond what is explicitly mentioned in the note, and do not add text outside the four sections.\n"
+        )
+        tone = "The tone should be professional, clear, and concise.\n"
+        data = f"Text to generate codes from: {note}"
+
+        system_parts = [("persona", persona), ("instruction", instruction), ("context", context)]
+        user_parts = [("data_format", data_format), ("follow_up", follow_up), ("tone", tone), ("data", data)]
+
+        return system_parts, user_parts
+
+    def split_sections(self, response: str) -> dict:
+        """Split a bundle response into {prompter_type: section text}; missing sections are left out."""
+        markers = {marker: prompter_type for prompter_type, marker in self.SECTIONS.items()}
+        matches = list(self._SECTION_PATTERN.finditer(response))
+        sections = {}
+        for index, match in enumerate(matches):
+            end = matches[index + 1].start() if index + 1 < len(matches) else len(response)
+            sections[markers[match.group(1).upper()]] = response[match.end():end].strip()
+        return sections
+
+    def validate_section(self, prompter_type: str, text: str) -> bool:
+        """A section is usable if it lists at least one code of its kind or says, in its own words, that none apply."""
+        if not text:
+            return False
+        if self.NO_CODE_PHRASES[prompter_type] in text.lower():
+            return True
+        return bool(self._CODE_PATTERNS[prompter_type].search(text))
@@ -0,0 +1,354 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+import anthropic
+import openai
+from app.metrics import record_retry
+
+# Default limits per provider; override with RATE_LIMIT_<PROVIDER>_<RPM|TPM|CONCURRENCY>
+PROVIDER_DEFAULTS = {
+    "openai": {"rpm": 500, "tpm": 300000, "concurrency": 16},
+    "anthropic": {"rpm": 50, "tpm": 40000, "concurrency": 8},
+}
+FALLBACK_DEFAULTS = {"rpm": 60, "tpm": 60000, "concurrency": 4}
+
+# 408 timeout, 409 lock conflict, 429 rate limited, 5xx server errors (529 is Anthropic's "overloaded")
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+RETRYABLE_ERRORS = (openai.APIConnectionError, anthropic.APIConnectionError)
+
+
+class TokenBucket:
+    """Refills `capacity` units per minute; not thread-safe on its own (the limiter holds the lock)."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        # A request larger than the bucket only has to wait for a full bucket
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+
+class _AsyncWaiter:
+    """A queued coroutine; woken from any thread when it may be able to start."""
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+
+    def wake(self):
+        self.loop.call_soon_threadsafe(self._set)
+
+    def _set(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self.future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.future = self.loop.create_future()
+
+
+class _ThreadWaiter:
+    """A queued thread (the sync call path)."""
+
+    def __init__(self):
+        self.event = threading.Event()
+
+    def wake(self):
+        self.event.set()
+
+    def wait(self, timeout):
+        self.event.wait(timeout)
+        self.event.clear()
+
+
+class RateLimiter:
+    """Request/token buckets and an adaptive concurrency limit for one provider model.
+
+    Callers that cannot start yet wait in FIFO order instead of failing. Only the caller at the
+    head of the queue checks the limits: it sleeps until the buckets refill or a pause ends, or
+    until release() frees a slot; the others sleep until they reach the head. The concurrency limit
+    grows by about one slot per limit's worth of fast successful calls and halves (at most once
+    per `decrease_interval`) when the provider answers 429 or a call is slower than
+    `latency_target`. Retryable errors are retried with jittered exponential backoff, or after
+    the provider's Retry-After, which also pauses every other caller of this model.
+    """
+
+    def __init__(self, name: str, rpm: float, tpm: float, max_concurrency: int, min_concurrency: int = 1,
+                 latency_target: float = 30.0, max_retries: int = 5, base_delay: float = 0.5, max_delay: float = 30.0,
+                 decrease_interval: float = 5.0):
+        self.name = name
+        # "provider:model"; the provider doubles as the model_type metrics label
+        self.provider = name.split(":", 1)[0]
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency_limit = float(max_concurrency)
+        self.latency_target = latency_target
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.decrease_interval = decrease_interval
+        self._lock = threading.Lock()
+        self._waiting = deque()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._stats = {"calls": 0, "retries": 0, "throttled": 0, "failed": 0, "queued": 0, "queue_seconds": 0.0}
+
+    @classmethod
+    def from_env(cls, provider: str, model_name: str) -> "RateLimiter":
+        defaults = PROVIDER_DEFAULTS.get(provider, FALLBACK_DEFAULTS)
+        prefix = f"RATE_LIMIT_{provider.upper()}_"
+        return cls(
+            name=f"{provider}:{model_name}",
+            rpm=float(os.getenv(prefix + "RPM", defaults["rpm"])),
+            tpm=float(os.getenv(prefix + "TPM", defaults["tpm"])),
+            max_concurrency=int(os.getenv(prefix + "CONCURRENCY", defaults["concurrency"])),
+            latency_target=float(os.getenv("RATE_LIMIT_LATENCY_TARGET", "30")),
+            max_retries=int(os.getenv("RATE_LIMIT_MAX_RETRIES", "5")),
+        )
+
+    # Admission
+    def _try_acquire(self, ticket, estimated_tokens) -> float:
+        """Take a slot and return 0, or return how long to wait (None: until woken) before trying again."""
+        with self._lock:
+            now = time.monotonic()
+            if self._waiting[0] is not ticket:
+                return None
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self._in_flight >= int(self.concurrency_limit):
+                # release() wakes the head when a call finishes
+                return None
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(estimated_tokens))
+            if wait > 0:
+                return wait
+            self.requests.level -= 1
+            self.tokens.level -= min(estimated_tokens, self.tokens.capacity)
+            self._in_flight += 1
+            self._waiting.popleft()
+            self._wake_head()
+            return 0.0
+
+    def _wake_head(self):
+        # Called with the lock held
+        if self._waiting:
+            self._waiting[0].wake()
+
+    def _enqueue(self, ticket):
+        with self._lock:
+            self._waiting.append(ticket)
+        return ticket
+
+    def _dequeue(self, ticket):
+        with self._lock:
+            if ticket in self._waiting:
+                was_head = self._waiting[0] is ticket
+                self._waiting.remove(ticket)
+                if was_head:
+                    self._wake_head()
+
+    def _admitted(self, queued_for):
+        with self._lock:
+            self._stats["calls"] += 1
+            if queued_for > 0.001:
+                self._stats["queued"] += 1
+                self._stats["queue_seconds"] += queued_for
+
+    async def aacquire(self, estimated_tokens: int):
+        ticket, started = self._enqueue(_AsyncWaiter()), time.monotonic()
+        try:
+            while True:
+                wait = self._try_acquire(ticket, estimated_tokens)
+                if wait == 0:
+                    break
+                await ticket.wait(wait)
+        except BaseException:
+            self._dequeue(ticket)
+            raise
+        self._admitted(time.monotonic() - started)
+
+    def acquire(self, estimated_tokens: int):
+        ticket, started = self._enqueue(_ThreadWaiter()), time.monotonic()
+        try:
+            while True:
+                wait = self._try_acquire(ticket, estimated_tokens)
+                if wait == 0:
+                    break
+                ticket.wait(wait)
+        except BaseException:
+            self._dequeue(ticket)
+            raise
+        self._admitted(time.monotonic() - started)
+
+    def release(self, latency: float = None, throttled: bool = False, retry_after: float = None):
+        """Free the slot and adapt the concurrency limit (AIMD) from the outcome."""
+        with self._lock:
+            now = time.monotonic()
+            self._in_flight -= 1
+            if throttled:
+                self._stats["throttled"] += 1
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            slow = latency is not None and latency > self.latency_target
+            if throttled or slow:
+                if now - self._last_decrease >= self.decrease_interval:
+                    self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit / 2)
+                    self._last_decrease = now
+            elif latency is not None:
+                self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + 1 / self.concurrency_limit)
+            self._wake_head()
+
+    @asynccontextmanager
+    async def aslot(self, estimated_tokens: int):
+        """Hold a slot for a call that cannot be retried, such as a stream already being relayed."""
+        await self.aacquire(estimated_tokens)
+        started = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self.release(throttled=status_code(e) == 429, retry_after=retry_after(e))
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.release(time.monotonic() - started)
+
+    @contextmanager
+    def slot(self, estimated_tokens: int):
+        self.acquire(estimated_tokens)
+        started = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self.release(throttled=status_code(e) == 429, retry_after=retry_after(e))
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.release(time.monotonic() - started)
+
+    # Calls with retries
+    async def acall(self, fn, estimated_tokens: int, prompter_type: str = None):
+        """Await fn() within the limits, retrying 429/5xx/connection errors."""
+        attempt = 0
+        while True:
+            try:
+                async with self.aslot(estimated_tokens):
+                    return await fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, prompter_type)
+                if delay is None:
+                    raise
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def call(self, fn, estimated_tokens: int, prompter_type: str = None):
+        attempt = 0
+        while True:
+            try:
+                with self.slot(estimated_tokens):
+                    return fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, prompter_type)
+                if delay is None:
+                    raise
+            attempt += 1
+            time.sleep(delay)
+
+    def _retry_delay(self, error, attempt, prompter_type=None):
+        """Seconds to wait before retrying `error`, or None when it should be raised."""
+        retryable = status_code(error) in RETRYABLE_STATUS or isinstance(error, RETRYABLE_ERRORS)
+        if not retryable or attempt >= self.max_retries:
+            with self._lock:
+                self._stats["failed"] += 1
+            return None
+        with self._lock:
+            self._stats["retries"] += 1
+        record_retry(prompter_type, self.provider, str(status_code(error) or type(error).__name__))
+        server_delay = retry_after(error)
+        if server_delay is not None:
+            # Spread the callers released by the same Retry-After
+            return server_delay + random.uniform(0, min(1.0, server_delay * 0.1))
+        # Full jitter
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                "concurrency_limit": round(self.concurrency_limit, 2),
+                "in_flight": self._in_flight,
+                "waiting": len(self._waiting),
+                "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 2),
+                "queue_seconds": round(stats["queue_seconds"], 3),
+            })
+        return stats
+
+
+def status_code(error):
+    return getattr(error, "status_code", None)
+
+
+def retry_after(error):
+    """Seconds from the Retry-After (or retry-after-ms) header of a provider error, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(provider: str, model_name: str) -> RateLimiter:
+    """The limiter shared by every call to this provider model in this worker."""
+    key = (provider, model_name)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        with _limiters_lock:
+            if key not in _limiters:
+                _limiters[key] = RateLimiter.from_env(provider, model_name)
+            limiter = _limiters[key]
+    return limiter
+
+def limiter_stats() -> dict:
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.stats() for limiter in limiters}
@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    """Content-addressed cache for model completions.
+
+    Entries live in a bounded in-memory LRU and, when `disk_path` is set, in a SQLite
+    file that is shared by the gunicorn workers and survives restarts. Every entry
+    carries its own expiry so prompters can choose their own TTL. Async callers use
+    aget/aset, which run the SQLite tier in a thread so it never blocks the event loop.
+    """
+
+    def __init__(self, max_entries: int = 512, default_ttl: float = 3600, disk_path: str = None):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.disk_path = disk_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._db = None
+        if disk_path:
+            # Completions quote the notes (PHI): create the file owner-only (SQLite gives its WAL files the same mode)
+            os.close(os.open(disk_path, os.O_RDWR | os.O_CREAT, 0o600))
+            os.chmod(disk_path, 0o600)
+            self._db = sqlite3.connect(disk_path, timeout=5, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    @classmethod
+    def from_env(cls) -> "ResultCache":
+        return cls(
+            max_entries=int(os.getenv("RESULT_CACHE_SIZE", "512")),
+            default_ttl=float(os.getenv("RESULT_CACHE_TTL", "3600")),
+            disk_path=os.getenv("RESULT_CACHE_PATH") or None,
+        )
+
+    @staticmethod
+    def make_key(provider, model_name, temperature, system_prompt, user_prompt) -> str:
+        payload = json.dumps([provider, model_name, temperature, system_prompt, user_prompt], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return value
+                del self._entries[key]
+            if self._db is not None:
+                row = self._db.execute("SELECT value, expires_at FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None and row[1] > now:
+                    self._store(key, row[0], row[1])
+                    self._hits += 1
+                    self._disk_hits += 1
+                    return row[0]
+            self._misses += 1
+            return None
+
+    def set(self, key: str, value: str, ttl: float = None):
+        expires_at = time.time() + (self.default_ttl if ttl is None else ttl)
+        with self._lock:
+            self._store(key, value, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)", (key, value, expires_at)
+                )
+                self._db.commit()
+
+    async def aget(self, key: str):
+        if self._db is None:
+            return self.get(key)
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: str, ttl: float = None):
+        if self._db is None:
+            return self.set(key, value, ttl)
+        return await asyncio.to_thread(self.set, key, value, ttl)
+
+    def _store(self, key, value, expires_at):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            for key in [key for key, (_, expires_at) in self._entries.items() if expires_at <= now]:
+                del self._entries[key]
+            if self._db is not None:
+                self._db.execute("DELETE FROM results WHERE expires_at <= ?", (now,))
+                self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM results")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "disk_path": self.disk_path,
+            }
+
+
+# Shared cache for the worker, configured from RESULT_CACHE_SIZE / RESULT_CACHE_TTL / RESULT_CACHE_PATH.
+result_cache = ResultCache.from_env()
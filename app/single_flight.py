@@ -0,0 +1,127 @@
+import asyncio
+import threading
+
+
+class SingleFlight:
+    """Coalesces identical provider calls that are in flight at the same time.
+
+    The first caller for a key starts the call; callers arriving with the same key before it
+    finishes wait for that call and receive its result (or its exception) instead of making
+    their own. Keys are the result cache keys, so they cover provider, model, parameters and
+    prompts. The call is only cancelled once every caller waiting for it has been cancelled.
+    Nothing is remembered once the call finishes; that is the result cache's job.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tasks = {}
+        self._calls = {}
+        self._stats = {}
+
+    async def ado(self, key: str, factory, label: str = None):
+        """Await factory() once for all concurrent callers with the same key."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            flight = self._tasks.get(key)
+            # A task left over from another event loop (e.g. a finished asyncio.run) cannot be awaited here
+            leader = flight is None or flight.task.get_loop() is not loop
+            if leader:
+                # The call runs as its own task so a cancelled leader does not cancel it for the waiters
+                flight = self._tasks[key] = _Flight(loop.create_task(factory()))
+                flight.task.add_done_callback(lambda done: self._forget_task(key, flight))
+            flight.callers += 1
+            self._count(label, leader)
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            with self._lock:
+                flight.callers -= 1
+                if not leader:
+                    self._stats[label]["waiting"] -= 1
+                # Nobody is left to use the result (e.g. every caller lost a hedge), so stop the call
+                if flight.callers == 0 and not flight.task.done():
+                    flight.task.cancel()
+
+    def do(self, key: str, fn, label: str = None):
+        """Thread-safe synchronous counterpart of ado()."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._count(label, leader)
+        if not leader:
+            call.done.wait()
+            with self._lock:
+                self._stats[label]["waiting"] -= 1
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._forget(self._calls, key, call)
+            call.done.set()
+
+    def stats(self) -> dict:
+        """Calls made, calls coalesced onto another caller's call, and current waiters, overall and per label."""
+        with self._lock:
+            by_label = {label or "": dict(counts) for label, counts in self._stats.items()}
+            in_flight = len(self._tasks) + len(self._calls)
+        totals = {"calls": 0, "coalesced": 0, "waiting": 0, "max_waiting": 0}
+        for counts in by_label.values():
+            totals["calls"] += counts["calls"]
+            totals["coalesced"] += counts["coalesced"]
+            totals["waiting"] += counts["waiting"]
+            totals["max_waiting"] = max(totals["max_waiting"], counts["max_waiting"])
+        requests = totals["calls"] + totals["coalesced"]
+        totals["in_flight"] = in_flight
+        # Share of requests that did not need their own provider call
+        totals["saved_ratio"] = round(totals["coalesced"] / requests, 4) if requests else 0.0
+        return {"totals": totals, "by_label": by_label}
+
+    def _count(self, label, leader):
+        # Caller holds self._lock
+        counts = self._stats.setdefault(label, {"calls": 0, "coalesced": 0, "waiting": 0, "max_waiting": 0})
+        if leader:
+            counts["calls"] += 1
+        else:
+            counts["coalesced"] += 1
+            counts["waiting"] += 1
+            counts["max_waiting"] = max(counts["max_waiting"], counts["waiting"])
+
+    def _forget_task(self, key, flight):
+        with self._lock:
+            self._forget(self._tasks, key, flight)
+
+    @staticmethod
+    def _forget(flights, key, flight):
+        # Only drop the entry if it still belongs to this call
+        if flights.get(key) is flight:
+            del flights[key]
+
+
+class _Flight:
+    __slots__ = ("task", "callers")
+
+    def __init__(self, task):
+        self.task = task
+        self.callers = 0
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# Shared by every model instance in this worker
+single_flight = SingleFlight()
@@ -0,0 +1,103 @@
+"""Structured (JSON) output for the coding personas.
+
+In structured mode biller, diagnosis, hcc_coder and sdoh_coder answer through the provider's
+schema-constrained output (OpenAI json_schema response format, Anthropic forced tool use)
+instead of bullet-point prose. The answer is a list of codes with description, rationale and
+category, parsed into CodeResult objects: billing imports read the JSON directly, and
+render() gives the text shown on the existing pages.
+
+Structured mode is opt-in per request (structured=true) or for every request with
+STRUCTURED_CODES=1.
+"""
+import json
+import os
+
+STRUCTURED_INSTRUCTION = (
+    "\nAnswer only with the structured list of codes; any bullet-point or section layout requested below does not "
+    "apply. Give one entry per code with its official short description, a one-sentence rationale citing the visit "
+    "note, and its category (one of: {categories}). Return an empty list when no code applies.\n"
+)
+
+# Name of the Anthropic tool / OpenAI schema the codes are returned through
+SCHEMA_NAME = "record_codes"
+
+
+def structured_enabled() -> bool:
+    return os.getenv("STRUCTURED_CODES", "0").lower() in ("1", "true", "yes")
+
+
+def code_schema(categories) -> dict:
+    """JSON schema of the answer; strict-mode compatible (every property required, no extra properties)."""
+    return {
+        "type": "object",
+        "properties": {
+            "codes": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "code": {"type": "string", "description": "The code, e.g. 99214 or E11.9."},
+                        "description": {"type": "string", "description": "Official short description of the code."},
+                        "rationale": {"type": "string", "description": "One sentence citing the visit note text that supports the code."},
+                        "category": {"type": "string", "enum": list(categories)},
+                    },
+                    "required": ["code", "description", "rationale", "category"],
+                    "additionalProperties": False,
+                },
+            },
+        },
+        "required": ["codes"],
+        "additionalProperties": False,
+    }
+
+
+class CodeResult:
+    __slots__ = ("code", "description", "rationale", "category")
+
+    def __init__(self, code: str, description: str, rationale: str, category: str):
+        self.code = code
+        self.description = description
+        self.rationale = rationale
+        self.category = category
+
+    def to_dict(self) -> dict:
+        return {"code": self.code, "description": self.description, "rationale": self.rationale, "category": self.category}
+
+
+class CodingResult:
+    __slots__ = ("prompter_type", "categories", "codes")
+
+    def __init__(self, prompter_type: str, categories, codes: list):
+        self.prompter_type = prompter_type
+        self.categories = tuple(categories)
+        self.codes = codes
+
+    @classmethod
+    def from_json(cls, prompter_type: str, categories, text: str) -> "CodingResult":
+        """Parse a structured answer; ValueError if it is not the schema's shape."""
+        try:
+            items = json.loads(text)["codes"]
+            codes = [CodeResult(str(item["code"]).strip(), str(item["description"]).strip(),
+                                str(item["rationale"]).strip(), str(item["category"]).strip()) for item in items]
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"{prompter_type} structured answer does not match the code schema: {e}") from e
+        return cls(prompter_type, categories, codes)
+
+    def to_dict(self) -> dict:
+        return {"prompter_type": self.prompter_type, "codes": [code.to_dict() for code in self.codes]}
+
+    def to_json(self) -> str:
+        return json.dumps({"codes": [code.to_dict() for code in self.codes]}, ensure_ascii=False)
+
+    def render(self) -> str:
+        """The codes as plain text grouped by category, for the existing result pages."""
+        if not self.codes:
+            return "No applicable codes were found in the visit note."
+        # Declared categories first, then any others in answer order
+        order = list(self.categories) + [code.category for code in self.codes if code.category not in self.categories]
+        blocks = []
+        for category in dict.fromkeys(order):
+            lines = [f"- {code.code}: {code.description.rstrip('.')}. {code.rationale}" for code in self.codes if code.category == category]
+            if lines:
+                blocks.append(f"{category}:\n" + "\n".join(lines))
+        return "\n\n".join(blocks)
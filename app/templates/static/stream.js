@@ -0,0 +1,54 @@
+// Streams a form's result from its /stream endpoint (Server-Sent Events) into an output panel,
+// so tokens show up as the model produces them instead of after the whole completion.
+async function streamForm(formId, streamUrl, outputPanelId) {
+    const form = document.getElementById(formId);
+    const outputPanel = document.getElementById(outputPanelId);
+    outputPanel.innerHTML = '<h2>Generated Output (streaming)</h2><pre id="stream-output"></pre><div id="stream-email"></div>';
+    const output = document.getElementById('stream-output');
+
+    const response = await fetch(streamUrl, { method: 'POST', body: new FormData(form) });
+    if (!response.ok) {
+        output.textContent = `Request failed: ${response.status} ${response.statusText}`;
+        return;
+    }
+    outputPanel.scrollIntoView({ behavior: "smooth", block: "start" });
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Events are separated by a blank line; keep any partial event in the buffer
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let eventName = 'message';
+            let data = '';
+            for (const line of rawEvent.split('\n')) {
+                if (line.startsWith('event: ')) eventName = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            }
+            const payload = data ? JSON.parse(data) : '';
+            if (eventName === 'token') {
+                output.textContent += payload;
+            } else if (eventName === 'email') {
+                const email = document.createElement('pre');
+                email.textContent = payload;
+                document.getElementById('stream-email').append(Object.assign(document.createElement('h2'), { textContent: 'Patient Email' }), email);
+            } else if (eventName === 'interactions') {
+                for (const interaction of payload) {
+                    const alert = document.createElement('div');
+                    alert.className = interaction.severity === 'critical' ? 'alert-critical' : interaction.severity === 'high' ? 'alert-high' : 'alert-medium';
+                    alert.textContent = `${interaction.drugs.join(' + ')} (${interaction.severity}): ${interaction.effect}. ${interaction.management}.`;
+                    outputPanel.insertBefore(alert, output);
+                }
+            } else if (eventName === 'error') {
+                output.textContent += `\n\n[Error: ${payload}]`;
+            }
+        }
+    }
+}
@@ -0,0 +1,205 @@
+"""Local token accounting for generated prompts.
+
+Counts tokens with tiktoken (in requirements.txt). Without it, or until the model's encoding
+has loaded (preload_encodings() at startup), counts fall back to VisitSummary.estimate_tokens
+(about 4 characters per token) and are reported with the tokenizer "heuristic". OpenAI models use their own encoding; other providers are counted with
+cl100k_base, which is close but not exact.
+
+prompt_components() breaks a prompt into the named parts the prompter builds it from
+(persona, instruction, context, data_format, ..., data; see prompt_parts). estimate_prompt() predicts the
+input and output tokens and the cost of a call before it is made, and whether the input fits
+the model.
+"""
+import json
+import os
+import logging
+import threading
+from app.logging_setup import get_logger, log_event
+from app.usage_tracker import usage_tracker
+from app.visit_summary import VisitSummary
+
+# USD per million (input, output) tokens, matched by model name prefix; MODEL_PRICES (JSON of the same shape) overrides.
+PRICES = {
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4": (30.0, 60.0),
+    "gpt-3.5-turbo": (0.5, 1.5),
+    "claude-3-opus": (15.0, 75.0),
+    "claude-3-sonnet": (3.0, 15.0),
+    "claude-3-5-sonnet": (3.0, 15.0),
+    "claude-3-haiku": (0.25, 1.25),
+    "claude-3-5-haiku": (0.8, 4.0),
+}
+PRICES.update({model: tuple(price) for model, price in json.loads(os.getenv("MODEL_PRICES") or "{}").items()})
+
+# Input + output tokens a model accepts, matched by model name prefix
+CONTEXT_WINDOWS = {
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+    "claude-3": 200000,
+}
+
+# Largest input estimate_prompt() accepts; 0 uses the model's context window less its max_tokens
+MAX_INPUT_TOKENS = int(os.getenv("MAX_INPUT_TOKENS", "0"))
+
+# Chat framing around the system and user messages
+MESSAGE_OVERHEAD_TOKENS = 8
+
+logger = get_logger(__name__)
+
+# model_name -> encoding, or None when it could not be loaded
+_encodings = {}
+_loading = set()
+_encodings_lock = threading.Lock()
+
+
+def _by_prefix(table: dict, model_name: str):
+    matches = [prefix for prefix in table if (model_name or "").startswith(prefix)]
+    return table[max(matches, key=len)] if matches else None
+
+
+def load_encoding(model_name: str):
+    """Load (and cache) the tiktoken encoding for a model; blocks while tiktoken fetches its BPE file.
+
+    Returns None, and counts fall back to the heuristic, when tiktoken is missing or the
+    encoding cannot be loaded (e.g. no network and no TIKTOKEN_CACHE_DIR).
+    """
+    with _encodings_lock:
+        if model_name in _encodings:
+            return _encodings[model_name]
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+    except ImportError:
+        encoding = None
+    except Exception as e:
+        log_event(logger, "tokenizer_unavailable", logging.WARNING, model=model_name, error=str(e))
+        encoding = None
+    with _encodings_lock:
+        _encodings[model_name] = encoding
+        _loading.discard(model_name)
+    return encoding
+
+
+def preload_encodings(model_names):
+    """Start loading the encodings in the background (called at worker startup)."""
+    for model_name in model_names:
+        with _encodings_lock:
+            if model_name in _encodings or model_name in _loading:
+                continue
+            _loading.add(model_name)
+        threading.Thread(target=load_encoding, args=(model_name,), name="tokenizer-load", daemon=True).start()
+
+
+def _encoding(model_name: str):
+    """The loaded encoding for a model, or None (heuristic) until it has loaded.
+
+    Never blocks: request handlers call this on the event loop, so a missing encoding is
+    loaded in a background thread instead.
+    """
+    with _encodings_lock:
+        if model_name in _encodings:
+            return _encodings[model_name]
+    preload_encodings([model_name])
+    return None
+
+
+def tokenizer_name(model_name: str = None) -> str:
+    encoding = _encoding(model_name)
+    return f"tiktoken:{encoding.name}" if encoding is not None else "heuristic"
+
+
+def count_tokens(text: str, model_name: str = None) -> int:
+    if not text:
+        return 0
+    encoding = _encoding(model_name)
+    if encoding is None:
+        return VisitSummary.estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+class Component:
+    __slots__ = ("name", "prompt", "tokens", "static")
+
+    def __init__(self, name: str, prompt: str, tokens: int, static: bool):
+        self.name = name
+        # "system" or "user"
+        self.prompt = prompt
+        self.tokens = tokens
+        # Static parts are identical on every call and re-sent with each one
+        self.static = static
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "prompt": self.prompt, "tokens": self.tokens, "static": self.static}
+
+
+def prompt_components(prompter, note: str, additional_data: str = None, model_name: str = None) -> list:
+    """Tokens per part of the prompt (AbstractPromptGenerator.prompt_parts), system prompt first."""
+    system_parts, user_parts = prompter.prompt_parts(note, additional_data)
+    components = []
+    for prompt, parts in (("system", system_parts), ("user", user_parts)):
+        for name, value in parts:
+            if not value:
+                continue
+            static = note not in value and not (additional_data and additional_data in value)
+            components.append(Component(name, prompt, count_tokens(value, model_name), static))
+    return components
+
+
+def expected_output_tokens(provider: str, prompter_type: str, max_tokens: int) -> tuple:
+    """(tokens, source): the average output of this worker's calls for the persona, else max_tokens."""
+    usage = usage_tracker.snapshot().get(f"{provider}/{prompter_type}")
+    if usage and usage["requests"]:
+        return min(max_tokens, round(usage["output_tokens"] / usage["requests"])), "observed"
+    return max_tokens, "max_tokens"
+
+
+def input_limit(model) -> int:
+    """Largest input the model can be sent, or None when it is not known."""
+    if MAX_INPUT_TOKENS:
+        return MAX_INPUT_TOKENS
+    window = _by_prefix(CONTEXT_WINDOWS, model.model_name)
+    return window - model.max_tokens if window else None
+
+
+def cost(model_name: str, input_tokens: int, output_tokens: int):
+    price = _by_prefix(PRICES, model_name)
+    if price is None:
+        return None
+    return round((input_tokens * price[0] + output_tokens * price[1]) / 1e6, 6)
+
+
+def estimate_prompt(prompter, model, note: str, additional_data: str = None, components: bool = False) -> dict:
+    """Predicted tokens and cost of one call of `model` with the prompt `prompter` builds for the note."""
+    system_prompt, user_prompt = prompter.generate_prompt(note, additional_data)
+    model_name = getattr(model, "model_name", None)
+    system_tokens = count_tokens(system_prompt, model_name)
+    user_tokens = count_tokens(user_prompt, model_name)
+    input_tokens = system_tokens + user_tokens + MESSAGE_OVERHEAD_TOKENS
+    output_tokens, output_source = expected_output_tokens(model.provider, model.prompter_type, model.max_tokens)
+    limit = input_limit(model)
+    estimate = {
+        "provider": model.provider,
+        "model": model_name,
+        "prompter_type": model.prompter_type,
+        "tokenizer": tokenizer_name(model_name),
+        "input_tokens": input_tokens,
+        "system_tokens": system_tokens,
+        "user_tokens": user_tokens,
+        "output_tokens": output_tokens,
+        "output_tokens_source": output_source,
+        "max_output_tokens": model.max_tokens,
+        "cost_usd": cost(model_name, input_tokens, output_tokens),
+        "max_cost_usd": cost(model_name, input_tokens, model.max_tokens),
+        "input_limit": limit,
+        "fits": limit is None or input_tokens <= limit,
+    }
+    if components:
+        estimate["components"] = [component.to_dict() for component in prompt_components(prompter, note, additional_data, model_name)]
+    return estimate
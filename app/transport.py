@@ -0,0 +1,197 @@
+"""Shared HTTP transport for the provider SDK clients.
+
+One pooled httpx client (sync and async) per worker is handed to the OpenAI and Anthropic
+SDKs, so both reuse the same keep-alive connections. Pool size, keep-alive expiry and HTTP/2
+are configurable through the environment:
+
+    HTTP_MAX_CONNECTIONS=100      connections per worker
+    HTTP_MAX_KEEPALIVE=20         idle connections kept open
+    HTTP_KEEPALIVE_EXPIRY=120     seconds an idle connection is kept (httpx defaults to 5)
+    HTTP2=auto                    auto (when the h2 package is installed), 1 or 0
+    HTTP_WARMUP=0                 1 opens connections to the providers when the worker boots
+    HTTP_KEEP_WARM_INTERVAL=0     seconds; if set, idle providers are pinged so connections stay open
+
+Every request carries an httpx trace callback that notes whether a new connection was
+opened and how long DNS/TCP and TLS took; stats() reports reuse ratios and handshake times.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+import httpx
+from app.logging_setup import get_logger, log_event
+from app.metrics import record_connection
+
+logger = get_logger("transport")
+
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+
+def http2_enabled() -> bool:
+    setting = os.getenv("HTTP2", "auto").lower()
+    if setting in ("0", "false", "no"):
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        if setting != "auto":
+            log_event(logger, "http2_unavailable", logging.WARNING, reason="h2 package not installed")
+        return False
+    return True
+
+
+def limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "120")),
+    )
+
+
+class ConnectionStats:
+    """Per-host request count, new connections and handshake (DNS + TCP + TLS) time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self.last_request = 0.0
+
+    def record(self, host: str, new_connection: bool, handshake_seconds: float):
+        with self._lock:
+            stats = self._hosts.setdefault(host, {"requests": 0, "new_connections": 0, "handshake_seconds": 0.0, "max_handshake_seconds": 0.0})
+            stats["requests"] += 1
+            if new_connection:
+                stats["new_connections"] += 1
+                stats["handshake_seconds"] += handshake_seconds
+                stats["max_handshake_seconds"] = max(stats["max_handshake_seconds"], handshake_seconds)
+            self.last_request = time.monotonic()
+        record_connection(host, new_connection, handshake_seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            hosts = {host: dict(stats) for host, stats in self._hosts.items()}
+        for stats in hosts.values():
+            new = stats["new_connections"]
+            stats["reuse_ratio"] = round(1 - new / stats["requests"], 4)
+            stats["avg_handshake_ms"] = round(stats.pop("handshake_seconds") / new * 1000, 1) if new else 0.0
+            stats["max_handshake_ms"] = round(stats.pop("max_handshake_seconds") * 1000, 1)
+        return hosts
+
+
+connection_stats = ConnectionStats()
+
+
+class _RequestTrace:
+    """Collects the httpcore trace events of one request."""
+    __slots__ = ("started", "handshake", "new_connection")
+
+    def __init__(self):
+        self.started = {}
+        self.handshake = 0.0
+        self.new_connection = False
+
+    def event(self, name: str):
+        # e.g. "connection.connect_tcp.started" / "connection.start_tls.complete"
+        step, _, phase = name.rpartition(".")
+        if not step.endswith(("connect_tcp", "start_tls")):
+            return
+        if phase == "started":
+            self.started[step] = time.perf_counter()
+            self.new_connection = True
+        elif step in self.started:
+            self.handshake += time.perf_counter() - self.started.pop(step)
+
+    def sync_callback(self, name, info):
+        self.event(name)
+
+    async def async_callback(self, name, info):
+        self.event(name)
+
+
+def _trace_request(request: httpx.Request, asynchronous: bool):
+    trace = _RequestTrace()
+    request.extensions["trace"] = trace.async_callback if asynchronous else trace.sync_callback
+    request.extensions["connection_trace"] = trace
+
+
+def _record_response(response: httpx.Response):
+    trace = response.request.extensions.get("connection_trace")
+    if trace is not None:
+        connection_stats.record(response.request.url.host, trace.new_connection, trace.handshake)
+
+
+def _client_options() -> dict:
+    # Timeout and redirects as the SDKs' own clients; the SDKs still pass a timeout per request
+    return {"limits": limits(), "http2": http2_enabled(), "timeout": httpx.Timeout(600.0, connect=5.0), "follow_redirects": True}
+
+
+def get_client() -> httpx.Client:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(
+                    event_hooks={"request": [lambda request: _trace_request(request, False)], "response": [_record_response]},
+                    **_client_options(),
+                )
+    return _client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                async def trace_request(request):
+                    _trace_request(request, True)
+
+                async def record_response(response):
+                    _record_response(response)
+
+                _async_client = httpx.AsyncClient(
+                    event_hooks={"request": [trace_request], "response": [record_response]},
+                    **_client_options(),
+                )
+    return _async_client
+
+
+async def warm_up(base_urls: list, connections: int = 1, timeout: float = 5.0):
+    """Open `connections` pooled connections to each base URL.
+
+    Any response (even a 401/404) means DNS, TCP and TLS are done and the connection is in
+    the pool; failures are logged and ignored so a provider outage cannot block startup.
+    """
+    client = get_async_client()
+
+    async def touch(url):
+        try:
+            await client.head(url, timeout=timeout)
+        except httpx.HTTPError as e:
+            log_event(logger, "warm_up_failed", logging.WARNING, host=urlsplit(str(url)).hostname, error=str(e))
+
+    await asyncio.gather(*(touch(url) for url in base_urls for _ in range(connections)))
+    log_event(logger, "warm_up_complete", hosts=[urlsplit(str(url)).hostname for url in base_urls])
+
+
+async def keep_warm(base_urls: list, interval: float):
+    """Ping the providers whenever no request has been sent for `interval` seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        if time.monotonic() - connection_stats.last_request >= interval:
+            await warm_up(base_urls)
+
+
+def stats() -> dict:
+    return {
+        "http2": http2_enabled(),
+        "limits": {
+            "max_connections": limits().max_connections,
+            "max_keepalive_connections": limits().max_keepalive_connections,
+            "keepalive_expiry": limits().keepalive_expiry,
+        },
+        "hosts": connection_stats.snapshot(),
+    }
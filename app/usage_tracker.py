@@ -0,0 +1,69 @@
+import contextvars
+import threading
+from contextlib import contextmanager
+
+# Per-task usage totals opened by UsageTracker.measure()
+_current_usage = contextvars.ContextVar("current_usage", default=None)
+
+
+class UsageTracker:
+    """Aggregates provider token usage per (provider, prompter_type) for this worker.
+
+    input_tokens counts every prompt token; cached_input_tokens is the part of it the
+    provider served from its prompt cache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._usage = {}
+
+    def record(self, provider: str, prompter_type: str, input_tokens: int = 0, output_tokens: int = 0, cached_input_tokens: int = 0):
+        input_tokens = input_tokens or 0
+        output_tokens = output_tokens or 0
+        cached_input_tokens = cached_input_tokens or 0
+        with self._lock:
+            usage = self._usage.setdefault((provider, prompter_type), _empty_usage())
+            _add_usage(usage, input_tokens, output_tokens, cached_input_tokens)
+        current = _current_usage.get()
+        if current is not None:
+            _add_usage(current, input_tokens, output_tokens, cached_input_tokens)
+
+    @contextmanager
+    def measure(self):
+        """Collect the usage recorded by the current thread/asyncio task inside the block."""
+        usage = _empty_usage()
+        token = _current_usage.set(usage)
+        try:
+            yield usage
+        finally:
+            _current_usage.reset(token)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            snapshot = {f"{provider}/{prompter_type}": dict(usage) for (provider, prompter_type), usage in self._usage.items()}
+        for usage in snapshot.values():
+            usage["uncached_input_tokens"] = usage["input_tokens"] - usage["cached_input_tokens"]
+            usage["cache_hit_rate"] = usage["cached_input_tokens"] / usage["input_tokens"] if usage["input_tokens"] else 0.0
+        return snapshot
+
+    def totals(self) -> dict:
+        totals = _empty_usage()
+        for usage in self.snapshot().values():
+            for field in totals:
+                totals[field] += usage[field]
+        return totals
+
+
+def _empty_usage() -> dict:
+    return {"requests": 0, "input_tokens": 0, "cached_input_tokens": 0, "output_tokens": 0}
+
+
+def _add_usage(usage: dict, input_tokens: int, output_tokens: int, cached_input_tokens: int):
+    usage["requests"] += 1
+    usage["input_tokens"] += input_tokens
+    usage["cached_input_tokens"] += cached_input_tokens
+    usage["output_tokens"] += output_tokens
+
+
+# Shared tracker the models report provider usage fields to.
+usage_tracker = UsageTracker()
@@ -5,6 +5,30 @@ class VisitSummary:
     def get_text(self) -> str:
         """Combine and return the visit summary text snippets."""
         return " ".join(self.text_snippets)
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """Rough token count (about 4 characters per token for English clinical text)."""
+        return len(text) // 4 + 1
+
+    def group_snippets(self, token_budget: int) -> list:
+        """Split the snippets into consecutive groups that each fit within `token_budget`.
+
+        Snippets larger than the budget are broken up at paragraph boundaries first.
+        """
+        groups, current, current_tokens = [], [], 0
+        for snippet in self.text_snippets:
+            pieces = [snippet] if self.estimate_tokens(snippet) <= token_budget else [p for p in snippet.split("\n\n") if p.strip()]
+            for piece in pieces:
+                tokens = self.estimate_tokens(piece)
+                if current and current_tokens + tokens > token_budget:
+                    groups.append(current)
+                    current, current_tokens = [], 0
+                current.append(piece)
+                current_tokens += tokens
+        if current:
+            groups.append(current)
+        return groups
     
     @staticmethod
     def get_sample_visits() -> list:
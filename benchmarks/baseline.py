@@ -0,0 +1,44 @@
+"""Saving benchmark results as baselines and comparing later runs against them."""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+
+def environment() -> dict:
+    """Where the numbers were taken; results from different machines are not comparable."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).resolve().parent.parent).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "commit": commit,
+        "taken_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+def save(report: dict, path: str):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    Path(path).write_text(json.dumps(report, indent=2) + "\n")
+    print(f"Saved baseline to {path}", file=sys.stderr)
+
+
+def compare(results: dict, baseline_path: str) -> dict:
+    """Relative change of every numeric result against the baseline (+0.10 = 10% higher)."""
+    baseline = json.loads(Path(baseline_path).read_text())["results"]
+    return {name: _compare(value, baseline.get(name)) for name, value in results.items() if baseline.get(name) is not None}
+
+
+def _compare(value, baseline):
+    if isinstance(value, dict):
+        return {key: _compare(item, baseline.get(key)) for key, item in value.items() if isinstance(baseline, dict) and baseline.get(key) is not None}
+    if isinstance(value, (int, float)) and isinstance(baseline, (int, float)) and baseline:
+        return round((value - baseline) / baseline, 4)
+    return None
@@ -0,0 +1,168 @@
+"""End-to-end load test against a local stub LLM server.
+
+Starts benchmarks/stub_llm_server.py and the app with the Procfile's gunicorn + uvicorn
+command, with both SDKs pointed at the stub. Then it drives /process,
+/clinical_decision_support and /process_followup one after another at a fixed concurrency.
+Every request carries a distinct note, so the result cache and request coalescing do not
+answer it and each one reaches the stub. For each endpoint it
+reports throughput and p50/p95/p99 latency, and it can save or compare a baseline.
+
+Usage (from the repository root):
+    python benchmarks/load_test.py --requests 200 --concurrency 20 --latency 0.5 --save benchmarks/baselines/load.json
+    python benchmarks/load_test.py --compare benchmarks/baselines/load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.baseline import compare, environment, save
+from benchmarks.startup_benchmark import free_port, gunicorn_command
+from app.visit_summary import VisitSummary
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+AUTH = ("bench", "bench")
+
+
+def server_env(stub_port: int) -> dict:
+    env = dict(os.environ)
+    for name in ("HTTP_PROXY", "HTTPS_PROXY", "http_proxy", "https_proxy", "PROMETHEUS_MULTIPROC_DIR"):
+        env.pop(name, None)
+    env.update({
+        "PYTHONPATH": str(REPO_ROOT),
+        "NO_PROXY": "127.0.0.1,localhost",
+        "OPENAI_API_KEY": "stub", "ANTHROPIC_API_KEY": "stub",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{stub_port}/v1",
+        "ANTHROPIC_BASE_URL": f"http://127.0.0.1:{stub_port}",
+        "BASIC_AUTH_USERNAME": AUTH[0], "BASIC_AUTH_PASSWORD": AUTH[1],
+        # The provider limits are not what is being measured here
+        "RATE_LIMIT_OPENAI_RPM": "1000000", "RATE_LIMIT_OPENAI_TPM": "1000000000", "RATE_LIMIT_OPENAI_CONCURRENCY": "1000",
+        "RATE_LIMIT_ANTHROPIC_RPM": "1000000", "RATE_LIMIT_ANTHROPIC_TPM": "1000000000", "RATE_LIMIT_ANTHROPIC_CONCURRENCY": "1000",
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+    })
+    return env
+
+
+def wait_until_up(url: str, process: subprocess.Popen, timeout: float):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            httpx.get(url, timeout=1, trust_env=False)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.05)
+    raise RuntimeError(f"{url} did not start within {timeout} seconds")
+
+
+def scenarios(model_type: str) -> dict:
+    note = VisitSummary.get_visit_1()
+    return {
+        "/process": {"data": {"visit_note": note, "prompter_type": "biller", "model_type": model_type}},
+        "/clinical_decision_support": {"data": {"visit_note": note, "current_medications": "Metformin 500 mg twice daily",
+                                                "model_type": model_type}, "auth": AUTH},
+        "/process_followup": {"data": {"visit_note": VisitSummary.get_followup_visit(), "model_type": "openai"}},
+    }
+
+
+async def drive(base_url: str, path: str, request: dict, requests: int, concurrency: int, timeout: float) -> dict:
+    latencies, errors = [], 0
+    remaining = iter(range(requests))
+
+    async def worker(client):
+        nonlocal errors
+        for index in remaining:
+            # A distinct note per request, so neither the result cache nor request coalescing can answer it
+            data = dict(request["data"], visit_note=f"{request['data']['visit_note']}\nLoad test request {index}")
+            started = time.perf_counter()
+            try:
+                response = await client.post(path, data=data, auth=request.get("auth"))
+                if response.status_code != 200:
+                    errors += 1
+                    continue
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits, trust_env=False) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def percentile(q):
+        return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 1) if latencies else None
+
+    return {
+        "requests": requests,
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 2),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the app against a local stub LLM server.")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn workers")
+    parser.add_argument("--model", default="openai", help="model_type for /process and /clinical_decision_support")
+    parser.add_argument("--latency", type=float, default=0.5, help="Stub response time in seconds")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of stub responses that are 429s")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--save", help="Save the report as a baseline JSON file")
+    parser.add_argument("--compare", help="Compare against a saved baseline")
+    args = parser.parse_args(argv)
+
+    stub_port, app_port = free_port(), free_port()
+    env = server_env(stub_port)
+    stub = subprocess.Popen([sys.executable, str(REPO_ROOT / "benchmarks" / "stub_llm_server.py"), "--port", str(stub_port),
+                             "--latency", str(args.latency), "--jitter", str(args.jitter), "--error-rate", str(args.error_rate)],
+                            cwd=REPO_ROOT, env=env)
+    server = subprocess.Popen(gunicorn_command(app_port, args.workers), cwd=REPO_ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{app_port}"
+    try:
+        wait_until_up(f"http://127.0.0.1:{stub_port}/", stub, args.timeout)
+        wait_until_up(f"{base_url}/get_visit_note?note_id=visit_1", server, args.timeout)
+        results = {}
+        for path, request in scenarios(args.model).items():
+            results[path] = asyncio.run(drive(base_url, path, request, args.requests, args.concurrency, args.timeout))
+    finally:
+        for process in (server, stub):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    report = {
+        "environment": environment(),
+        "settings": {key: getattr(args, key) for key in ("requests", "concurrency", "workers", "model", "latency", "jitter", "error_rate")},
+        "results": results,
+    }
+    if args.compare:
+        report["comparison"] = compare(results, args.compare)
+    print(json.dumps(report, indent=2))
+    if args.save:
+        save(report, args.save)
+    return report
+
+
+if __name__ == "__main__":
+    main()
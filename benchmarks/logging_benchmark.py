@@ -0,0 +1,101 @@
+"""Per-request logging overhead.
+
+Times what the request path pays for logging one request: the old behaviour (printing the
+visit note and both prompts to stdout) against the structured logger at INFO (hashes and
+lengths, sampled) and at DEBUG (redacted bodies). Output goes to a file so the terminal
+does not distort the numbers; the structured variants only pay for enqueueing, the JSON
+is written by the background listener.
+
+Usage (from the repository root):
+    python benchmarks/logging_benchmark.py --requests 2000 --output logging.json
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.baseline import environment
+from app.logging_setup import configure_logging, dropped_records, log_event, redact, shutdown_logging, text_fields
+from app.prompt_generator import CPTCodePrompter
+from app.visit_summary import VisitSummary
+
+
+def print_request(note, system_prompt, user_prompt):
+    # What every request did before: the note in the route, the prompts in the model
+    print(f"Request received for note:\n\n{note}")
+    print(f"Visit Summary: \n\n {note}")
+    print (f"System Prompt :\n\n {system_prompt}, User Prompt:\n\n:{user_prompt}")
+
+
+def structured_request(logger, note, system_prompt, user_prompt):
+    # What a request logs now (see app.app and AIModel.log_prompts)
+    log_event(logger, "request_received", prompter_type="biller", model_type="openai", **text_fields("note", note))
+    log_event(logger, "prompt", provider="openai", prompter_type="biller",
+              **text_fields("system", system_prompt), **text_fields("user", user_prompt))
+    if logger.isEnabledFor(logging.DEBUG):
+        log_event(logger, "prompt_body", logging.DEBUG, provider="openai", prompter_type="biller",
+                  system=redact(system_prompt), user=redact(user_prompt))
+
+
+def time_calls(fn, requests: int) -> dict:
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1e6)
+    samples.sort()
+    return {
+        "mean_us": round(statistics.mean(samples), 2),
+        "p50_us": round(samples[len(samples) // 2], 2),
+        "p99_us": round(samples[int(len(samples) * 0.99)], 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure per-request logging overhead.")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--level", choices=["INFO", "DEBUG"], default=None, help="Only run this structured level")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    note = VisitSummary(VisitSummary.get_sample_visits()).get_text()
+    system_prompt, user_prompt = CPTCodePrompter().generate_prompt(note)
+    report = {"environment": environment(), "requests": args.requests, "note_chars": len(note), "prompt_chars": len(system_prompt) + len(user_prompt)}
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Block buffered (a file) and line buffered (like an unbuffered stdout pipe to a log collector)
+        for name, buffering in (("print_buffered", -1), ("print_line_buffered", 1)):
+            with open(os.path.join(directory, f"{name}.log"), "w", buffering=buffering) as sink, contextlib.redirect_stdout(sink):
+                report[name] = time_calls(lambda: print_request(note, system_prompt, user_prompt), args.requests)
+
+        # The listener is configured once per process, so each level runs in a child process
+        levels = [args.level] if args.level else ["INFO", "DEBUG"]
+        if args.level:
+            with open(os.path.join(directory, "structured.log"), "w") as sink:
+                logger = configure_logging(level=args.level, stream=sink)
+                report[f"structured_{args.level.lower()}"] = time_calls(lambda: structured_request(logger, note, system_prompt, user_prompt), args.requests)
+                report["dropped"] = dropped_records()
+                shutdown_logging()
+        else:
+            import subprocess
+            for level in levels:
+                child = subprocess.run([sys.executable, __file__, "--requests", str(args.requests), "--level", level],
+                                       capture_output=True, text=True, check=True)
+                report[f"structured_{level.lower()}"] = json.loads(child.stdout)[f"structured_{level.lower()}"]
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
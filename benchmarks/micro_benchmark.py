@@ -0,0 +1,77 @@
+"""Micro-benchmarks for the CPU work done on every request.
+
+Times every prompter's generate_prompt, extract_codes, note section parsing, VisitSummary.get_text, AIModel.convert_to_ascii and
+ModelOrchestrator construction, none of which touch the network. Results can be saved as a
+baseline and later runs compared against it.
+
+Usage (from the repository root):
+    python benchmarks/micro_benchmark.py --save benchmarks/baselines/micro.json
+    python benchmarks/micro_benchmark.py --compare benchmarks/baselines/micro.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.baseline import compare, environment, save
+from app.ai_model import AIModel
+from app.code_extractor import extract_codes
+from app.note_sections import _parse
+from app.model_orchestrator import ModelOrchestrator
+from app.model_registry import PROMPTER_CLASSES
+from app.visit_summary import VisitSummary
+
+
+def best_of(fn, repeat: int, number: int) -> float:
+    """Best per-call time in microseconds over `repeat` runs of `number` calls."""
+    return round(min(timeit.repeat(fn, repeat=repeat, number=number)) / number * 1e6, 3)
+
+
+def run(repeat: int, number: int) -> dict:
+    visits = VisitSummary.get_sample_visits()
+    note = VisitSummary(visits).get_text()
+    results = {}
+
+    for prompter_type, prompter_class in PROMPTER_CLASSES.items():
+        prompter = prompter_class()
+        results[f"generate_prompt[{prompter_type}]"] = best_of(lambda: prompter.generate_prompt(note, additional_data="Metformin 500 mg"), repeat, number)
+
+    results["extract_codes"] = best_of(lambda: extract_codes(note), repeat, number)
+    # Uncached; parse_note() returns repeated notes from its cache
+    results["parse_note"] = best_of(lambda: _parse(note), repeat, number)
+    results["VisitSummary.get_text"] = best_of(lambda: VisitSummary(visits).get_text(), repeat, number)
+    answer = "**E&M Services:**\n- 99214: Office visit\n### Referrals\n" * 20
+    results["convert_to_ascii"] = best_of(lambda: AIModel.convert_to_ascii(None, answer), repeat, number)
+    # Construction only; no provider call is made
+    results["ModelOrchestrator[openai,biller]"] = best_of(lambda: ModelOrchestrator('openai', 'biller'), repeat, max(1, number // 10))
+    results["ModelOrchestrator[anthropic,summarizer]"] = best_of(lambda: ModelOrchestrator('anthropic', 'summarizer'), repeat, max(1, number // 10))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for prompt building and orchestration.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--number", type=int, default=1000, help="Calls per timing run")
+    parser.add_argument("--save", help="Save the results as a baseline JSON file")
+    parser.add_argument("--compare", help="Compare against a saved baseline")
+    args = parser.parse_args(argv)
+
+    # Keep the app's log lines out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = run(args.repeat, args.number)
+    report = {"unit": "microseconds per call", "environment": environment(), "results": results}
+    if args.compare:
+        report["comparison"] = compare(results, args.compare)
+    print(json.dumps(report, indent=2))
+    if args.save:
+        save(report, args.save)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Cold-start benchmark for the web workers.
+
+Boots the app with the same gunicorn + UvicornWorker command as the Procfile, but with
+no API keys and with outbound HTTP(S) pointed at a closed local port. Any network I/O at
+import or startup therefore fails. For each run it reports how long each worker takes to
+finish startup and how long until the first request is served.
+
+Usage (from the repository root):
+    python benchmarks/startup_benchmark.py --runs 5 --workers 4 --output startup.json
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+READY_PATH = "/get_visit_note?note_id=visit_1"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def offline_env() -> dict:
+    env = dict(os.environ)
+    for name in ("OPENAI_API_KEY", "ANTHROPIC_API_KEY", "OPENAI_ORG_ID", "OPENAI_BASE_URL", "ANTHROPIC_BASE_URL"):
+        env.pop(name, None)
+    # Port 9 (discard) is closed locally, so any provider call made during boot fails fast
+    env["HTTP_PROXY"] = env["HTTPS_PROXY"] = "http://127.0.0.1:9"
+    env["NO_PROXY"] = ""
+    env["PYTHONPATH"] = str(REPO_ROOT)
+    return env
+
+
+def gunicorn_command(port: int, workers: int) -> list:
+    # Mirrors the Procfile
+    return [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-w", str(workers), "-k", "uvicorn.workers.UvicornWorker",
+            "app.app:app", "--bind", f"127.0.0.1:{port}"]
+
+
+def measure_boot(workers: int, timeout: float) -> dict:
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(gunicorn_command(port, workers), cwd=REPO_ROOT, env=offline_env(),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    worker_ready = []
+
+    def watch_log():
+        for line in server.stderr:
+            if "Application startup complete" in line:
+                worker_ready.append(time.perf_counter() - started)
+
+    threading.Thread(target=watch_log, daemon=True).start()
+    first_request = None
+    # Bypass the proxy variables for our own polling
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"Server exited during startup with code {server.returncode}")
+            try:
+                with opener.open(f"http://127.0.0.1:{port}{READY_PATH}", timeout=1) as response:
+                    if response.status == 200:
+                        first_request = time.perf_counter() - started
+                        break
+            except OSError:
+                time.sleep(0.01)
+        # Give the remaining workers until the timeout to report startup
+        while len(worker_ready) < workers and time.perf_counter() - started < timeout:
+            time.sleep(0.01)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+    if first_request is None:
+        raise RuntimeError(f"No request was served within {timeout} seconds")
+    return {"first_request_seconds": round(first_request, 3), "worker_ready_seconds": [round(t, 3) for t in worker_ready]}
+
+
+def measure_import() -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import app.app"], cwd=REPO_ROOT, env=offline_env(), check=True)
+    return round(time.perf_counter() - started, 3)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure worker cold start without network access.")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    runs = [measure_boot(args.workers, args.timeout) for _ in range(args.runs)]
+    first_requests = [run["first_request_seconds"] for run in runs]
+    report = {
+        "workers": args.workers,
+        "import_seconds": measure_import(),
+        "first_request_seconds": {
+            "min": min(first_requests),
+            "median": round(statistics.median(first_requests), 3),
+            "max": max(first_requests),
+        },
+        "runs": runs,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
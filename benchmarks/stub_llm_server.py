@@ -0,0 +1,170 @@
+"""Local OpenAI/Anthropic-compatible stub server for load tests.
+
+Answers the two endpoints the app uses, with and without streaming:
+    POST /v1/chat/completions   (OpenAI; point OPENAI_BASE_URL at http://host:port/v1)
+    POST /v1/messages           (Anthropic; point ANTHROPIC_BASE_URL at http://host:port)
+
+Every response takes --latency seconds (+/- --jitter as a fraction); streamed responses
+spread that time over the chunks. --error-rate answers that share of requests with a 429
+and a Retry-After header, to exercise the rate limiter.
+
+Usage:
+    python benchmarks/stub_llm_server.py --port 8900 --latency 0.5 --jitter 0.2
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+CODING_ANSWER = (
+    "**E&M Services:**\n"
+    "- 99214: Office or other outpatient visit for an established patient, moderate complexity. "
+    "The note documents a detailed history and a moderate risk medication decision.\n"
+    "**Diagnostic Procedures:**\n"
+    "- 72148: MRI lumbar spine without contrast, ordered for persistent low back pain.\n"
+    "**Referrals:**\n"
+    "- Physical therapy for core strengthening.\n"
+)
+FOLLOWUP_ANSWER = json.dumps([
+    {"followup_details": "Return for annual wellness check", "due_date": "01/01/2025"},
+    {"followup_details": "Routine CBC panel", "due_date": "03/31/2024"},
+    {"followup_details": "Maintain a healthy weight", "due_date": "n/a"},
+])
+
+
+class StubSettings:
+    latency = 0.5
+    jitter = 0.2
+    error_rate = 0.0
+    chunks = 20
+
+
+def response_delay() -> float:
+    return max(0.0, StubSettings.latency * (1 + random.uniform(-StubSettings.jitter, StubSettings.jitter)))
+
+
+def answer_for(messages: list) -> str:
+    system = " ".join(str(message.get("content", "")) for message in messages if message.get("role") == "system")
+    return FOLLOWUP_ANSWER if "followup_details" in system else CODING_ANSWER
+
+
+def split_chunks(text: str, count: int) -> list:
+    size = max(1, len(text) // count)
+    return [text[index:index + size] for index in range(0, len(text), size)]
+
+
+def rate_limited():
+    if StubSettings.error_rate and random.random() < StubSettings.error_rate:
+        return JSONResponse({"error": {"message": "Rate limit reached (stub)", "type": "rate_limit_error"}},
+                            status_code=429, headers={"retry-after": "1"})
+    return None
+
+
+def prompt_tokens(payload: dict) -> int:
+    return len(json.dumps(payload.get("messages", [])) + json.dumps(payload.get("system", ""))) // 4
+
+
+async def chat_completions(request: Request):
+    payload = await request.json()
+    limited = rate_limited()
+    if limited:
+        return limited
+    text = answer_for(payload.get("messages", []))
+    usage = {"prompt_tokens": prompt_tokens(payload), "completion_tokens": len(text) // 4,
+             "total_tokens": prompt_tokens(payload) + len(text) // 4, "prompt_tokens_details": {"cached_tokens": 0}}
+    completion_id, created, model = f"chatcmpl-{uuid.uuid4().hex}", int(time.time()), payload.get("model")
+
+    if not payload.get("stream"):
+        await asyncio.sleep(response_delay())
+        return JSONResponse({
+            "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    async def events():
+        chunks = split_chunks(text, StubSettings.chunks)
+        delay = response_delay() / len(chunks)
+        for chunk in chunks:
+            await asyncio.sleep(delay)
+            yield "data: " + json.dumps({
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}],
+            }) + "\n\n"
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            yield "data: " + json.dumps({
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [], "usage": usage,
+            }) + "\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+async def messages(request: Request):
+    payload = await request.json()
+    limited = rate_limited()
+    if limited:
+        return limited
+    text = CODING_ANSWER
+    input_tokens, output_tokens = prompt_tokens(payload), len(text) // 4
+    message = {
+        "id": f"msg_{uuid.uuid4().hex}", "type": "message", "role": "assistant", "model": payload.get("model"),
+        "content": [{"type": "text", "text": text}], "stop_reason": "end_turn", "stop_sequence": None,
+        "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                  "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0},
+    }
+
+    if not payload.get("stream"):
+        await asyncio.sleep(response_delay())
+        return JSONResponse(message)
+
+    def event(name, data):
+        return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+    async def events():
+        chunks = split_chunks(text, StubSettings.chunks)
+        delay = response_delay() / len(chunks)
+        start = dict(message, content=[], stop_reason=None, usage=dict(message["usage"], output_tokens=1))
+        yield event("message_start", {"type": "message_start", "message": start})
+        yield event("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+        for chunk in chunks:
+            await asyncio.sleep(delay)
+            yield event("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": chunk}})
+        yield event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        yield event("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                      "usage": {"output_tokens": output_tokens}})
+        yield event("message_stop", {"type": "message_stop"})
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+app = Starlette(routes=[
+    Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+    Route("/v1/messages", messages, methods=["POST"]),
+])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OpenAI/Anthropic-compatible stub server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds per response")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Latency variation as a fraction of --latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--chunks", type=int, default=20, help="Chunks per streamed response")
+    args = parser.parse_args(argv)
+    StubSettings.latency, StubSettings.jitter = args.latency, args.jitter
+    StubSettings.error_rate, StubSettings.chunks = args.error_rate, args.chunks
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
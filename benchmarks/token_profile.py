@@ -0,0 +1,65 @@
+"""Token profile of every prompter's prompt.
+
+Builds each persona's prompt for a sample note and breaks it into the components the
+prompter assembles it from (persona, instruction, context, data_format, ..., data). The
+report shows how many tokens are static, i.e. re-sent unchanged on every call, and how many
+come from the note. No provider is called.
+
+Usage (from the repository root):
+    python benchmarks/token_profile.py
+    python benchmarks/token_profile.py --model claude-3-sonnet-20240229 --json
+"""
+import argparse
+import contextlib
+import io
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.model_registry import PROMPTER_CLASSES
+from app.token_accounting import load_encoding, prompt_components, tokenizer_name
+from app.visit_summary import VisitSummary
+
+
+def profile(note: str, model_name: str, additional_data: str = None) -> dict:
+    report = {}
+    for prompter_type, prompter_class in PROMPTER_CLASSES.items():
+        components = prompt_components(prompter_class(), note, additional_data, model_name)
+        static = sum(component.tokens for component in components if component.static)
+        total = sum(component.tokens for component in components)
+        report[prompter_type] = {
+            "total_tokens": total,
+            "static_tokens": static,
+            "static_share": round(static / total, 4) if total else 0.0,
+            "components": {f"{component.prompt}.{component.name}": component.tokens for component in components},
+        }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-component token counts of every prompter's prompt.")
+    parser.add_argument("--model", default="gpt-4-turbo", help="Model whose tokenizer is used")
+    parser.add_argument("--additional-data", default="Metformin 500 mg BID\nLisinopril 10 mg daily")
+    parser.add_argument("--json", action="store_true", help="Print the full report as JSON")
+    args = parser.parse_args(argv)
+
+    note = VisitSummary(VisitSummary.get_sample_visits()).get_text()
+    # Keep the app's log lines out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        load_encoding(args.model)
+        report = profile(note, args.model, args.additional_data)
+    if args.json:
+        print(json.dumps({"tokenizer": tokenizer_name(args.model), "prompters": report}, indent=2))
+        return report
+    print(f"tokenizer: {tokenizer_name(args.model)}")
+    print(f"{'prompter':28} {'total':>7} {'static':>7} {'share':>6}  components")
+    for prompter_type, row in report.items():
+        components = ", ".join(f"{name}={tokens}" for name, tokens in row["components"].items())
+        print(f"{prompter_type:28} {row['total_tokens']:>7} {row['static_tokens']:>7} {row['static_share']:>6.0%}  {components}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
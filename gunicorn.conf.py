@@ -0,0 +1,28 @@
+# gunicorn settings shared by the Procfile and the benchmarks.
+import os
+import tempfile
+
+# Every worker writes its Prometheus metrics to files in this directory and /metrics aggregates
+# them (see app/metrics.py). It has to be set before the workers import prometheus_client.
+if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="clinical_insights_metrics_")
+
+# Background jobs (app/jobs.py) are looked up through whichever worker answers the poll
+if not os.environ.get("JOB_STORE_PATH"):
+    os.environ["JOB_STORE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="clinical_insights_jobs_"), "jobs.db")
+
+from prometheus_client import multiprocess
+
+
+def on_starting(server):
+    # Start from zero instead of adding to the files of a previous run
+    directory = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith(".db"):
+            os.remove(os.path.join(directory, name))
+
+
+def child_exit(server, worker):
+    # Drop the live gauges of a worker that exited; its counters and histograms are kept
+    multiprocess.mark_process_dead(worker.pid)
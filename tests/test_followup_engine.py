@@ -0,0 +1,41 @@
+from app.followup_engine import NO_DUE_DATE, extract_followups, fallback_prompt, parse_interval
+
+NOTE = """
+Date of Visit: 01/01/2024
+Next steps:
+- Return for annual wellness check in 1 year and 3 months.
+- Routine CBC Panel check in 90 days.
+- Take a day off work and rest.
+"""
+
+
+def test_interval_needs_a_followup_verb_or_noun():
+    assert parse_interval("Take a day off work and rest") == "none"
+    assert parse_interval("Rest for two weeks") == "none"
+    assert parse_interval("Follow-up 3 months") == (3, 0)
+    assert parse_interval("Recheck blood pressure in 2 weeks") == (0, 14)
+
+
+def test_advice_with_a_duration_gets_no_due_date():
+    due_dates = {followup.details: followup.due_date for followup in extract_followups(NOTE)}
+    assert due_dates == {
+        "Return for annual wellness check in 1 year and 3 months": "04/01/2025",
+        "Routine CBC Panel check in 90 days": "03/31/2024",
+        "Take a day off work and rest": NO_DUE_DATE,
+    }
+
+
+def test_fallback_prompt_keeps_each_visit_date_for_repeated_items():
+    note = """
+Date of Visit: 01/01/2024
+Next steps:
+- Return in 2-3 weeks.
+Date of Visit: 03/01/2024
+Next steps:
+- Return in 2-3 weeks.
+"""
+    followups = extract_followups(note)
+    assert [followup.resolved for followup in followups] == [False, False]
+    prompt = fallback_prompt(note, followups)
+    assert "Date of Visit: 01/01/2024" in prompt
+    assert "Date of Visit: 03/01/2024" in prompt
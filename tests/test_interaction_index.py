@@ -0,0 +1,18 @@
+from app.interaction_index import format_findings, interaction_index
+from app.prompt_generator import ClinicalDecisionSupportPrompter
+
+
+def test_no_match_adds_no_all_clear_line():
+    medications = "Acetaminophen 500 mg PRN\nVitamin D 1000 IU daily"
+    assert interaction_index.check(medications) == []
+    assert format_findings([]) == ""
+    _, user_prompt = ClinicalDecisionSupportPrompter().generate_prompt("Visit note", medications)
+    assert "Interaction database check" not in user_prompt
+    assert "no known interactions" not in user_prompt.lower()
+
+
+def test_matches_are_listed_with_limited_coverage_note():
+    medications = "Warfarin 5 mg daily\nAspirin 81 mg daily"
+    findings = format_findings(interaction_index.check(medications))
+    assert "warfarin" in findings.lower()
+    assert "limited set of drug pairs" in findings